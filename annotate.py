@@ -0,0 +1,206 @@
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import textwrap
+import time
+
+import stockfish_class as s
+from eval_cache import EvalCache
+from pgn import read_games, san_moves
+from position import Position, START_FEN, MOVE_NONE, move_uci
+
+UCI_RE = re.compile(r"^[a-h][1-8][a-h][1-8][nbrq]?$")
+# Perte de chances de gain (échelle -1..1) à partir de laquelle un coup est signalé,
+# les mêmes seuils que l'analyse de lichess : (seuil, nom, NAG ??, ? et ?!)
+JUDGEMENTS = (
+    (0.3, "blunder", 4),
+    (0.2, "mistake", 2),
+    (0.1, "inaccuracy", 6),
+)
+SEVEN_TAGS = {"Event": "?", "Site": "?", "Date": "????.??.??", "Round": "?",
+              "White": "?", "Black": "?", "Result": "*"}
+
+
+# Chances de gain entre -1 et 1 pour une éval en pions : perdre un pion compte
+# beaucoup à égalité et presque rien quand la partie est déjà jouée ; un mat vaut ±1
+def win_chance(score):
+    return 2 / (1 + math.exp(-0.368208 * score)) - 1
+
+
+# Éval à la manière des commentaires [%eval] : "0.35", "#3", "#-2"
+def pgn_eval(score):
+    mate = s.mate_in(score)
+    if mate is not None:
+        return f"#{mate}"
+    return f"{score:.2f}"
+
+
+# Rejoue une suite de coups (SAN ou UCI, mélangés si on veut) depuis `fen` ; renvoie
+# les FEN des positions traversées (la dernière comprise) et les coups joués en SAN
+# et en UCI. Un coup illégal arrête tout, avec son numéro.
+def replay(moves, fen=START_FEN):
+    position = Position(fen)
+    fens = [position.fen()]
+    plies = []
+    for token in moves:
+        move = position.parse_uci(token) if UCI_RE.match(token) else position.parse_san(token)
+        if move == MOVE_NONE:
+            raise ValueError(f"coup illégal au demi-coup {len(plies) + 1} : {token}")
+        plies.append({"san": position.san(move), "uci": move_uci(move)})
+        position.make_move(move)
+        fens.append(position.fen())
+    return fens, plies
+
+
+# Analyse de toutes les positions, en parallèle sur les moteurs du pool ; celles qui
+# sont déjà dans le cache assez profondément ne repassent pas au moteur
+def evaluate(pool, fens, depth=None, movetime=None, cache=None):
+    results = [cache.get(fen, depth, movetime) if cache is not None else None for fen in fens]
+    todo = [i for i, result in enumerate(results) if result is None]
+    for i, result in zip(todo, pool.map([fens[i] for i in todo], movetime=movetime, depth=depth)):
+        results[i] = result
+        if cache is not None:
+            cache.put(fens[i], result, movetime)
+    return results
+
+
+# Jugement de chaque coup d'après l'éval avant et après (chacune du point de vue du
+# camp au trait) ; le meilleur coup du moteur n'est jamais signalé
+def annotate_game(fens, plies, results):
+    annotations = []
+    for ply, (fen, played) in enumerate(zip(fens, plies)):
+        before, after = results[ply], results[ply + 1]
+        white = fen.split()[1] == "w"
+        entry = dict(played, ply=ply + 1, color="white" if white else "black",
+                     eval=None if after["eval"] is None else after["eval"] if not white else -after["eval"],
+                     depth=after["depth"], loss=None, judgement=None, best=None)
+        if before["eval"] is not None and after["eval"] is not None:
+            loss = win_chance(before["eval"]) - win_chance(-after["eval"])
+            entry["loss"] = round(loss, 3)
+            if played["uci"] != before["bestmove"]:
+                for threshold, name, _ in JUDGEMENTS:
+                    if loss >= threshold:
+                        entry["judgement"] = name
+                        break
+        if entry["judgement"] is not None:
+            position = Position(fen)
+            best = position.parse_uci(before["bestmove"])
+            if best != MOVE_NONE:
+                entry["best"] = position.san(best)
+        annotations.append(entry)
+    return annotations
+
+
+def summary(annotations):
+    counts = {color: {name: 0 for _, name, _ in JUDGEMENTS} for color in ("white", "black")}
+    for entry in annotations:
+        if entry["judgement"] is not None:
+            counts[entry["color"]][entry["judgement"]] += 1
+    return counts
+
+
+# Partie annotée en PGN : symbole et NAG sur les coups signalés, éval après chaque
+# coup en commentaire [%eval], et le coup que le moteur préférait
+def write_pgn(headers, annotations, fen=START_FEN):
+    nags = {name: nag for _, name, nag in JUDGEMENTS}
+    lines = [f'[{tag} "{headers.get(tag, default)}"]' for tag, default in SEVEN_TAGS.items()]
+    lines += [f'[{tag} "{value}"]' for tag, value in headers.items() if tag not in SEVEN_TAGS]
+    lines.append("")
+    position = Position(fen)
+    number = position.game_ply // 2 + 1
+    tokens = []
+    for entry in annotations:
+        if entry["color"] == "white":
+            tokens.append(f"{number}.")
+        elif not tokens:
+            tokens.append(f"{number}...")
+        tokens.append(entry["san"])
+        if entry["judgement"] is not None:
+            tokens.append(f"${nags[entry['judgement']]}")
+        # pas d'éval après un mat, la partie est finie
+        mated = entry["eval"] is None or s.mate_in(entry["eval"]) == 0
+        comment = "" if mated else f"[%eval {pgn_eval(entry['eval'])}]"
+        if entry["best"] is not None:
+            comment += f" Meilleur : {entry['best']}."
+        if comment:
+            tokens.append("{" + comment.strip() + "}")
+        if entry["color"] == "black":
+            number += 1
+    tokens.append(headers.get("Result", "*"))
+    lines += textwrap.wrap(" ".join(tokens), 79, break_long_words=False, break_on_hyphens=False)
+    return "\n".join(lines) + "\n"
+
+
+# Parties à annoter : celles d'un fichier PGN, ou une seule donnée par ses coups
+def read_input(args):
+    if args.moves is not None:
+        headers = {"Event": "Analyse"}
+        if args.fen:
+            headers.update(SetUp="1", FEN=args.fen)
+        yield headers, args.moves.split()
+        return
+    with open(args.pgn, encoding="utf-8", errors="replace") as f:
+        for headers, movetext in read_games(f):
+            yield headers, list(san_moves(movetext))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Annotation de parties par Stockfish, sans interface")
+    parser.add_argument("stockfish", help="chemin du moteur")
+    parser.add_argument("pgn", nargs="?", help="fichier PGN (toutes ses parties sont annotées)")
+    parser.add_argument("--moves", help='coups d\'une partie, SAN ou UCI : "e4 e5 Nf3" ou "e2e4 e7e5"')
+    parser.add_argument("--fen", help="position de départ pour --moves")
+    parser.add_argument("--depth", type=int, default=14)
+    parser.add_argument("--movetime", type=int, help="temps par position (ms) au lieu de la profondeur")
+    parser.add_argument("--engines", type=int, help="nombre de moteurs (par défaut un par coeur)")
+    parser.add_argument("--hash", type=int,
+                        help="Hash de chaque moteur (Mo), 16 par défaut ou celui du profil batch")
+    parser.add_argument("--cache", help="cache d'évaluations à utiliser (eval_cache.sqlite)")
+    parser.add_argument("--json", action="store_true", help="sortie JSON plutôt que PGN")
+    parser.add_argument("--output", help="fichier de sortie (sortie standard sinon)")
+    args = parser.parse_args(argv)
+    if (args.pgn is None) == (args.moves is None):
+        parser.error("donner un fichier PGN ou --moves")
+    depth = None if args.movetime else args.depth
+
+    # réglages mesurés par autotune.py pour les analyses en masse, s'il a été lancé
+    profile = "batch" if os.path.exists(s.PROFILES_PATH) else None
+    pool = s.StockfishPool(args.stockfish, size=args.engines, hash=args.hash, profile=profile)
+    cache = EvalCache(args.cache) if args.cache else None
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    games = []
+    try:
+        for headers, moves in read_input(args):
+            start = time.perf_counter()
+            fen = headers.get("FEN", START_FEN)
+            try:
+                fens, plies = replay(moves, fen)
+            except ValueError as e:
+                print(f"{headers.get('White', '?')} - {headers.get('Black', '?')} : {e}", file=sys.stderr)
+                continue
+            annotations = annotate_game(fens, plies, evaluate(pool, fens, depth, args.movetime, cache))
+            counts = summary(annotations)
+            if args.json:
+                games.append({"headers": headers, "fen": fen, "moves": annotations, "summary": counts})
+            else:
+                out.write(write_pgn(headers, annotations, fen) + "\n")
+            print(f"{headers.get('White', '?')} - {headers.get('Black', '?')} : {len(plies)} demi-coups "
+                  f"en {time.perf_counter() - start:.1f}s, "
+                  + ", ".join(f"{color} {sum(n.values())} erreur(s)" for color, n in counts.items()),
+                  file=sys.stderr)
+        if args.json:
+            json.dump(games, out, indent=2)
+            out.write("\n")
+    finally:
+        pool.close()
+        if cache is not None:
+            cache.close()
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+import stockfish_class as s
+from perft import POSITIONS
+
+FENS = [fen for _, fen, _ in POSITIONS]
+BENCH_RE = re.compile(r"^(Total time \(ms\)|Nodes searched|Nodes/second)\s*:\s*(\d+)", re.M)
+
+
+# "bench" intégré (stockfish/src/benchmark.cpp), lancé en ligne de commande : le
+# moteur s'arrête à la fin et écrit ses totaux sur stderr
+def run_bench(path, threads, hash, depth=13):
+    out = subprocess.run([path, "bench", str(hash), str(threads), str(depth), "default", "depth"],
+                         capture_output=True, text=True)
+    values = dict(BENCH_RE.findall(out.stderr))
+    if "Nodes/second" not in values:
+        raise RuntimeError(f"sortie de bench illisible : {out.stderr[-200:]!r}")
+    return {"bench_nps": int(values["Nodes/second"]), "bench_ms": int(values["Total time (ms)"])}
+
+
+# Temps d'une recherche lancée par `go` : lit la sortie jusqu'au "bestmove" et
+# renvoie (secondes, dernière Info)
+def timed_search(engine, go):
+    start = time.perf_counter()
+    go()
+    last = None
+    for info in engine.info_stream():
+        last = info
+    return time.perf_counter() - start, last
+
+
+# Un moteur seul : nps sur des recherches à nombre de noeuds fixe, et temps moyen
+# pour atteindre `depth` (ce qui compte en interactif). La table de hachage est
+# vidée avant chaque position.
+def measure(path, threads, hash, nodes, depth):
+    engine = s.Stockfish(path, profile={"options": {"Threads": threads, "Hash": hash}})
+    searched, elapsed = 0, 0.0
+    for fen in FENS:
+        engine.new_game()
+        engine.set_position(fen)
+        seconds, last = timed_search(engine, lambda: engine.go_nodes(nodes))
+        elapsed += seconds
+        searched += last.nodes if last is not None and last.nodes else nodes
+    to_depth = 0.0
+    for fen in FENS:
+        engine.new_game()
+        engine.set_position(fen)
+        to_depth += timed_search(engine, lambda: engine.go_depth(depth))[0]
+    engine.quit()
+    return {"nps": int(searched / elapsed), "time_to_depth": to_depth / len(FENS)}
+
+
+# Un pool de `size` moteurs : positions analysées par seconde à profondeur fixe
+# (ce qui compte pour les analyses en masse)
+def measure_pool(path, size, threads, hash, depth):
+    fens = FENS * max(1, (2 * size + len(FENS) - 1) // len(FENS))
+    with s.StockfishPool(path, size=size, threads=threads, hash=hash) as pool:
+        start = time.perf_counter()
+        pool.map(fens, depth=depth)
+        elapsed = time.perf_counter() - start
+    return {"positions_per_second": len(fens) / elapsed}
+
+
+def default_threads(cpus):
+    threads = [1]
+    while threads[-1] * 2 <= cpus:
+        threads.append(threads[-1] * 2)
+    if threads[-1] != cpus:
+        threads.append(cpus)
+    return threads
+
+
+# Essaie les combinaisons Threads/Hash et garde deux profils : "interactive" (un
+# seul moteur, le plus court temps pour atteindre la profondeur) et "batch" (un pool
+# qui se partage les coeurs et `max_hash` Mo, le plus de positions par seconde)
+def autotune(path, threads, hashes, nodes=1000000, depth=16, batch_depth=12, max_hash=2048,
+             bench=True, cpus=None):
+    cpus = cpus or os.cpu_count() or 1
+    measurements = []
+    interactive = None
+    for t in threads:
+        for h in hashes:
+            m = {"threads": t, "hash": h}
+            if bench:
+                m.update(run_bench(path, t, h))
+            m.update(measure(path, t, h, nodes, depth))
+            measurements.append(m)
+            print(f"Threads {t:3d}  Hash {h:6d}  {m['nps']:10d} n/s  "
+                  f"profondeur {depth} en {m['time_to_depth']:.2f}s"
+                  + (f"  bench {m['bench_nps']} n/s" if bench else ""))
+            if interactive is None or (m["time_to_depth"], -m["nps"]) < (
+                    interactive["time_to_depth"], -interactive["nps"]):
+                interactive = m
+
+    batch = None
+    for t in threads:
+        size = max(cpus // t, 1)
+        fitting = [h for h in hashes if h * size <= max_hash] or [min(hashes)]
+        h = max(fitting)
+        m = {"threads": t, "hash": h, "size": size}
+        m.update(measure_pool(path, size, t, h, batch_depth))
+        measurements.append(m)
+        print(f"Pool {size:3d} x Threads {t:3d}  Hash {h:6d}  "
+              f"{m['positions_per_second']:.1f} positions/s à profondeur {batch_depth}")
+        if batch is None or m["positions_per_second"] > batch["positions_per_second"]:
+            batch = m
+
+    return {
+        "interactive": {"options": {"Threads": interactive["threads"], "Hash": interactive["hash"]},
+                        "size": 1, "nps": interactive["nps"],
+                        "time_to_depth": interactive["time_to_depth"]},
+        "batch": {"options": {"Threads": batch["threads"], "Hash": batch["hash"]},
+                  "size": batch["size"], "positions_per_second": batch["positions_per_second"]},
+        "cpus": cpus,
+        "measurements": measurements,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Réglage de Threads/Hash pour cette machine")
+    parser.add_argument("stockfish", help="chemin du moteur")
+    parser.add_argument("--threads", type=int, nargs="+", help="valeurs de Threads à essayer")
+    parser.add_argument("--hash", type=int, nargs="+", default=[16, 64, 256], help="valeurs de Hash (Mo)")
+    parser.add_argument("--nodes", type=int, default=1000000, help="noeuds par recherche pour la mesure de nps")
+    parser.add_argument("--depth", type=int, default=16, help="profondeur visée en interactif")
+    parser.add_argument("--batch-depth", type=int, default=12, help="profondeur des analyses en masse")
+    parser.add_argument("--max-hash", type=int, default=2048, help="mémoire totale (Mo) pour un pool")
+    parser.add_argument("--no-bench", action="store_true", help="ne pas lancer la commande bench")
+    parser.add_argument("--output", default=s.PROFILES_PATH)
+    args = parser.parse_args(argv)
+
+    cpus = os.cpu_count() or 1
+    profiles = autotune(args.stockfish, args.threads or default_threads(cpus), args.hash,
+                        args.nodes, args.depth, args.batch_depth, args.max_hash,
+                        not args.no_bench, cpus)
+    with open(args.output, "w") as f:
+        json.dump(profiles, f, indent=2)
+    for name in ("interactive", "batch"):
+        profile = profiles[name]
+        print(f"{name} : {profile['options']} x {profile['size']} moteur(s)")
+    print("Profils écrits dans", args.output)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
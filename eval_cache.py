@@ -0,0 +1,124 @@
+import collections
+import sqlite3
+import threading
+
+
+# Clé normalisée : la FEN sans les compteurs de coups (les 4 premiers champs),
+# deux positions identiques atteintes à des coups différents partagent leur éval
+def position_key(fen):
+    return " ".join(fen.split()[:4])
+
+
+# Un résultat plus profond (ou calculé plus longtemps) satisfait une demande moins exigeante
+def satisfies(entry, depth=None, movetime=None):
+    if depth is not None and entry["depth"] >= depth:
+        return True
+    if movetime is not None and entry["movetime"] >= movetime:
+        return True
+    return False
+
+
+# Cache d'évaluations à deux niveaux : un LRU en mémoire borné à `max_memory`
+# positions, devant une base SQLite qui survit aux sessions.
+class EvalCache:
+    def __init__(self, path="eval_cache.sqlite", max_memory=100000, commit_every=100, metrics=None):
+        self.max_memory = max_memory
+        self.metrics = metrics
+        self.commit_every = commit_every
+        self.memory = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS evals ("
+                "key TEXT PRIMARY KEY, depth INTEGER, movetime INTEGER, eval REAL, bestmove TEXT)"
+            )
+
+    def _remember(self, key, entry):
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.max_memory:
+            self.memory.popitem(last=False)
+
+    def _lookup(self, key):
+        entry = self.memory.get(key)
+        if entry is not None:
+            self.memory.move_to_end(key)
+            return entry
+        if self.db is None:
+            return None
+        row = self.db.execute(
+            "SELECT depth, movetime, eval, bestmove FROM evals WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        entry = {"depth": row[0], "movetime": row[1], "eval": row[2], "bestmove": row[3]}
+        self._remember(key, entry)
+        return entry
+
+    def get(self, fen, depth=None, movetime=None):
+        key = position_key(fen)
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None and satisfies(entry, depth, movetime):
+                self.hits += 1
+                if self.metrics is not None:
+                    self.metrics.count("cache_hits")
+                return dict(entry, fen=fen)
+            self.misses += 1
+            if self.metrics is not None:
+                self.metrics.count("cache_misses")
+            return None
+
+    # Enregistre le résultat d'une analyse ({"eval", "depth", "bestmove"}) ;
+    # une entrée existante plus profonde n'est jamais écrasée.
+    def put(self, fen, result, movetime=None):
+        key = position_key(fen)
+        entry = {
+            "depth": result["depth"],
+            "movetime": movetime or 0,
+            "eval": result["eval"],
+            "bestmove": result["bestmove"],
+        }
+        with self._lock:
+            old = self._lookup(key)
+            if old is not None and old["depth"] >= entry["depth"] and old["movetime"] >= entry["movetime"]:
+                return
+            self._remember(key, entry)
+            if self.db is not None:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO evals VALUES (?, ?, ?, ?, ?)",
+                    (key, entry["depth"], entry["movetime"], entry["eval"], entry["bestmove"]),
+                )
+                self._pending += 1
+                if self._pending >= self.commit_every:
+                    self.db.commit()
+                    self._pending = 0
+
+    # Éval d'une position en passant par le cache : le moteur n'est interrogé
+    # que si aucun résultat assez profond n'est connu
+    def get_eval(self, engine, fen, depth=None, movetime=None):
+        cached = self.get(fen, depth, movetime)
+        if cached is not None:
+            return cached
+        result = engine.analyse(fen, movetime=movetime, depth=depth)
+        self.put(fen, result, movetime)
+        return result
+
+    def flush(self):
+        with self._lock:
+            if self.db is not None:
+                self.db.commit()
+                self._pending = 0
+
+    def close(self):
+        self.flush()
+        if self.db is not None:
+            self.db.close()
+            self.db = None
@@ -0,0 +1,316 @@
+# Encodage par lots de positions en tableaux NumPy : 12 plans de 64 cases par
+# position, puis matériel, tables pièce-case, mobilité et sécurité du roi calculés
+# d'un coup pour tout le lot, sans boucle Python par position ni par case.
+import argparse
+import collections
+import sys
+import time
+
+import numpy as np
+
+from pgn import read_games, san_moves
+from position import (WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, SQ_NONE,
+                      MOVE_NONE, FEN_PIECES, START_FEN, Position, make_piece, parse_square)
+
+# plans 0-5 : pion, cavalier, fou, tour, dame, roi blancs ; 6-11 : les noirs
+PLANE_PIECES = np.array([make_piece(c, t) for c in (WHITE, BLACK)
+                         for t in (PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING)], dtype=np.uint8)
+
+# caractère de FEN -> code de pièce (position.py), "." pour une case vide
+_FEN_CODES = np.zeros(256, dtype=np.uint8)
+for _code, _ch in enumerate(FEN_PIECES):
+    if _ch != " ":
+        _FEN_CODES[ord(_ch)] = _code
+_FEN_EXPAND = str.maketrans({**{str(n): "." * n for n in range(1, 9)}, "/": ""})
+
+# Valeurs des pièces de stockfish/src/types.h (PawnValue ... QueenValue)
+PIECE_VALUES = np.array([208, 781, 825, 1276, 2538, 0], dtype=np.int32)
+
+# Tables pièce-case en centipions, du point de vue des blancs, huitième rangée en
+# haut comme on lit un échiquier (les « simplified evaluation function » classiques)
+_PST_TEXT = {
+    PAWN: """
+         0   0   0   0   0   0   0   0
+        50  50  50  50  50  50  50  50
+        10  10  20  30  30  20  10  10
+         5   5  10  25  25  10   5   5
+         0   0   0  20  20   0   0   0
+         5  -5 -10   0   0 -10  -5   5
+         5  10  10 -20 -20  10  10   5
+         0   0   0   0   0   0   0   0""",
+    KNIGHT: """
+       -50 -40 -30 -30 -30 -30 -40 -50
+       -40 -20   0   0   0   0 -20 -40
+       -30   0  10  15  15  10   0 -30
+       -30   5  15  20  20  15   5 -30
+       -30   0  15  20  20  15   0 -30
+       -30   5  10  15  15  10   5 -30
+       -40 -20   0   5   5   0 -20 -40
+       -50 -40 -30 -30 -30 -30 -40 -50""",
+    BISHOP: """
+       -20 -10 -10 -10 -10 -10 -10 -20
+       -10   0   0   0   0   0   0 -10
+       -10   0   5  10  10   5   0 -10
+       -10   5   5  10  10   5   5 -10
+       -10   0  10  10  10  10   0 -10
+       -10  10  10  10  10  10  10 -10
+       -10   5   0   0   0   0   5 -10
+       -20 -10 -10 -10 -10 -10 -10 -20""",
+    ROOK: """
+         0   0   0   0   0   0   0   0
+         5  10  10  10  10  10  10   5
+        -5   0   0   0   0   0   0  -5
+        -5   0   0   0   0   0   0  -5
+        -5   0   0   0   0   0   0  -5
+        -5   0   0   0   0   0   0  -5
+        -5   0   0   0   0   0   0  -5
+         0   0   0   5   5   0   0   0""",
+    QUEEN: """
+       -20 -10 -10  -5  -5 -10 -10 -20
+       -10   0   0   0   0   0   0 -10
+       -10   0   5   5   5   5   0 -10
+        -5   0   5   5   5   5   0  -5
+         0   0   5   5   5   5   0  -5
+       -10   5   5   5   5   5   0 -10
+       -10   0   5   0   0   0   0 -10
+       -20 -10 -10  -5  -5 -10 -10 -20""",
+    KING: """
+       -30 -40 -40 -50 -50 -40 -40 -30
+       -30 -40 -40 -50 -50 -40 -40 -30
+       -30 -40 -40 -50 -50 -40 -40 -30
+       -30 -40 -40 -50 -50 -40 -40 -30
+       -20 -30 -30 -40 -40 -30 -30 -20
+       -10 -20 -20 -20 -20 -20 -20 -10
+        20  20   0   0   0   0  20  20
+        20  30  10   0   0  10  30  20""",
+}
+
+
+def _pst_table():
+    white = np.array([np.array(_PST_TEXT[t].split(), dtype=np.int32).reshape(8, 8)[::-1].ravel()
+                      for t in (PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING)])
+    # une pièce noire sur sq vaut (en négatif) la pièce blanche sur la case symétrique sq ^ 56
+    black = -white.reshape(6, 8, 8)[:, ::-1, :].reshape(6, 64)
+    return np.concatenate([white, black])
+
+
+PST = _pst_table()  # (12, 64), signé : positif pour les blancs
+
+KNIGHT_STEPS = ((2, 1), (1, 2), (-1, 2), (-2, 1), (-2, -1), (-1, -2), (1, -2), (2, -1))
+KING_STEPS = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1))
+BISHOP_DIRECTIONS = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+ROOK_DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+# board : codes de pièce (N, 64) ; side : camp au trait (N,) ; castling : droits
+# KQkq (N, 4) ; ep : case de prise en passant ou SQ_NONE (N,)
+Batch = collections.namedtuple("Batch", "board side castling ep")
+
+
+# Lot depuis des FEN : le placement des pièces est développé en 64 caractères par
+# FEN, puis tout le lot est converti en une seule opération
+def encode_fens(fens):
+    boards, side, castling, ep = [], [], [], []
+    for fen in fens:
+        fields = fen.split()
+        boards.append(fields[0].translate(_FEN_EXPAND))
+        side.append(fields[1] == "b" if len(fields) > 1 else False)
+        rights = fields[2] if len(fields) > 2 else "-"
+        castling.append([ch in rights for ch in "KQkq"])
+        ep.append(parse_square(fields[3]) if len(fields) > 3 and fields[3] != "-" else SQ_NONE)
+    data = "".join(boards).encode("ascii")
+    if len(data) != 64 * len(boards):
+        raise ValueError("placement des pièces invalide dans une FEN")
+    # dans une FEN, la huitième rangée vient en premier
+    board = _FEN_CODES[np.frombuffer(data, dtype=np.uint8)].reshape(-1, 8, 8)[:, ::-1, :]
+    return Batch(np.ascontiguousarray(board).reshape(-1, 64), np.array(side, dtype=np.uint8),
+                 np.array(castling, dtype=bool).reshape(-1, 4), np.array(ep, dtype=np.uint8))
+
+
+# Lot depuis des Position (ou des Snapshot) : leur tableau board est déjà dans le
+# bon ordre
+def encode_positions(positions):
+    positions = list(positions)
+    board = np.frombuffer(b"".join(bytes(p.board) for p in positions), dtype=np.uint8)
+    rights = np.array([p.castling_rights for p in positions], dtype=np.uint8)
+    return Batch(board.reshape(-1, 64),
+                 np.array([p.side_to_move for p in positions], dtype=np.uint8),
+                 (rights[:, None] >> np.arange(4, dtype=np.uint8) & 1).astype(bool),
+                 np.array([p.ep_square for p in positions], dtype=np.uint8))
+
+
+# Plans (N, 12, 64) : vrai si la pièce du plan est sur la case
+def planes(batch):
+    return batch.board[:, None, :] == PLANE_PIECES[None, :, None]
+
+
+# Nombre de pièces de chaque plan (N, 12) et différence de matériel blancs - noirs
+# (N,) en unités internes de Stockfish
+def material(batch):
+    counts = planes(batch).sum(axis=2, dtype=np.int32)
+    return counts, counts[:, :6] @ PIECE_VALUES - counts[:, 6:] @ PIECE_VALUES
+
+
+# Somme des tables pièce-case (N,), positive si elle favorise les blancs
+def piece_square(batch, table=PST):
+    return np.einsum("npq,pq->n", planes(batch), table)
+
+
+# Plateaux (N, 8, 8) décalés de dr rangées et df colonnes, ce qui sort est perdu
+def _shift(boards, dr, df):
+    out = np.zeros_like(boards)
+    out[:, max(dr, 0):8 + min(dr, 0), max(df, 0):8 + min(df, 0)] = \
+        boards[:, max(-dr, 0):8 + min(-dr, 0), max(-df, 0):8 + min(-df, 0)]
+    return out
+
+
+def _steps(boards, steps):
+    return sum(_shift(boards, dr, df) for dr, df in steps)
+
+
+# Rayons des pièces glissantes : chaque rayon avance d'une case par tour et s'arrête
+# après la première case occupée, qui est attaquée (défendue si c'est une pièce amie)
+def _slides(boards, empty, directions):
+    attacks = np.zeros_like(boards)
+    for dr, df in directions:
+        ray = boards
+        for _ in range(7):
+            ray = _shift(ray, dr, df)
+            attacks += ray
+            ray = ray * empty
+            if not ray.any():
+                break
+    return attacks
+
+
+# Attaques d'un camp, en nombre d'attaquants par case : (pions et roi, autres pièces),
+# deux tableaux (N, 8, 8)
+def _attacks(board, color):
+    def plane(piece_type):
+        return (board == make_piece(color, piece_type)).astype(np.int16)
+
+    empty = (board == 0).astype(np.int16)
+    forward = 1 if color == WHITE else -1
+    near = _steps(plane(PAWN), ((forward, -1), (forward, 1))) + _steps(plane(KING), KING_STEPS)
+    far = (_steps(plane(KNIGHT), KNIGHT_STEPS)
+           + _slides(plane(BISHOP) + plane(QUEEN), empty, BISHOP_DIRECTIONS)
+           + _slides(plane(ROOK) + plane(QUEEN), empty, ROOK_DIRECTIONS))
+    return near, far
+
+
+# Toutes les caractéristiques d'un lot, calculées une seule fois :
+#   counts, material, psq : voir material() et piece_square()
+#   attacks  (N, 2, 64) : nombre d'attaquants de chaque case, par camp
+#   mobility (N, 2) : cases atteintes par cavaliers, fous, tours et dames, hors
+#                     cases occupées par leur camp (une case compte une fois par pièce)
+#   king_zone (N, 2, 64) : masque du roi et des cases qui l'entourent
+#   king_attacks (N, 2) : attaques adverses sur la zone du roi
+#   pawn_shield (N, 2) : pions amis dans la zone du roi
+def features(batch):
+    board = batch.board.reshape(-1, 8, 8)
+    counts, score = material(batch)
+    own = [(board >= make_piece(c, PAWN)) & (board <= make_piece(c, KING)) for c in (WHITE, BLACK)]
+    near, far = zip(*(_attacks(board, c) for c in (WHITE, BLACK)))
+    zones, king_attacks, shields = [], [], []
+    for c in (WHITE, BLACK):
+        king = (board == make_piece(c, KING)).astype(np.int16)
+        zone = (king + _steps(king, KING_STEPS)) > 0
+        zones.append(zone)
+        enemy = near[c ^ 1] + far[c ^ 1]
+        king_attacks.append((enemy * zone).sum(axis=(1, 2)))
+        shields.append((zone & (board == make_piece(c, PAWN))).sum(axis=(1, 2)))
+    return {
+        "counts": counts,
+        "material": score,
+        "psq": piece_square(batch),
+        "attacks": np.stack([near[c] + far[c] for c in (WHITE, BLACK)], axis=1).reshape(-1, 2, 64),
+        "mobility": np.stack([(far[c] * ~own[c]).sum(axis=(1, 2)) for c in (WHITE, BLACK)], axis=1),
+        "king_zone": np.stack(zones, axis=1).reshape(-1, 2, 64),
+        "king_attacks": np.stack(king_attacks, axis=1),
+        "pawn_shield": np.stack(shields, axis=1),
+    }
+
+
+# Ce qu'encode_positions lit d'une Position, figé à un demi-coup (la Position,
+# elle, continue la partie)
+Snapshot = collections.namedtuple("Snapshot", "board side_to_move castling_rights ep_square")
+
+
+def snapshot(position):
+    return Snapshot(bytes(position.board), position.side_to_move, position.castling_rights,
+                    position.ep_square)
+
+
+# (clé de Zobrist, Snapshot) des positions des `max_ply` premiers demi-coups des
+# parties d'un fichier PGN, sans passer par une FEN
+def pgn_positions(path, max_ply=40):
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for headers, movetext in read_games(f):
+            position = Position(headers.get("FEN", START_FEN))
+            yield position.key(), snapshot(position)
+            for ply, san in enumerate(san_moves(movetext)):
+                if ply >= max_ply:
+                    break
+                move = position.parse_san(san)
+                if move == MOVE_NONE:
+                    break
+                position.make_move(move)
+                yield position.key(), snapshot(position)
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Caractéristiques NumPy de positions (.npz)")
+    parser.add_argument("output", help="fichier .npz à écrire")
+    parser.add_argument("--pgn", nargs="*", default=[], help="parties dont on prend les positions")
+    parser.add_argument("--fens", help="fichier texte, une FEN par ligne")
+    parser.add_argument("--plies", type=int, default=40, help="demi-coups pris par partie")
+    parser.add_argument("--batch", type=int, default=65536, help="positions par lot")
+    args = parser.parse_args(argv)
+
+    results = collections.defaultdict(list)
+    keys = []
+    total = 0
+    elapsed = 0.0
+
+    def add(batch):
+        nonlocal total, elapsed
+        start = time.perf_counter()
+        values = features(batch)
+        elapsed += time.perf_counter() - start
+        # plans compressés à un bit par case : 96 octets par position
+        results["planes"].append(np.packbits(planes(batch), axis=2))
+        for name in ("side", "castling", "ep"):
+            results[name].append(getattr(batch, name))
+        for name in ("counts", "material", "psq", "mobility", "king_attacks", "pawn_shield"):
+            results[name].append(values[name])
+        total += len(batch.side)
+
+    for path in args.pgn:
+        for pairs in _batches(pgn_positions(path, args.plies), args.batch):
+            keys.extend(key for key, _ in pairs)
+            add(encode_positions(position for _, position in pairs))
+    if args.fens:
+        with open(args.fens) as f:
+            for fens in _batches((line.strip() for line in f if line.strip()), args.batch):
+                keys.extend(Position(fen).key() for fen in fens)
+                add(encode_fens(fens))
+    if not total:
+        parser.error("aucune position (--pgn ou --fens)")
+    np.savez_compressed(args.output, keys=np.array(keys, dtype=np.uint64),
+                        **{name: np.concatenate(parts) for name, parts in results.items()})
+    print(f"{args.output} : {total} positions, caractéristiques en {elapsed:.2f}s "
+          f"({total / max(elapsed, 1e-9) * 60:.0f} positions/min)")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
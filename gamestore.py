@@ -0,0 +1,261 @@
+import argparse
+import heapq
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+
+from pgn import RESULTS, read_games, san_moves
+from position import WHITE, Position, START_FEN, MOVE_NONE, move_uci, game_status
+
+# Une base de parties, trois fichiers à côté les uns des autres :
+#   <nom>.games : les parties à la suite ; pour chacune, un en-tête (demi-coups,
+#                 résultat, longueur de la FEN de départ, 0 pour la position initiale),
+#                 la FEN éventuelle, puis un entier 16 bits par coup, le Move de
+#                 Stockfish (types.h) tel que l'utilise position.py
+#   <nom>.idx   : début de chaque partie dans .games (8 octets), l'indice est l'identifiant
+#   <nom>.pos   : couples (clé de Zobrist, identifiant) triés, pour retrouver les parties
+#                 qui passent par une position par dichotomie, comme un livre Polyglot
+RECORD = struct.Struct("<HBB")
+OFFSET = struct.Struct("<Q")
+POS_ENTRY = struct.Struct("<QI")
+NO_RESULT = 3
+RESULT_NAMES = {value: name for name, value in RESULTS.items()}
+
+
+def store_paths(path):
+    return path + ".games", path + ".idx", path + ".pos"
+
+
+def _map(f):
+    size = os.fstat(f.fileno()).st_size
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b"", size
+
+
+# Lecture par mmap : rien n'est chargé en mémoire, une partie est lue à la demande
+# et la recherche d'une position est une dichotomie dans .pos
+class GameStore:
+    def __init__(self, path):
+        self.path = path
+        self._files = [open(name, "rb") for name in store_paths(path)]
+        (self._games, _), (self._index, index_size), (self._positions, pos_size) = \
+            [_map(f) for f in self._files]
+        self._size = index_size // OFFSET.size
+        self._pos_size = pos_size // POS_ENTRY.size
+
+    def __len__(self):
+        return self._size
+
+    # (résultat "1-0" / "1/2-1/2" / "0-1" / "*", FEN de départ, coups 16 bits)
+    def game(self, game_id):
+        if not 0 <= game_id < self._size:
+            raise IndexError(game_id)
+        offset = OFFSET.unpack_from(self._index, game_id * OFFSET.size)[0]
+        plies, result, fen_length = RECORD.unpack_from(self._games, offset)
+        offset += RECORD.size
+        fen = bytes(self._games[offset:offset + fen_length]).decode() if fen_length else START_FEN
+        offset += fen_length
+        moves = list(struct.unpack_from(f"<{plies}H", self._games, offset))
+        return RESULT_NAMES.get(result, "*"), fen, moves
+
+    def moves_uci(self, game_id):
+        return [move_uci(move) for move in self.game(game_id)[2]]
+
+    def __iter__(self):
+        for game_id in range(self._size):
+            yield self.game(game_id)
+
+    # premier indice de .pos dont la clé est >= key
+    def _lower_bound(self, key):
+        lo, hi = 0, self._pos_size
+        unpack = POS_ENTRY.unpack_from
+        data = self._positions
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if unpack(data, mid * POS_ENTRY.size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    # Identifiants des parties qui passent par une position (Position ou clé de
+    # Zobrist), dans l'ordre ; seuls les demi-coups indexés à l'écriture comptent
+    def games_with(self, position, limit=None):
+        key = position.key() if isinstance(position, Position) else position
+        result = []
+        i = self._lower_bound(key)
+        while i < self._pos_size and (limit is None or len(result) < limit):
+            k, game_id = POS_ENTRY.unpack_from(self._positions, i * POS_ENTRY.size)
+            if k != key:
+                break
+            result.append(game_id)
+            i += 1
+        return result
+
+    def close(self):
+        for data in (self._games, self._index, self._positions):
+            if isinstance(data, mmap.mmap):
+                data.close()
+        for f in self._files:
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Écriture : les parties s'ajoutent à la fin d'une base existante. Les couples
+# (clé, partie) des `max_ply` premiers demi-coups sont triés par paquets de `run_size`
+# dans des fichiers temporaires, puis fusionnés avec l'ancien .pos à la fermeture :
+# la mémoire ne dépend pas du nombre de parties.
+class GameWriter:
+    def __init__(self, path, max_ply=20, run_size=1 << 21):
+        self.path = path
+        self.max_ply = max_ply
+        self.run_size = run_size
+        games_path, index_path, _ = store_paths(path)
+        self._games = open(games_path, "ab")
+        self._index = open(index_path, "ab")
+        self._offset = self._games.tell()
+        self.count = self._index.tell() // OFFSET.size
+        self._pairs = []  # clé << 32 | partie, un seul entier se trie plus vite qu'un tuple
+        self._runs = []
+
+    # Ajoute une partie (coups 16 bits ou UCI) ; renvoie son identifiant
+    def add(self, moves, result=None, fen=START_FEN):
+        position = Position(fen)
+        game_id = self.count
+        keys = {position.key()}
+        encoded = []
+        for ply, move in enumerate(moves):
+            if isinstance(move, str):
+                move = position.parse_uci(move)
+                if move == MOVE_NONE:
+                    raise ValueError(f"coup illégal au demi-coup {ply + 1}")
+            encoded.append(move)
+            position.make_move(move)
+            if ply < self.max_ply:
+                keys.add(position.key())
+        fen_bytes = b"" if fen == START_FEN else fen.encode()
+        record = RECORD.pack(len(encoded), RESULTS.get(result, NO_RESULT), len(fen_bytes))
+        record += fen_bytes + struct.pack(f"<{len(encoded)}H", *encoded)
+        self._games.write(record)
+        self._index.write(OFFSET.pack(self._offset))
+        self._offset += len(record)
+        self.count += 1
+        self._pairs.extend(key << 32 | game_id for key in keys)
+        if len(self._pairs) >= self.run_size:
+            self._write_run()
+        return game_id
+
+    def _write_run(self):
+        self._pairs.sort()
+        f = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(self.path)))
+        f.write(b"".join(POS_ENTRY.pack(pair >> 32, pair & 0xFFFFFFFF) for pair in self._pairs))
+        f.seek(0)
+        self._runs.append(f)
+        self._pairs = []
+
+    def close(self):
+        self._games.close()
+        self._index.close()
+        self._write_run()
+        _, _, pos_path = store_paths(self.path)
+        runs = list(self._runs)
+        if os.path.exists(pos_path):
+            runs.append(open(pos_path, "rb"))
+        tmp_path = pos_path + ".tmp"
+        with open(tmp_path, "wb") as out:
+            buffer = []
+            for key, game_id in heapq.merge(*(_read_run(f) for f in runs)):
+                buffer.append(POS_ENTRY.pack(key, game_id))
+                if len(buffer) >= 65536:
+                    out.write(b"".join(buffer))
+                    buffer = []
+            out.write(b"".join(buffer))
+        for f in runs:
+            f.close()
+        os.replace(tmp_path, pos_path)
+        self._runs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _read_run(f, chunk=POS_ENTRY.size << 16):
+    while True:
+        data = f.read(chunk)
+        if not data:
+            return
+        yield from POS_ENTRY.iter_unpack(data)
+
+
+# Résultat PGN d'une partie arrêtée dans `position`
+def game_result(position):
+    status = game_status(position)
+    if status.checkmate:
+        return "0-1" if position.side_to_move == WHITE else "1-0"
+    return "1/2-1/2" if status.draw else "*"
+
+
+# Ajoute les parties d'un fichier PGN ; une partie illisible s'arrête au dernier coup lu
+def add_pgn(writer, path):
+    games = 0
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for headers, movetext in read_games(f):
+            fen = headers.get("FEN", START_FEN)
+            position = Position(fen)
+            moves = []
+            for san in san_moves(movetext):
+                move = position.parse_san(san)
+                if move == MOVE_NONE:
+                    break
+                moves.append(move)
+                position.make_move(move)
+            writer.add(moves, headers.get("Result"), fen)
+            games += 1
+    return games
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Base de parties compacte indexée par position")
+    parser.add_argument("store", help="nom de la base (fichiers .games, .idx et .pos)")
+    parser.add_argument("--add", nargs="+", default=[], help="fichiers PGN à ajouter")
+    parser.add_argument("--plies", type=int, default=20, help="demi-coups indexés par partie")
+    parser.add_argument("--fen", help="position à chercher")
+    parser.add_argument("--moves", help="ou coups UCI depuis la position initiale")
+    parser.add_argument("--limit", type=int, default=20, help="parties affichées au plus")
+    args = parser.parse_args(argv)
+
+    if args.add:
+        with GameWriter(args.store, args.plies) as writer:
+            for path in args.add:
+                start = time.perf_counter()
+                games = add_pgn(writer, path)
+                print(f"{path} : {games} parties en {time.perf_counter() - start:.1f}s")
+        sizes = sum(os.path.getsize(name) for name in store_paths(args.store))
+        print(f"{args.store} : {writer.count} parties, {sizes / (1 << 20):.1f} Mo")
+
+    if args.fen or args.moves:
+        position = Position(args.fen or START_FEN)
+        for uci in (args.moves or "").split():
+            position.make_move(position.parse_uci(uci))
+        with GameStore(args.store) as store:
+            start = time.perf_counter()
+            found = store.games_with(position)
+            elapsed = time.perf_counter() - start
+            print(f"{len(found)} parties en {elapsed * 1000:.2f} ms")
+            for game_id in found[:args.limit]:
+                result, _, moves = store.game(game_id)
+                print(game_id, result, " ".join(move_uci(move) for move in moves[:16]))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+import contextlib
+import json
+import math
+import threading
+import time
+
+# Bornes des histogrammes de durée (secondes), comme les valeurs par défaut des
+# clients Prometheus, un peu étendues vers les recherches longues
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+NPS_BUCKETS = (1e4, 3e4, 1e5, 3e5, 1e6, 3e6, 1e7, 3e7, 1e8)
+
+
+class Histogram:
+    def __init__(self, buckets=SECONDS_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # dernier : au-delà de la plus grande borne
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    # Quantile estimé par la borne supérieure de la classe qui le contient
+    def quantile(self, q):
+        if not self.count:
+            return None
+        seen = 0
+        for bound, n in zip(self.buckets + (self.max,), self.counts):
+            seen += n
+            if seen >= q * self.count:
+                return min(bound, self.max)
+        return self.max
+
+    def cumulative(self):
+        total = 0
+        for bound, n in zip(self.buckets + (math.inf,), self.counts):
+            total += n
+            yield bound, total
+
+    def summary(self):
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count, "sum": self.sum, "min": self.min, "max": self.max,
+            "mean": self.sum / self.count,
+            "p50": self.quantile(0.5), "p90": self.quantile(0.9), "p99": self.quantile(0.99),
+            "buckets": {("+Inf" if math.isinf(b) else str(b)): n for b, n in self.cumulative()},
+        }
+
+
+# Compteurs, jauges et histogrammes partagés par les moteurs, le pool et le cache
+# (paramètre `metrics` de chacun) ; sans Metrics, rien n'est mesuré.
+class Metrics:
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def set(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name, value, buckets=SECONDS_BUCKETS):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(buckets)
+            histogram.observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "histograms": {name: h.summary() for name, h in self.histograms.items()},
+            }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    # Format texte d'exposition de Prometheus
+    def to_prometheus(self, prefix="chess_"):
+        lines = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {prefix}{name}_total counter")
+                lines.append(f"{prefix}{name}_total {value}")
+            for name, value in sorted(self.gauges.items()):
+                lines.append(f"# TYPE {prefix}{name} gauge")
+                lines.append(f"{prefix}{name} {value}")
+            for name, h in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {prefix}{name} histogram")
+                for bound, total in h.cumulative():
+                    le = "+Inf" if math.isinf(bound) else repr(float(bound))
+                    lines.append(f'{prefix}{name}_bucket{{le="{le}"}} {total}')
+                lines.append(f"{prefix}{name}_sum {h.sum}")
+                lines.append(f"{prefix}{name}_count {h.count}")
+        return "\n".join(lines) + "\n"
+
+    # Écrit les mesures : format Prometheus pour un fichier .prom, JSON sinon
+    def dump(self, path):
+        text = self.to_prometheus() if path.endswith(".prom") else self.to_json()
+        with open(path, "w") as f:
+            f.write(text)
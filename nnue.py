@@ -0,0 +1,405 @@
+# Évaluation statique NNUE de Stockfish en NumPy, sans lancer le moteur : lecture des
+# fichiers .nnue (stockfish/src/nnue/network.cpp), caractéristiques HalfKAv2_hm,
+# accumulateurs mis à jour coup par coup (nnue_accumulator.cpp) et couches en
+# arithmétique entière, pour retrouver exactement la sortie de la commande "eval".
+import argparse
+import struct
+import sys
+import time
+
+import numpy as np
+
+from position import (WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, NO_PIECE,
+                      Position, START_FEN, make_piece)
+
+VERSION = 0x7AF32F20
+LEB128_MAGIC = b"COMPRESSED_LEB128"
+OUTPUT_SCALE = 16
+WEIGHT_SCALE_BITS = 6
+PSQT_BUCKETS = 8
+LAYER_STACKS = 8
+L2, L3 = 15, 32
+# dimensions de la couche transformée des deux réseaux (nnue_architecture.h)
+BIG_L1, SMALL_L1 = 3072, 128
+
+# --- HalfKAv2_hm (features/half_ka_v2_hm.h) ---
+PS_NB = 11 * 64
+DIMENSIONS = 64 * PS_NB // 2
+FEATURE_HASH = 0x7F234CB8
+
+
+def _piece_square_index():
+    table = np.zeros((2, 16), dtype=np.int32)
+    for perspective in (WHITE, BLACK):
+        for color in (WHITE, BLACK):
+            for i, piece_type in enumerate((PAWN, KNIGHT, BISHOP, ROOK, QUEEN)):
+                # pièces amies aux indices pairs, adverses aux impairs
+                table[perspective, make_piece(color, piece_type)] = (2 * i + (color != perspective)) * 64
+            table[perspective, make_piece(color, KING)] = 10 * 64
+    return table
+
+
+def _king_buckets():
+    half = np.array([[28, 29, 30, 31], [24, 25, 26, 27], [20, 21, 22, 23], [16, 17, 18, 19],
+                     [12, 13, 14, 15], [8, 9, 10, 11], [4, 5, 6, 7], [0, 1, 2, 3]])
+    white = np.concatenate([half, half[:, ::-1]], axis=1).ravel()  # rangée 1 d'abord
+    return np.stack([white, white.reshape(8, 8)[::-1].ravel()]) * PS_NB
+
+
+PIECE_SQUARE_INDEX = _piece_square_index()
+KING_BUCKETS = _king_buckets()
+# le roi est ramené sur l'aile dame : symétrie verticale s'il est sur les colonnes a-d,
+# et symétrie horizontale pour les noirs (OrientTBL)
+ORIENT = np.array([[7 if sq % 8 < 4 else 0 for sq in range(64)],
+                   [63 if sq % 8 < 4 else 56 for sq in range(64)]], dtype=np.int32)
+
+# PieceValue de types.h, par code de pièce
+PIECE_VALUES = np.zeros(16, dtype=np.int64)
+for _color in (WHITE, BLACK):
+    for _piece_type, _value in ((PAWN, 208), (KNIGHT, 781), (BISHOP, 825), (ROOK, 1276), (QUEEN, 2538)):
+        PIECE_VALUES[make_piece(_color, _piece_type)] = _value
+VALUE_TB_WIN_IN_MAX_PLY = 32000 - 246 - 1 - 246
+
+
+def feature_index(perspective, sq, piece, ksq):
+    return (sq ^ ORIENT[perspective, ksq]) + PIECE_SQUARE_INDEX[perspective, piece] \
+        + KING_BUCKETS[perspective, ksq]
+
+
+# Division entière du C++ (troncature vers zéro), sur des tableaux
+def _cdiv(a, b):
+    q = np.abs(a) // abs(b)
+    return np.where((a < 0) != (b < 0), -q, q)
+
+
+def _affine_hash(prev, outputs):
+    h = (0xCC03DAE4 + outputs) & 0xFFFFFFFF
+    return h ^ (prev >> 1) ^ ((prev << 31) & 0xFFFFFFFF)
+
+
+def _relu_hash(prev):
+    return (0x538D24C7 + prev) & 0xFFFFFFFF
+
+
+def architecture_hash(l1):
+    h = 0xEC42E90D ^ (l1 * 2)
+    for outputs in (L2 + 1, L3, 1):
+        h = _affine_hash(h, outputs)
+        if outputs != 1:
+            h = _relu_hash(h)
+    return h
+
+
+# Entiers signés compressés en LEB128 (read_leb_128 de nnue_common.h) ; décodés par
+# morceaux pour ne pas multiplier la taille du réseau en mémoire
+def _read_leb128(data, offset, count, dtype, chunk=1 << 22):
+    if data[offset:offset + len(LEB128_MAGIC)] != LEB128_MAGIC:
+        raise ValueError("bloc LEB128 attendu")
+    offset += len(LEB128_MAGIC)
+    size = struct.unpack_from("<I", data, offset)[0]
+    offset += 4
+    raw = np.frombuffer(data, dtype=np.uint8, count=size, offset=offset)
+    bits = np.dtype(dtype).itemsize * 8
+    out = np.empty(count, dtype=dtype)
+    written = pos = 0
+    while pos < size:
+        part = raw[pos:pos + chunk].astype(np.int64)
+        ends = np.flatnonzero(part < 0x80)  # dernier octet de chaque valeur
+        if not len(ends):
+            raise ValueError("bloc LEB128 tronqué")
+        part = part[:ends[-1] + 1]
+        starts = np.concatenate(([0], ends[:-1] + 1))
+        lengths = ends - starts + 1
+        shifts = 7 * (np.arange(len(part)) - np.repeat(starts, lengths))
+        values = np.add.reduceat((part & 0x7F) << shifts, starts)
+        # extension du signe si le dernier octet a son bit 6
+        negative = ((part[ends] & 0x40) != 0) & (7 * lengths < bits)
+        values[negative] -= np.int64(1) << (7 * lengths[negative])
+        if written + len(values) > count:
+            raise ValueError("bloc LEB128 trop long")
+        out[written:written + len(values)] = values.astype(dtype)
+        written += len(values)
+        pos += len(part)
+    if written != count:
+        raise ValueError("bloc LEB128 incomplet")
+    return out, offset + size
+
+
+class Network:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        version, file_hash, size = struct.unpack_from("<III", data, 0)
+        if version != VERSION:
+            raise ValueError(f"{path} : version de réseau inconnue {version:#x}")
+        self.description = data[12:12 + size].decode("utf-8", "replace")
+        offset = 12 + size
+        for l1 in (BIG_L1, SMALL_L1):
+            if file_hash == (FEATURE_HASH ^ (l1 * 2)) ^ architecture_hash(l1):
+                break
+        else:
+            raise ValueError(f"{path} : architecture inconnue (hash {file_hash:#x})")
+        self.l1 = l1
+
+        def header(expected):
+            nonlocal offset
+            if struct.unpack_from("<I", data, offset)[0] != expected:
+                raise ValueError(f"{path} : en-tête de couche inattendu")
+            offset += 4
+
+        def raw(dtype, count):
+            nonlocal offset
+            values = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+            offset += values.nbytes
+            return values
+
+        # transformation des caractéristiques ; biais et poids sont doublés à la
+        # lecture (scale_weights), en int16 comme dans le moteur
+        header(FEATURE_HASH ^ (l1 * 2))
+        biases, offset = _read_leb128(data, offset, l1, np.int16)
+        weights, offset = _read_leb128(data, offset, l1 * DIMENSIONS, np.int16)
+        psqt, offset = _read_leb128(data, offset, PSQT_BUCKETS * DIMENSIONS, np.int32)
+        self.biases = biases * np.int16(2)
+        self.weights = (weights * np.int16(2)).reshape(DIMENSIONS, l1)
+        del weights
+        self.psqt_weights = psqt.reshape(DIMENSIONS, PSQT_BUCKETS)
+
+        # une pile de couches par bucket (nombre de pièces)
+        self.layers = []
+        for _ in range(LAYER_STACKS):
+            header(architecture_hash(l1))
+            fc0 = (raw("<i4", L2 + 1).astype(np.int64), raw("i1", (L2 + 1) * l1).reshape(L2 + 1, l1))
+            fc1 = (raw("<i4", L3).astype(np.int64), raw("i1", L3 * 32).reshape(L3, 32))
+            fc2 = (raw("<i4", 1).astype(np.int64), raw("i1", 32).reshape(1, 32))
+            self.layers.append([(b, w.astype(np.int64)) for b, w in (fc0, fc1, fc2)])
+        if offset != len(data):
+            raise ValueError(f"{path} : données en trop à la fin du réseau")
+
+    # Indices des caractéristiques actives : (positions, indices) pour un lot de
+    # plateaux (N, 64) et les cases des rois (N, 2), d'un point de vue
+    def _active(self, board, kings, perspective):
+        rows, squares = np.nonzero(board)
+        ksq = kings[rows, perspective]
+        return rows, feature_index(perspective, squares, board[rows, squares], ksq)
+
+    # Accumulateurs recalculés (N, 2, L1) et (N, 2, 8) pour un lot de plateaux
+    def refresh(self, board, chunk=256):
+        board = np.asarray(board, dtype=np.int64).reshape(-1, 64)
+        kings = np.stack([np.argmax(board == make_piece(c, KING), axis=1) for c in (WHITE, BLACK)], axis=1)
+        acc = np.empty((len(board), 2, self.l1), dtype=np.int16)
+        psqt = np.empty((len(board), 2, PSQT_BUCKETS), dtype=np.int32)
+        for start in range(0, len(board), chunk):
+            part = board[start:start + chunk]
+            starts = np.concatenate(([0], np.cumsum(np.count_nonzero(part, axis=1))[:-1]))
+            for perspective in (WHITE, BLACK):
+                _, features = self._active(part, kings[start:start + chunk], perspective)
+                # les sommes en int16 reviennent modulo 2^16, comme dans le moteur
+                acc[start:start + chunk, perspective] = (
+                    np.add.reduceat(self.weights[features], starts, axis=0) + self.biases
+                ).astype(np.int16)
+                psqt[start:start + chunk, perspective] = np.add.reduceat(
+                    self.psqt_weights[features], starts, axis=0)
+        return acc, psqt
+
+    # Couches du réseau (FeatureTransformer::transform puis NetworkArchitecture::propagate)
+    # pour des accumulateurs (N, 2, L1) ; renvoie (psqt, positional) par position,
+    # déjà divisés par OutputScale
+    def propagate(self, acc, psqt, side, bucket):
+        n = len(side)
+        rows = np.arange(n)
+        us, them = side.astype(np.int64), 1 - side.astype(np.int64)
+        material = _cdiv(psqt[rows, us, bucket].astype(np.int64) - psqt[rows, them, bucket], 2)
+        half = self.l1 // 2
+        transformed = []
+        for perspective in (us, them):
+            a = np.clip(acc[rows, perspective], 0, 254).astype(np.int64)
+            transformed.append(a[:, :half] * a[:, half:] // 512)
+        x = np.concatenate(transformed, axis=1)
+
+        positional = np.empty(n, dtype=np.int64)
+        for b in np.unique(bucket):
+            select = bucket == b
+            (b0, w0), (b1, w1), (b2, w2) = self.layers[b]
+            fc0 = x[select] @ w0.T + b0
+            sqr = np.minimum(127, (fc0[:, :L2] * fc0[:, :L2]) >> (2 * WEIGHT_SCALE_BITS + 7))
+            relu = np.clip(fc0[:, :L2] >> WEIGHT_SCALE_BITS, 0, 127)
+            hidden = np.concatenate([sqr, relu, np.zeros((len(fc0), 32 - 2 * L2), dtype=np.int64)], axis=1)
+            fc1 = np.clip((hidden @ w1.T + b1) >> WEIGHT_SCALE_BITS, 0, 127)
+            fc2 = (fc1 @ w2.T + b2)[:, 0]
+            forward = _cdiv(fc0[:, L2] * (600 * OUTPUT_SCALE), 127 * (1 << WEIGHT_SCALE_BITS))
+            positional[select] = fc2 + forward
+        return _cdiv(material, OUTPUT_SCALE), _cdiv(positional, OUTPUT_SCALE)
+
+
+# Comptes de pièces (N, 16) par code de pièce
+def _piece_counts(board):
+    n = len(board)
+    return np.bincount((np.arange(n)[:, None] * 16 + board).ravel(), minlength=n * 16).reshape(n, 16)
+
+
+# Eval::simple_eval : bilan matériel du camp au trait, qui choisit le réseau
+def _simple_eval(counts, side):
+    white = counts[:, make_piece(WHITE, PAWN):make_piece(WHITE, KING)] @ PIECE_VALUES[1:6]
+    black = counts[:, make_piece(BLACK, PAWN):make_piece(BLACK, KING)] @ PIECE_VALUES[9:14]
+    return np.where(side == WHITE, white - black, black - white)
+
+
+# Eval::evaluate (evaluate.cpp) sans optimisme, du point de vue du camp au trait
+def _final(psqt, positional, counts, side, rule50):
+    nnue = _cdiv(125 * psqt + 131 * positional, 128)
+    complexity = np.abs(psqt - positional)
+    nnue = nnue - _cdiv(nnue * complexity, 18000)
+    pawns = counts[:, make_piece(WHITE, PAWN)] + counts[:, make_piece(BLACK, PAWN)]
+    material = 535 * pawns + counts @ PIECE_VALUES - 208 * pawns
+    v = _cdiv(nnue * (77777 + material), 77777)
+    v = v - _cdiv(v * rule50, 212)
+    return np.clip(v, -VALUE_TB_WIN_IN_MAX_PLY + 1, VALUE_TB_WIN_IN_MAX_PLY - 1)
+
+
+# UCIEngine::to_cp : unités internes -> centipions, d'après le modèle de gain
+def to_cp(v, counts):
+    pawns = counts[:, make_piece(WHITE, PAWN)] + counts[:, make_piece(BLACK, PAWN)]
+    material = pawns
+    for piece_type, weight in ((KNIGHT, 3), (BISHOP, 3), (ROOK, 5), (QUEEN, 9)):
+        material = material + weight * (counts[:, make_piece(WHITE, piece_type)]
+                                        + counts[:, make_piece(BLACK, piece_type)])
+    m = np.clip(material, 17, 78) / 58.0
+    a = (((-13.50030198 * m + 40.92780883) * m - 36.82753545) * m) + 386.83004070
+    x = 100 * v / a
+    return (np.sign(x) * np.floor(np.abs(x) + 0.5)).astype(np.int64)  # std::round
+
+
+# Les deux réseaux de Stockfish : le petit sert quand le matériel est très déséquilibré,
+# le grand sinon ou si le petit trouve la position serrée (use_smallnet). Sans le
+# petit réseau, tout passe par le grand.
+class NNUE:
+    def __init__(self, big_path, small_path=None):
+        self.big = Network(big_path)
+        self.small = Network(small_path) if small_path else None
+
+    # Évaluations finales d'un lot (unités internes, camp au trait), comme
+    # Eval::evaluate ; `checks` marque les positions en échec, qui n'en ont pas
+    def evaluate_boards(self, board, side, rule50):
+        board = np.asarray(board, dtype=np.int64).reshape(-1, 64)
+        side = np.asarray(side, dtype=np.int64)
+        counts = _piece_counts(board)
+        bucket = (np.count_nonzero(board, axis=1) - 1) // 4
+        psqt, positional = self.big.propagate(*self.big.refresh(board), side, bucket)
+        if self.small is not None:
+            small = np.abs(_simple_eval(counts, side)) > 962
+            if small.any():
+                s_psqt, s_positional = self.small.propagate(
+                    *self.small.refresh(board[small]), side[small], bucket[small])
+                s_nnue = _cdiv(125 * s_psqt + 131 * s_positional, 128)
+                keep = np.abs(s_nnue) >= 236  # sinon le grand réseau reprend la main
+                idx = np.flatnonzero(small)[keep]
+                psqt[idx], positional[idx] = s_psqt[keep], s_positional[keep]
+        return _final(psqt, positional, counts, side, np.asarray(rule50, dtype=np.int64)), counts
+
+    # Évaluations en centipions du point de vue des blancs, comme la ligne
+    # "Final evaluation" de la commande "eval" ; None pour une position en échec
+    def evaluate(self, positions):
+        positions = [Position(p) if isinstance(p, str) else p for p in positions]
+        if not positions:
+            return []
+        board = np.array([p.board for p in positions], dtype=np.int64)
+        side = np.array([p.side_to_move for p in positions])
+        v, counts = self.evaluate_boards(board, side, [p.rule50 for p in positions])
+        cp = to_cp(np.where(side == WHITE, v, -v), counts)
+        return [None if p.checkers else int(c) for p, c in zip(positions, cp)]
+
+
+# Accumulateurs d'une Position tenus à jour coup par coup (AccumulatorStack) : un
+# coup ne retire et n'ajoute que les colonnes des pièces déplacées, sauf pour le camp
+# dont le roi bouge, qui est recalculé. unmake_move() reprend l'état précédent.
+class AccumulatorStack:
+    def __init__(self, nnue, position):
+        self.nnue = nnue
+        self.position = position
+        self.networks = [net for net in (nnue.big, nnue.small) if net is not None]
+        self._stack = [[net.refresh(np.array(position.board))] for net in self.networks]
+
+    def make_move(self, move):
+        before = self.position.board[:]
+        self.position.make_move(move)
+        after = self.position.board
+        changed = [sq for sq in range(64) if before[sq] != after[sq]]
+        removed = [(sq, before[sq]) for sq in changed if before[sq] != NO_PIECE]
+        added = [(sq, after[sq]) for sq in changed if after[sq] != NO_PIECE]
+        board = None
+        for net, stack in zip(self.networks, self._stack):
+            acc, psqt = (a.copy() for a in stack[-1])
+            for perspective in (WHITE, BLACK):
+                king = make_piece(perspective, KING)
+                ksq = self.position.king_square(perspective)
+                if any(pc == king for _, pc in removed):
+                    if board is None:
+                        board = np.array(after)
+                    fresh = net.refresh(board)
+                    acc[0, perspective], psqt[0, perspective] = fresh[0][0, perspective], fresh[1][0, perspective]
+                    continue
+                out = [feature_index(perspective, sq, pc, ksq) for sq, pc in removed]
+                new = [feature_index(perspective, sq, pc, ksq) for sq, pc in added]
+                acc[0, perspective] += net.weights[new].sum(axis=0, dtype=np.int16) \
+                    - net.weights[out].sum(axis=0, dtype=np.int16)
+                psqt[0, perspective] += net.psqt_weights[new].sum(axis=0, dtype=np.int32) \
+                    - net.psqt_weights[out].sum(axis=0, dtype=np.int32)
+            stack.append((acc, psqt))
+
+    def unmake_move(self):
+        self.position.unmake_move()
+        for stack in self._stack:
+            stack.pop()
+
+    # Évaluation finale de la position courante (unités internes, camp au trait),
+    # None en échec ; même calcul que NNUE.evaluate_boards, accumulateurs en plus
+    def evaluate(self):
+        if self.position.checkers:
+            return None
+        board = np.array([self.position.board], dtype=np.int64)
+        side = np.array([self.position.side_to_move])
+        counts = _piece_counts(board)
+        bucket = (np.count_nonzero(board, axis=1) - 1) // 4
+        big = self.networks[0]
+        psqt, positional = big.propagate(*self._stack[0][-1], side, bucket)
+        if self.nnue.small is not None:
+            if abs(_simple_eval(counts, side)[0]) > 962:
+                s_psqt, s_positional = self.nnue.small.propagate(*self._stack[1][-1], side, bucket)
+                if abs(_cdiv(125 * s_psqt + 131 * s_positional, 128)[0]) >= 236:
+                    psqt, positional = s_psqt, s_positional
+        return int(_final(psqt, positional, counts, side, np.array([self.position.rule50]))[0])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Évaluation NNUE de Stockfish sans le moteur")
+    parser.add_argument("network", help="grand réseau (.nnue)")
+    parser.add_argument("fens", nargs="*", help="positions (FEN) ; position initiale par défaut")
+    parser.add_argument("--small", help="petit réseau, pour évaluer comme le moteur")
+    parser.add_argument("--moves", help="coups UCI joués depuis la position, évaluée après chacun")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    nnue = NNUE(args.network, args.small)
+    print(f"réseaux chargés en {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    if args.moves is not None:
+        position = Position(args.fens[0] if args.fens else START_FEN)
+        stack = AccumulatorStack(nnue, position)
+        for uci in args.moves.split():
+            move = position.parse_uci(uci)
+            if not move:
+                parser.error(f"coup illégal : {uci}")
+            stack.make_move(move)
+            v = stack.evaluate()
+            if v is None:
+                print(uci, "en échec")
+                continue
+            v = v if position.side_to_move == WHITE else -v
+            cp = to_cp(np.array([v]), _piece_counts(np.array([position.board])))[0]
+            print(uci, f"{cp / 100:+.2f}")
+        return
+    for fen, cp in zip(args.fens or [START_FEN], nnue.evaluate(args.fens or [START_FEN])):
+        print(fen, "en échec" if cp is None else f"{cp / 100:+.2f}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
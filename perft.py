@@ -0,0 +1,156 @@
+import argparse
+import json
+import sys
+import time
+
+from position import Position, move_uci
+
+# Positions de référence (https://www.chessprogramming.org/Perft_Results) avec les
+# nombres de feuilles attendus par profondeur
+POSITIONS = [
+    ("startpos", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+     [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603]),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624]),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333]),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487]),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594]),
+]
+
+# Profondeur par défaut : assez pour couvrir roques, prises en passant et promotions
+# en quelques secondes
+DEFAULT_DEPTHS = {"startpos": 4, "kiwipete": 3, "position3": 5, "position4": 4,
+                  "position5": 3, "position6": 3}
+
+
+def perft(position, depth):
+    moves = position.legal_moves() if depth else []
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        position.make_move(move)
+        nodes += perft(position, depth - 1)
+        position.unmake_move()
+    return nodes
+
+
+# Nombre de feuilles sous chaque coup à la racine, comme "go perft" de Stockfish
+def divide(position, depth):
+    result = {}
+    for move in position.legal_moves():
+        position.make_move(move)
+        result[move_uci(move)] = perft(position, depth - 1)
+        position.unmake_move()
+    return result
+
+
+def run(depths, max_depth=None):
+    results = {}
+    total_nodes = total_time = 0
+    for name, fen, expected in POSITIONS:
+        depth = depths.get(name, 3)
+        if max_depth is not None:
+            depth = min(depth, max_depth)
+        results[name] = {"fen": fen, "nodes": {}, "nps": {}}
+        for d in range(1, depth + 1):
+            position = Position(fen)
+            start = time.perf_counter()
+            nodes = perft(position, d)
+            elapsed = time.perf_counter() - start
+            nps = nodes / elapsed if elapsed > 0 else 0
+            results[name]["nodes"][str(d)] = nodes
+            results[name]["nps"][str(d)] = round(nps)
+            total_nodes += nodes
+            total_time += elapsed
+            status = "ok" if nodes == expected[d - 1] else f"ERREUR (attendu {expected[d - 1]})"
+            print(f"{name:10} depth {d}  {nodes:>9} noeuds  {elapsed:7.3f}s  {nps:>9.0f} n/s  {status}")
+    total_nps = round(total_nodes / total_time) if total_time > 0 else 0
+    print(f"total      {total_nodes} noeuds  {total_time:.3f}s  {total_nps} n/s")
+    return {"positions": results, "nps": total_nps}
+
+
+# Compare le résultat à la référence : les nombres de noeuds doivent être identiques,
+# et la vitesse globale ne doit pas baisser de plus de `tolerance` (la vitesse par
+# profondeur est enregistrée mais trop bruitée pour servir de seuil)
+def compare(results, baseline, tolerance):
+    failures = []
+    for name, fen, expected in POSITIONS:
+        if name not in results["positions"]:
+            continue
+        ref = baseline.get("positions", {}).get(name, {})
+        for d, nodes in results["positions"][name]["nodes"].items():
+            if nodes != expected[int(d) - 1]:
+                failures.append(f"{name} depth {d}: {nodes} noeuds au lieu de {expected[int(d) - 1]}")
+            if d in ref.get("nodes", {}) and ref["nodes"][d] != nodes:
+                failures.append(f"{name} depth {d}: {nodes} noeuds, référence {ref['nodes'][d]}")
+    if tolerance is not None and "nps" in baseline and results["nps"] < baseline["nps"] * (1 - tolerance):
+        failures.append(f"vitesse {results['nps']} n/s, référence {baseline['nps']} n/s")
+    return failures
+
+
+# Vérifie le détail par coup contre "go perft" du moteur embarqué
+def cross_check(stockfish_path, depths):
+    from stockfish_class import Stockfish
+
+    engine = Stockfish(stockfish_path)
+    failures = []
+    try:
+        for name, fen, _ in POSITIONS:
+            depth = depths.get(name, 3)
+            ours = divide(Position(fen), depth)
+            theirs, total = engine.perft(fen, depth)
+            for move in sorted(set(ours) | set(theirs)):
+                if ours.get(move) != theirs.get(move):
+                    failures.append(f"{name} depth {depth} {move}: "
+                                    f"{ours.get(move)} ici, {theirs.get(move)} pour Stockfish")
+            print(f"{name:10} depth {depth}  Stockfish {total} noeuds  "
+                  f"{'ok' if sum(ours.values()) == total else 'DIFFERENT'}")
+    finally:
+        engine.quit()
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft du générateur de coups de position.py")
+    parser.add_argument("--depth", type=int, help="profondeur maximale pour toutes les positions")
+    parser.add_argument("--baseline", default="perft_baseline.json")
+    parser.add_argument("--update", action="store_true", help="réécrit la référence avec ces résultats")
+    # la vitesse de la référence dépend de la machine qui l'a écrite : sans
+    # --tolerance, seuls les nombres de noeuds sont vérifiés
+    parser.add_argument("--tolerance", type=float,
+                        help="baisse de vitesse tolérée par rapport à la référence, 0.3 pour 30 %% "
+                             "(référence écrite sur la même machine avec --update)")
+    parser.add_argument("--stockfish", help="chemin du moteur pour comparer le détail par coup")
+    args = parser.parse_args(argv)
+
+    results = run(DEFAULT_DEPTHS, args.depth)
+
+    if args.update:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print("Référence écrite dans", args.baseline)
+        return 0
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        baseline = {}
+    # la vitesse n'est comparable qu'aux profondeurs de la référence
+    failures = compare(results, baseline, None if args.depth else args.tolerance)
+    if args.stockfish:
+        failures += cross_check(args.stockfish, {n: min(d, args.depth or d) for n, d in DEFAULT_DEPTHS.items()})
+
+    for failure in failures:
+        print("ECHEC :", failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
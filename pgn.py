@@ -0,0 +1,178 @@
+import argparse
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+import polyglot
+from polyglot import polyglot_key, polyglot_uci
+from position import Position, MOVE_NONE, move_uci
+from repertoire import Repertoire
+
+RESULTS = {"1-0": 0, "1/2-1/2": 1, "0-1": 2}
+HEADER_RE = re.compile(r'\[(\w+)\s+"(.*)"\]')
+# commentaires {...} et ;..., variantes (...), NAG $n, numéros de coups, résultats
+TOKEN_RE = re.compile(r"\{[^}]*\}?|;[^\n]*|\(|\)|\$\d+|\d+\.+|1-0|0-1|1/2-1/2|\*|[^\s(){};$]+")
+
+
+# Lecture paresseuse d'un flux de lignes PGN : une partie à la fois, sous la forme
+# (en-têtes, texte des coups). Les coups ne sont découpés que si on les demande.
+def read_games(lines):
+    headers, movetext = {}, []
+    for line in lines:
+        line = line.strip()
+        if line.startswith("["):
+            if movetext:
+                yield headers, " ".join(movetext)
+                headers, movetext = {}, []
+            match = HEADER_RE.match(line)
+            if match:
+                headers[match.group(1)] = match.group(2)
+        elif line and not line.startswith("%"):
+            movetext.append(line)
+    if headers or movetext:
+        yield headers, " ".join(movetext)
+
+
+# Coups SAN de la ligne principale, sans commentaires ni variantes
+def san_moves(movetext):
+    depth = 0
+    for token in TOKEN_RE.findall(movetext):
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        elif depth == 0 and token[0] not in "{;$*" and (not token[0].isdigit() or token[:3] == "0-0"):
+            yield token
+
+
+# Ajoute une partie aux statistiques : pour chaque position des `max_ply` premiers
+# demi-coups, le coup joué et le résultat, indexés par (clé de Zobrist, coup UCI)
+# -> [parties, gains blancs, nulles, gains noirs]. Avec `book`, les comptes sont
+# indexés par (clé Polyglot, coup Polyglot, camp qui joue) pour polyglot.add_stats.
+def add_game(stats, headers, movetext, max_ply=20, book=False):
+    result = RESULTS.get(headers.get("Result"))
+    position = Position(headers["FEN"]) if "FEN" in headers else Position()
+    for ply, san in enumerate(san_moves(movetext)):
+        if ply >= max_ply:
+            break
+        move = position.parse_san(san)
+        if move == MOVE_NONE:
+            break  # coup illisible ou illégal : on garde le début de la partie
+        if book:
+            k = (polyglot_key(position), polyglot_uci(position, move), position.side_to_move)
+        else:
+            k = (position.key(), move_uci(move))
+        entry = stats.get(k)
+        if entry is None:
+            entry = stats[k] = [0, 0, 0, 0]
+        entry[0] += 1
+        if result is not None:
+            entry[1 + result] += 1
+        position.make_move(move)
+
+
+def merge(stats, partial):
+    for k, counts in partial.items():
+        entry = stats.get(k)
+        if entry is None:
+            stats[k] = counts
+        else:
+            for i in range(4):
+                entry[i] += counts[i]
+
+
+# Lignes d'un morceau du fichier [start, end[ : une partie appartient au morceau où
+# commence sa ligne [Event ...], quitte à lire un peu après `end` pour la finir
+def _range_lines(f, start, end):
+    # à partir de l'octet start - 1 : la ligne sautée n'est que la fin de celle que lit
+    # le morceau précédent, vide si le morceau commence juste en début de ligne
+    f.seek(max(start - 1, 0))
+    if start > 0:
+        f.readline()
+        while True:
+            offset = f.tell()
+            line = f.readline()
+            if not line:
+                return
+            if line.startswith(b"[Event "):
+                break
+        if offset >= end:
+            return
+        yield line.decode("utf-8", "replace")
+    while True:
+        offset = f.tell()
+        line = f.readline()
+        if not line or (offset >= end and line.startswith(b"[Event ")):
+            return
+        yield line.decode("utf-8", "replace")
+
+
+def _ingest_range(job):
+    path, start, end, max_ply, book = job
+    stats = {}
+    games = 0
+    with open(path, "rb") as f:
+        for headers, movetext in read_games(_range_lines(f, start, end)):
+            add_game(stats, headers, movetext, max_ply, book)
+            games += 1
+    return games, stats
+
+
+# Statistiques d'ouverture d'un fichier PGN. Le fichier est découpé en morceaux de
+# `chunk_size` octets répartis sur `processes` processus ; chaque morceau rend ses
+# comptes dès qu'il est fini, donc la mémoire dépend du nombre de positions
+# distinctes dans les `max_ply` premiers demi-coups, pas de la taille du fichier.
+def ingest(path, max_ply=20, processes=None, chunk_size=32 << 20, book=False):
+    size = os.path.getsize(path)
+    jobs = [(path, start, min(start + chunk_size, size), max_ply, book)
+            for start in range(0, size, chunk_size)]
+    stats = {}
+    games = 0
+    if processes == 1 or len(jobs) <= 1:
+        for job in jobs:
+            n, partial = _ingest_range(job)
+            games += n
+            merge(stats, partial)
+        return games, stats
+    with multiprocessing.Pool(processes) as pool:
+        for n, partial in pool.imap_unordered(_ingest_range, jobs):
+            games += n
+            merge(stats, partial)
+    return games, stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Statistiques d'ouverture depuis un fichier PGN")
+    parser.add_argument("pgn", nargs="+")
+    parser.add_argument("--plies", type=int, default=20, help="demi-coups comptés par partie")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=32, help="taille des morceaux en Mo")
+    parser.add_argument("--output", default="repertoire.sqlite", help="répertoire où ajouter les comptes")
+    parser.add_argument("--book", help="écrire plutôt un livre Polyglot (.bin), fusionné avec l'existant")
+    args = parser.parse_args(argv)
+
+    repertoire = None if args.book else Repertoire(args.output)
+    weights = {}
+    for path in args.pgn:
+        start = time.perf_counter()
+        games, stats = ingest(path, args.plies, args.processes, args.chunk_size << 20, bool(args.book))
+        if args.book:
+            polyglot.add_stats(weights, stats)
+        else:
+            repertoire.add_stats(stats)
+        elapsed = time.perf_counter() - start
+        print(f"{path} : {games} parties, {len(stats)} couples position/coup "
+              f"en {elapsed:.1f}s ({games / max(elapsed, 1e-9):.0f} parties/s)")
+    if args.book:
+        if os.path.exists(args.book):
+            with polyglot.PolyglotBook(args.book) as book:
+                polyglot.add_book(weights, book)
+        print(f"{args.book} : {polyglot.write_book(args.book, weights)} entrées")
+    else:
+        repertoire.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,842 @@
+# Représentation de l'échiquier en bitboards (entiers de 64 bits), sur le modèle de
+# stockfish/src/bitboard.h et position.h. Les cases vont de a1 = 0 à h8 = 63.
+import collections
+import re
+
+WHITE, BLACK = 0, 1
+COLOR_NAMES = ("white", "black")
+
+NO_PIECE_TYPE, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(7)
+ALL_PIECES = 0
+PIECE_TYPE_NAMES = (None, "pawn", "knight", "bishop", "rook", "queen", "king")
+
+NO_PIECE = 0
+FEN_PIECES = " PNBRQK  pnbrqk"
+
+SQ_NONE = 64
+
+# Un coup tient sur 16 bits, comme Move dans types.h :
+# bits 0-5 arrivée, 6-11 départ, 12-13 pièce de promotion - KNIGHT, 14-15 type de coup.
+# Contrairement à Stockfish, le roque est codé roi -> case d'arrivée du roi (e1g1).
+NORMAL = 0
+PROMOTION = 1 << 14
+EN_PASSANT = 2 << 14
+CASTLING = 3 << 14
+MOVE_NONE = 0
+
+WHITE_OO, WHITE_OOO, BLACK_OO, BLACK_OOO = 1, 2, 4, 8
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+# coup SAN hors roques : pièce, colonne et/ou rangée de départ, prise, case d'arrivée,
+# promotion (avec ou sans "=")
+SAN_RE = re.compile(r"^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQnbrq]))?$")
+
+M64 = 0xFFFFFFFFFFFFFFFF
+FILE_A_BB = 0x0101010101010101
+FILE_H_BB = FILE_A_BB << 7
+RANK_1_BB = 0xFF
+RANK_3_BB = RANK_1_BB << 16
+RANK_6_BB = RANK_1_BB << 40
+RANK_8_BB = RANK_1_BB << 56
+DARK_SQUARES_BB = 0xAA55AA55AA55AA55
+
+
+def make_piece(color, piece_type):
+    return (color << 3) + piece_type
+
+
+def color_of(piece):
+    return piece >> 3
+
+
+def type_of(piece):
+    return piece & 7
+
+
+def piece_name(piece):
+    # nom utilisé par l'interface pygame ("white-knight", ...)
+    return f"{COLOR_NAMES[color_of(piece)]}-{PIECE_TYPE_NAMES[type_of(piece)]}"
+
+
+def square_name(sq):
+    return "abcdefgh"[sq & 7] + str((sq >> 3) + 1)
+
+
+def parse_square(name):
+    return (int(name[1]) - 1) * 8 + "abcdefgh".index(name[0])
+
+
+def encode_move(from_sq, to_sq, move_type=NORMAL, promotion=KNIGHT):
+    return move_type | ((promotion - KNIGHT) << 12) | (from_sq << 6) | to_sq
+
+
+def move_from(move):
+    return (move >> 6) & 63
+
+
+def move_to(move):
+    return move & 63
+
+
+def move_type(move):
+    return move & (3 << 14)
+
+
+def promotion_type(move):
+    return ((move >> 12) & 3) + KNIGHT
+
+
+def move_uci(move):
+    uci = square_name(move_from(move)) + square_name(move_to(move))
+    if move_type(move) == PROMOTION:
+        uci += " nbrq"[promotion_type(move) - 1]
+    return uci
+
+
+def lsb(b):
+    return (b & -b).bit_length() - 1
+
+
+def squares(b):
+    # itère sur les cases d'un bitboard
+    while b:
+        low = b & -b
+        yield low.bit_length() - 1
+        b ^= low
+
+
+def popcount(b):
+    return bin(b).count("1")
+
+
+# --- Tables d'attaques précalculées ---------------------------------------------
+
+def _step_attacks(steps):
+    table = []
+    for sq in range(64):
+        r, f = sq >> 3, sq & 7
+        b = 0
+        for dr, df in steps:
+            if 0 <= r + dr < 8 and 0 <= f + df < 8:
+                b |= 1 << ((r + dr) * 8 + f + df)
+        table.append(b)
+    return table
+
+
+KNIGHT_ATTACKS = _step_attacks([(2, 1), (1, 2), (-1, 2), (-2, 1), (-2, -1), (-1, -2), (1, -2), (2, -1)])
+KING_ATTACKS = _step_attacks([(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)])
+PAWN_ATTACKS = [_step_attacks([(1, -1), (1, 1)]), _step_attacks([(-1, -1), (-1, 1)])]
+
+
+def _ray_mask(sq, dr, df):
+    r, f = (sq >> 3) + dr, (sq & 7) + df
+    b = 0
+    while 0 <= r < 8 and 0 <= f < 8:
+        b |= 1 << (r * 8 + f)
+        r, f = r + dr, f + df
+    return b
+
+
+# Masques par case (case exclue) pour la colonne, la diagonale et l'anti-diagonale
+FILE_MASKS = [_ray_mask(s, 1, 0) | _ray_mask(s, -1, 0) for s in range(64)]
+DIAG_MASKS = [_ray_mask(s, 1, 1) | _ray_mask(s, -1, -1) for s in range(64)]
+ANTI_MASKS = [_ray_mask(s, 1, -1) | _ray_mask(s, -1, 1) for s in range(64)]
+
+
+def _bswap(b):
+    return int.from_bytes(b.to_bytes(8, "little"), "big")
+
+
+SQUARE_BSWAP = [_bswap(1 << s) for s in range(64)]
+
+
+# Attaques d'une ligne par "hyperbola quintessence" : o - 2s donne les attaques vers
+# les bits de poids fort, la même chose sur le bitboard retourné (bswap) donne
+# l'autre sens. Valable pour colonnes et diagonales, pas pour les rangées.
+def _line_attacks(sq, occupied, mask):
+    o = occupied & mask
+    forward = o - (2 << sq)
+    reverse = _bswap((_bswap(o) - 2 * SQUARE_BSWAP[sq]) & M64)
+    return (forward ^ reverse) & mask
+
+
+# Rangées : table [colonne][occupation des 6 cases intérieures] -> attaques sur la rangée
+def _rank_table():
+    table = []
+    for f in range(8):
+        row = []
+        for inner in range(64):
+            occ = inner << 1
+            b = 0
+            for step in (1, -1):
+                x = f + step
+                while 0 <= x < 8:
+                    b |= 1 << x
+                    if occ & (1 << x):
+                        break
+                    x += step
+            row.append(b)
+        table.append(row)
+    return table
+
+
+RANK_ATTACKS = _rank_table()
+
+
+def bishop_attacks(sq, occupied):
+    return _line_attacks(sq, occupied, DIAG_MASKS[sq]) | _line_attacks(sq, occupied, ANTI_MASKS[sq])
+
+
+def rook_attacks(sq, occupied):
+    shift = sq & 56
+    rank = RANK_ATTACKS[sq & 7][(occupied >> (shift + 1)) & 63] << shift
+    return _line_attacks(sq, occupied, FILE_MASKS[sq]) | rank
+
+
+def queen_attacks(sq, occupied):
+    return bishop_attacks(sq, occupied) | rook_attacks(sq, occupied)
+
+
+# Attaques sur échiquier vide, pour repérer les pièces qui peuvent clouer
+BISHOP_PSEUDO = [DIAG_MASKS[s] | ANTI_MASKS[s] for s in range(64)]
+ROOK_PSEUDO = [FILE_MASKS[s] | ((RANK_1_BB << (s & 56)) ^ (1 << s)) for s in range(64)]
+
+
+# LINE_BB[a][b] : ligne entière (bord à bord) passant par a et b, 0 si non alignées.
+# BETWEEN_BB[a][b] : cases entre a et b, b compris (b seul si non alignées), comme
+# between_bb() dans bitboard.h : une parade doit s'interposer ou prendre l'attaquant.
+def _line_tables():
+    line = [[0] * 64 for _ in range(64)]
+    between = [[1 << b for b in range(64)] for _ in range(64)]
+    directions = [(0, 1), (1, 0), (1, 1), (1, -1), (0, -1), (-1, 0), (-1, -1), (-1, 1)]
+    for a in range(64):
+        for dr, df in directions:
+            full = _ray_mask(a, dr, df) | _ray_mask(a, -dr, -df) | (1 << a)
+            r, f = (a >> 3) + dr, (a & 7) + df
+            path = 0
+            while 0 <= r < 8 and 0 <= f < 8:
+                b = r * 8 + f
+                path |= 1 << b
+                line[a][b] = full
+                between[a][b] = path
+                r, f = r + dr, f + df
+    return line, between
+
+
+LINE_BB, BETWEEN_BB = _line_tables()
+
+
+# Droits de roque perdus quand une pièce part de / arrive sur ces cases
+CASTLING_RIGHTS_MASK = [0] * 64
+CASTLING_RIGHTS_MASK[4] = WHITE_OO | WHITE_OOO
+CASTLING_RIGHTS_MASK[7] = WHITE_OO
+CASTLING_RIGHTS_MASK[0] = WHITE_OOO
+CASTLING_RIGHTS_MASK[60] = BLACK_OO | BLACK_OOO
+CASTLING_RIGHTS_MASK[63] = BLACK_OO
+CASTLING_RIGHTS_MASK[56] = BLACK_OOO
+
+# droit -> (départ roi, arrivée roi, départ tour, arrivée tour, cases à vider, cases non attaquées)
+CASTLINGS = {
+    WHITE_OO: (4, 6, 7, 5, 0x60, 0x70),
+    WHITE_OOO: (4, 2, 0, 3, 0x0E, 0x1C),
+    BLACK_OO: (60, 62, 63, 61, 0x60 << 56, 0x70 << 56),
+    BLACK_OOO: (60, 58, 56, 59, 0x0E << 56, 0x1C << 56),
+}
+
+
+# Clés de Zobrist tirées comme dans Position::init() (position.cpp) : même
+# générateur xorshift64* (misc.h, PRNG) et même graine, donc mêmes clés que Stockfish
+def _zobrist_tables():
+    state = 1070372
+
+    def rand64():
+        nonlocal state
+        state ^= state >> 12
+        state ^= (state << 25) & M64
+        state ^= state >> 27
+        return (state * 2685821657736338717) & M64
+
+    psq = [[0] * 64 for _ in range(16)]
+    for pc in (1, 2, 3, 4, 5, 6, 9, 10, 11, 12, 13, 14):
+        for sq in range(64):
+            psq[pc][sq] = rand64()
+    # les pions sur ces cases vont être promus
+    psq[make_piece(WHITE, PAWN)][56:64] = [0] * 8
+    psq[make_piece(BLACK, PAWN)][0:8] = [0] * 8
+    enpassant = [rand64() for _ in range(8)]
+    castling = [rand64() for _ in range(16)]
+    side = rand64()
+    return psq, enpassant, castling, side
+
+
+ZOBRIST_PSQ, ZOBRIST_ENPASSANT, ZOBRIST_CASTLING, ZOBRIST_SIDE = _zobrist_tables()
+
+
+# Ce qu'il faut pour défaire un coup, comme StateInfo dans position.h. Les
+# enregistrements sont réutilisés d'un coup à l'autre : tester un coup n'alloue rien.
+class StateInfo:
+    __slots__ = ("move", "captured", "castling_rights", "ep_square", "rule50", "checkers", "pinned",
+                 "key")
+
+    def copy(self):
+        st = StateInfo()
+        st.move = self.move
+        st.captured = self.captured
+        st.castling_rights = self.castling_rights
+        st.ep_square = self.ep_square
+        st.rule50 = self.rule50
+        st.checkers = self.checkers
+        st.pinned = self.pinned
+        st.key = self.key
+        return st
+
+
+class Position:
+    def __init__(self, fen=START_FEN):
+        self.set(fen)
+
+    def set(self, fen):
+        fields = fen.split()
+        self.board = [NO_PIECE] * 64
+        self.by_type = [0] * 7
+        self.by_color = [0, 0]
+        self.king_sq = [SQ_NONE, SQ_NONE]
+
+        sq = 56
+        for ch in fields[0]:
+            if ch == "/":
+                sq -= 16
+            elif ch.isdigit():
+                sq += int(ch)
+            else:
+                self._put_piece(FEN_PIECES.index(ch), sq)
+                sq += 1
+
+        self.side_to_move = WHITE if len(fields) < 2 or fields[1] == "w" else BLACK
+        self.castling_rights = 0
+        if len(fields) > 2:
+            for ch, right in zip("KQkq", (WHITE_OO, WHITE_OOO, BLACK_OO, BLACK_OOO)):
+                if ch in fields[2]:
+                    self.castling_rights |= right
+        self.ep_square = SQ_NONE
+        if len(fields) > 3 and fields[3] != "-":
+            # comme dans make_move, seulement si un pion du camp au trait peut prendre
+            ep = parse_square(fields[3])
+            us = self.side_to_move
+            if PAWN_ATTACKS[us ^ 1][ep] & self.pieces(us, PAWN):
+                self.ep_square = ep
+        self.rule50 = int(fields[4]) if len(fields) > 4 else 0
+        fullmove = int(fields[5]) if len(fields) > 5 else 1
+        self.game_ply = max(2 * (fullmove - 1), 0) + self.side_to_move
+        self._states = []  # pile d'annulation, _ply premiers éléments utilisés
+        self._ply = 0
+        self._status = None
+        self._fen = None
+        self._key = self._compute_key()
+        self._set_check_info()
+
+    def copy(self):
+        p = Position.__new__(Position)
+        p.board = self.board[:]
+        p.by_type = self.by_type[:]
+        p.by_color = self.by_color[:]
+        p.king_sq = self.king_sq[:]
+        p.checkers = self.checkers
+        p.pinned = self.pinned
+        p.side_to_move = self.side_to_move
+        p.castling_rights = self.castling_rights
+        p.ep_square = self.ep_square
+        p.rule50 = self.rule50
+        p.game_ply = self.game_ply
+        p._states = [st.copy() for st in self._states[:self._ply]]
+        p._ply = self._ply
+        p._status = self._status
+        p._fen = self._fen
+        p._key = self._key
+        return p
+
+    # coups joués depuis set(), qu'on peut défaire avec unmake_move()
+    def move_stack(self):
+        return [st.move for st in self._states[:self._ply]]
+
+    # FEN régénérée seulement si un coup a été joué depuis le dernier appel
+    def fen(self):
+        if self._fen is None:
+            self._fen = self._build_fen()
+        return self._fen
+
+    def _build_fen(self):
+        rows = []
+        for r in range(7, -1, -1):
+            row, empty = "", 0
+            for f in range(8):
+                pc = self.board[r * 8 + f]
+                if pc == NO_PIECE:
+                    empty += 1
+                    continue
+                if empty:
+                    row += str(empty)
+                    empty = 0
+                row += FEN_PIECES[pc]
+            if empty:
+                row += str(empty)
+            rows.append(row)
+        castling = "".join(ch for ch, right in zip("KQkq", (WHITE_OO, WHITE_OOO, BLACK_OO, BLACK_OOO))
+                           if self.castling_rights & right) or "-"
+        ep = square_name(self.ep_square) if self.ep_square != SQ_NONE else "-"
+        fullmove = self.game_ply // 2 + 1
+        return f"{'/'.join(rows)} {'wb'[self.side_to_move]} {castling} {ep} {self.rule50} {fullmove}"
+
+    # Clé de Zobrist de la position (transpositions comprises), tenue à jour coup par
+    # coup par make_move() comme st->key dans position.cpp
+    def key(self):
+        return self._key
+
+    def _compute_key(self):
+        k = ZOBRIST_CASTLING[self.castling_rights]
+        for sq, pc in enumerate(self.board):
+            if pc != NO_PIECE:
+                k ^= ZOBRIST_PSQ[pc][sq]
+        if self.ep_square != SQ_NONE:
+            k ^= ZOBRIST_ENPASSANT[self.ep_square & 7]
+        if self.side_to_move == BLACK:
+            k ^= ZOBRIST_SIDE
+        return k
+
+    def piece_on(self, sq):
+        return self.board[sq]
+
+    def occupied(self):
+        return self.by_color[WHITE] | self.by_color[BLACK]
+
+    def pieces(self, color, piece_type):
+        return self.by_color[color] & self.by_type[piece_type]
+
+    def king_square(self, color):
+        return self.king_sq[color]
+
+    def _put_piece(self, pc, sq):
+        b = 1 << sq
+        if type_of(pc) == KING:
+            self.king_sq[color_of(pc)] = sq
+        self.board[sq] = pc
+        self.by_type[ALL_PIECES] |= b
+        self.by_type[type_of(pc)] |= b
+        self.by_color[color_of(pc)] |= b
+
+    def _remove_piece(self, sq):
+        pc = self.board[sq]
+        b = 1 << sq
+        self.board[sq] = NO_PIECE
+        self.by_type[ALL_PIECES] ^= b
+        self.by_type[type_of(pc)] ^= b
+        self.by_color[color_of(pc)] ^= b
+        return pc
+
+    def _move_piece(self, from_sq, to_sq):
+        pc = self.board[from_sq]
+        b = (1 << from_sq) | (1 << to_sq)
+        if type_of(pc) == KING:
+            self.king_sq[color_of(pc)] = to_sq
+        self.board[from_sq] = NO_PIECE
+        self.board[to_sq] = pc
+        self.by_type[ALL_PIECES] ^= b
+        self.by_type[type_of(pc)] ^= b
+        self.by_color[color_of(pc)] ^= b
+
+    # Toutes les pièces (des deux camps) qui attaquent la case, calculé depuis la
+    # case elle-même, comme Position::attackers_to
+    def attackers_to(self, sq, occupied=None):
+        if occupied is None:
+            occupied = self.by_color[WHITE] | self.by_color[BLACK]
+        by_type = self.by_type
+        return ((PAWN_ATTACKS[BLACK][sq] & by_type[PAWN] & self.by_color[WHITE])
+                | (PAWN_ATTACKS[WHITE][sq] & by_type[PAWN] & self.by_color[BLACK])
+                | (KNIGHT_ATTACKS[sq] & by_type[KNIGHT])
+                | (KING_ATTACKS[sq] & by_type[KING])
+                | (bishop_attacks(sq, occupied) & (by_type[BISHOP] | by_type[QUEEN]))
+                | (rook_attacks(sq, occupied) & (by_type[ROOK] | by_type[QUEEN])))
+
+    # Vrai si la case est attaquée par une pièce de `by` (sort dès le premier attaquant)
+    def is_attacked(self, sq, by, occupied=None):
+        if occupied is None:
+            occupied = self.by_color[WHITE] | self.by_color[BLACK]
+        theirs = self.by_color[by]
+        by_type = self.by_type
+        if PAWN_ATTACKS[by ^ 1][sq] & by_type[PAWN] & theirs:
+            return True
+        if KNIGHT_ATTACKS[sq] & by_type[KNIGHT] & theirs:
+            return True
+        if KING_ATTACKS[sq] & by_type[KING] & theirs:
+            return True
+        diagonal = (by_type[BISHOP] | by_type[QUEEN]) & theirs
+        if diagonal and bishop_attacks(sq, occupied) & diagonal:
+            return True
+        straight = (by_type[ROOK] | by_type[QUEEN]) & theirs
+        return bool(straight and rook_attacks(sq, occupied) & straight)
+
+    # Pièces qui donnent échec et pièces clouées du camp au trait, calculées une fois
+    # par position (et restaurées par unmake_move)
+    def _set_check_info(self):
+        us = self.side_to_move
+        them = us ^ 1
+        ksq = self.king_sq[us]
+        if ksq == SQ_NONE:
+            self.checkers = self.pinned = 0
+            return
+        occupied = self.by_color[WHITE] | self.by_color[BLACK]
+        self.checkers = self.attackers_to(ksq, occupied) & self.by_color[them]
+        by_type = self.by_type
+        snipers = ((ROOK_PSEUDO[ksq] & (by_type[ROOK] | by_type[QUEEN]))
+                   | (BISHOP_PSEUDO[ksq] & (by_type[BISHOP] | by_type[QUEEN]))) & self.by_color[them]
+        pinned = 0
+        for sniper in squares(snipers):
+            b = BETWEEN_BB[ksq][sniper] & occupied & ~(1 << sniper)
+            if b and not b & (b - 1):
+                pinned |= b
+        self.pinned = pinned & self.by_color[us]
+
+    def in_check(self):
+        return self.checkers != 0
+
+    # Répétition de la position courante depuis le dernier coup irréversible : on ne
+    # compare que des clés, une position sur deux (même camp au trait), comme
+    # Position::is_repetition. `count` = nombre total d'occurrences, 3 pour la
+    # triple répétition.
+    def is_repetition(self, count=3):
+        end = min(self.rule50, self._ply)
+        seen = 1
+        for i in range(4, end + 1, 2):
+            if self._states[self._ply - i].key == self._key:
+                seen += 1
+                if seen >= count:
+                    return True
+        return False
+
+    # Ni pion, ni tour, ni dame, et au plus une pièce mineure (ou seulement des
+    # fous tous de la même couleur de case)
+    def insufficient_material(self):
+        by_type = self.by_type
+        if by_type[PAWN] | by_type[ROOK] | by_type[QUEEN]:
+            return False
+        minors = by_type[KNIGHT] | by_type[BISHOP]
+        if not minors & (minors - 1):
+            return True
+        bishops = by_type[BISHOP]
+        return not by_type[KNIGHT] and (not bishops & DARK_SQUARES_BB or not bishops & ~DARK_SQUARES_BB)
+
+    def pseudo_legal_moves(self):
+        moves = []
+        us = self.side_to_move
+        them = us ^ 1
+        own = self.by_color[us]
+        occupied = own | self.by_color[them]
+        targets = ~own & M64
+        enemies = self.by_color[them]
+
+        # Pions : poussées et prises calculées pour tous les pions à la fois
+        pawns = self.pieces(us, PAWN)
+        empty = ~occupied & M64
+        if us == WHITE:
+            push1 = (pawns << 8) & empty
+            push2 = ((push1 & RANK_3_BB) << 8) & empty
+            left = ((pawns & ~FILE_A_BB) << 7) & enemies
+            right = ((pawns & ~FILE_H_BB) << 9) & enemies
+            up, promo_rank = 8, RANK_8_BB
+        else:
+            push1 = (pawns >> 8) & empty
+            push2 = ((push1 & RANK_6_BB) >> 8) & empty
+            left = ((pawns & ~FILE_A_BB) >> 9) & enemies
+            right = ((pawns & ~FILE_H_BB) >> 7) & enemies
+            up, promo_rank = -8, RANK_1_BB
+        for b, delta in ((push1, up), (push2, 2 * up), (left, up - 1), (right, up + 1)):
+            for to in squares(b & ~promo_rank):
+                moves.append(((to - delta) << 6) | to)
+            for to in squares(b & promo_rank):
+                base = PROMOTION | ((to - delta) << 6) | to
+                for pt in (QUEEN, ROOK, BISHOP, KNIGHT):
+                    moves.append(base | ((pt - KNIGHT) << 12))
+        if self.ep_square != SQ_NONE:
+            for from_sq in squares(PAWN_ATTACKS[them][self.ep_square] & pawns):
+                moves.append(EN_PASSANT | (from_sq << 6) | self.ep_square)
+
+        for from_sq in squares(self.pieces(us, KNIGHT)):
+            for to in squares(KNIGHT_ATTACKS[from_sq] & targets):
+                moves.append((from_sq << 6) | to)
+        for from_sq in squares(self.pieces(us, BISHOP)):
+            for to in squares(bishop_attacks(from_sq, occupied) & targets):
+                moves.append((from_sq << 6) | to)
+        for from_sq in squares(self.pieces(us, ROOK)):
+            for to in squares(rook_attacks(from_sq, occupied) & targets):
+                moves.append((from_sq << 6) | to)
+        for from_sq in squares(self.pieces(us, QUEEN)):
+            for to in squares(queen_attacks(from_sq, occupied) & targets):
+                moves.append((from_sq << 6) | to)
+
+        ksq = self.king_square(us)
+        for to in squares(KING_ATTACKS[ksq] & targets):
+            moves.append((ksq << 6) | to)
+
+        # Roques : pas en échec, chemin libre et cases traversées non attaquées
+        if self.checkers:
+            return moves
+        rights = self.castling_rights & (WHITE_OO | WHITE_OOO if us == WHITE else BLACK_OO | BLACK_OOO)
+        for right in (WHITE_OO, WHITE_OOO, BLACK_OO, BLACK_OOO):
+            if not rights & right:
+                continue
+            kfrom, kto, rfrom, rto, path, safe = CASTLINGS[right]
+            if occupied & path:
+                continue
+            if any(self.is_attacked(s, them) for s in squares(safe)):
+                continue
+            moves.append(CASTLING | (kfrom << 6) | kto)
+        return moves
+
+    # Joue le coup sur place (aucune vérification de légalité) ; unmake_move() le défait
+    def make_move(self, move):
+        self._status = None
+        self._fen = None
+        if self._ply == len(self._states):
+            self._states.append(StateInfo())
+        st = self._states[self._ply]
+        self._ply += 1
+        st.move = move
+        st.castling_rights = self.castling_rights
+        st.ep_square = self.ep_square
+        st.rule50 = self.rule50
+        st.checkers = self.checkers
+        st.pinned = self.pinned
+        st.key = self._key
+        st.captured = NO_PIECE
+
+        us = self.side_to_move
+        them = us ^ 1
+        from_sq, to = (move >> 6) & 63, move & 63
+        mtype = move & (3 << 14)
+        pc = self.board[from_sq]
+        k = self._key ^ ZOBRIST_SIDE
+
+        self.rule50 += 1
+        if self.ep_square != SQ_NONE:
+            k ^= ZOBRIST_ENPASSANT[self.ep_square & 7]
+            self.ep_square = SQ_NONE
+        rights = self.castling_rights & ~(CASTLING_RIGHTS_MASK[from_sq] | CASTLING_RIGHTS_MASK[to])
+        if rights != self.castling_rights:
+            k ^= ZOBRIST_CASTLING[self.castling_rights] ^ ZOBRIST_CASTLING[rights]
+            self.castling_rights = rights
+
+        if mtype == CASTLING:
+            kfrom, kto, rfrom, rto, _, _ = CASTLINGS[
+                (WHITE_OO if to > from_sq else WHITE_OOO) << (2 * us)]
+            rook = self.board[rfrom]
+            k ^= (ZOBRIST_PSQ[pc][kfrom] ^ ZOBRIST_PSQ[pc][kto]
+                  ^ ZOBRIST_PSQ[rook][rfrom] ^ ZOBRIST_PSQ[rook][rto])
+            self._move_piece(kfrom, kto)
+            self._move_piece(rfrom, rto)
+        else:
+            if mtype == EN_PASSANT:
+                capsq = to - 8 if us == WHITE else to + 8
+                st.captured = self._remove_piece(capsq)
+                k ^= ZOBRIST_PSQ[st.captured][capsq]
+                self.rule50 = 0
+            elif self.board[to] != NO_PIECE:
+                st.captured = self._remove_piece(to)
+                k ^= ZOBRIST_PSQ[st.captured][to]
+                self.rule50 = 0
+            self._move_piece(from_sq, to)
+            k ^= ZOBRIST_PSQ[pc][from_sq] ^ ZOBRIST_PSQ[pc][to]
+            if type_of(pc) == PAWN:
+                self.rule50 = 0
+                if mtype == PROMOTION:
+                    promotion = make_piece(us, promotion_type(move))
+                    self._remove_piece(to)
+                    self._put_piece(promotion, to)
+                    k ^= ZOBRIST_PSQ[pc][to] ^ ZOBRIST_PSQ[promotion][to]
+                elif to ^ from_sq == 16:
+                    # case de prise en passant seulement si un pion adverse peut prendre
+                    ep = (to + from_sq) // 2
+                    if PAWN_ATTACKS[us][ep] & self.pieces(them, PAWN):
+                        self.ep_square = ep
+                        k ^= ZOBRIST_ENPASSANT[ep & 7]
+
+        self._key = k
+        self.side_to_move = them
+        self.game_ply += 1
+        self._set_check_info()
+
+    def unmake_move(self):
+        self._status = None
+        self._fen = None
+        self._ply -= 1
+        st = self._states[self._ply]
+        move = st.move
+        self.side_to_move ^= 1
+        self.game_ply -= 1
+        us = self.side_to_move
+        from_sq, to = (move >> 6) & 63, move & 63
+        mtype = move & (3 << 14)
+
+        if mtype == CASTLING:
+            kfrom, kto, rfrom, rto, _, _ = CASTLINGS[
+                (WHITE_OO if to > from_sq else WHITE_OOO) << (2 * us)]
+            self._move_piece(rto, rfrom)
+            self._move_piece(kto, kfrom)
+        else:
+            if mtype == PROMOTION:
+                self._remove_piece(to)
+                self._put_piece(make_piece(us, PAWN), to)
+            self._move_piece(to, from_sq)
+            if st.captured != NO_PIECE:
+                if mtype == EN_PASSANT:
+                    self._put_piece(st.captured, to - 8 if us == WHITE else to + 8)
+                else:
+                    self._put_piece(st.captured, to)
+
+        self.castling_rights = st.castling_rights
+        self.ep_square = st.ep_square
+        self.rule50 = st.rule50
+        self.checkers = st.checkers
+        self.pinned = st.pinned
+        self._key = st.key
+
+    # Légalité d'un coup pseudo-légal, sans le jouer sauf pour la prise en passant
+    # (comme Position::legal)
+    def is_legal(self, move):
+        us = self.side_to_move
+        from_sq, to = (move >> 6) & 63, move & 63
+        ksq = self.king_sq[us]
+
+        if move & (3 << 14) == EN_PASSANT:
+            self.make_move(move)
+            legal = not self.is_attacked(self.king_sq[us], us ^ 1)
+            self.unmake_move()
+            return legal
+
+        if from_sq == ksq:
+            if move & (3 << 14) == CASTLING:
+                return True  # cases déjà vérifiées à la génération
+            # le roi est retiré de l'occupation pour que les pièces à longue portée voient à travers
+            occupied = (self.by_color[WHITE] | self.by_color[BLACK]) ^ (1 << ksq)
+            return not self.is_attacked(to, us ^ 1, occupied)
+
+        checkers = self.checkers
+        if checkers:
+            # double échec : seul le roi peut bouger ; sinon prendre ou s'interposer
+            if checkers & (checkers - 1):
+                return False
+            if not BETWEEN_BB[ksq][lsb(checkers)] & (1 << to):
+                return False
+
+        # une pièce clouée ne peut bouger que sur la ligne roi-cloueur
+        return not self.pinned & (1 << from_sq) or bool(LINE_BB[from_sq][ksq] & (1 << to))
+
+    def legal_moves(self):
+        return [m for m in self.pseudo_legal_moves() if self.is_legal(m)]
+
+    # Coup légal correspondant à un déplacement case -> case (promotion en dame par défaut)
+    def find_move(self, from_sq, to_sq, promotion=QUEEN):
+        for m in game_status(self).legal_moves:
+            if move_from(m) == from_sq and move_to(m) == to_sq:
+                if move_type(m) != PROMOTION or promotion_type(m) == promotion:
+                    return m
+        return MOVE_NONE
+
+    def parse_uci(self, uci):
+        promotion = " nbrq".index(uci[4]) + 1 if len(uci) > 4 else QUEEN
+        return self.find_move(parse_square(uci[:2]), parse_square(uci[2:4]), promotion)
+
+    # Coup en notation algébrique ("Nbd7", "exd5", "e8=Q+", "O-O") ; MOVE_NONE si
+    # aucun coup légal ne correspond. Seuls les coups pseudo-légaux de la bonne pièce
+    # vers la bonne case passent le test de légalité.
+    def parse_san(self, san):
+        san = san.rstrip("+#!?")
+        us = self.side_to_move
+        if san in ("O-O", "0-0", "O-O-O", "0-0-0"):
+            kfrom, kto = CASTLINGS[(WHITE_OO if len(san) == 3 else WHITE_OOO) << (2 * us)][:2]
+            candidates = [m for m in self.pseudo_legal_moves()
+                          if move_type(m) == CASTLING and move_from(m) == kfrom and move_to(m) == kto]
+            return next((m for m in candidates if self.is_legal(m)), MOVE_NONE)
+
+        # un jeton illisible ("--", "Z0", "e8=") n'est pas un coup
+        match = SAN_RE.match(san)
+        if match is None:
+            return MOVE_NONE
+        piece, from_file, from_rank, to, promotion = match.groups()
+        piece_type = " PNBRQK".index(piece) if piece else PAWN
+        promotion = " PNBRQK".index(promotion.upper()) if promotion else NO_PIECE_TYPE
+        to = parse_square(to)
+        hint = (from_file or "") + (from_rank or "")
+
+        for m in self.pseudo_legal_moves():
+            from_sq = move_from(m)
+            if move_to(m) != to or type_of(self.board[from_sq]) != piece_type:
+                continue
+            if move_type(m) == CASTLING:
+                continue
+            if (move_type(m) == PROMOTION) != (promotion != NO_PIECE_TYPE):
+                continue
+            if promotion and promotion_type(m) != promotion:
+                continue
+            name = square_name(from_sq)
+            if any(ch not in name for ch in hint):
+                continue
+            if self.is_legal(m):
+                return m
+        return MOVE_NONE
+
+    # Notation algébrique d'un coup légal (inverse de parse_san) : la case de départ
+    # n'est précisée que si une autre pièce du même type peut aller sur la même case
+    def san(self, move):
+        from_sq, to = move_from(move), move_to(move)
+        if move_type(move) == CASTLING:
+            text = "O-O" if to > from_sq else "O-O-O"
+        else:
+            piece_type = type_of(self.board[from_sq])
+            capture = self.board[to] != NO_PIECE or move_type(move) == EN_PASSANT
+            name = square_name(from_sq)
+            if piece_type == PAWN:
+                text = name[0] + "x" if capture else ""
+            else:
+                text = " PNBRQK"[piece_type]
+                others = [square_name(move_from(m)) for m in game_status(self).legal_moves
+                          if m != move and move_to(m) == to
+                          and type_of(self.board[move_from(m)]) == piece_type]
+                if others:
+                    if all(other[0] != name[0] for other in others):
+                        text += name[0]
+                    elif all(other[1] != name[1] for other in others):
+                        text += name[1]
+                    else:
+                        text += name
+                if capture:
+                    text += "x"
+            text += square_name(to)
+            if move_type(move) == PROMOTION:
+                text += "=" + " PNBRQK"[promotion_type(move)]
+        self.make_move(move)
+        status = game_status(self)
+        if status.checkmate:
+            text += "#"
+        elif status.check:
+            text += "+"
+        self.unmake_move()
+        return text
+
+
+GameStatus = collections.namedtuple("GameStatus", "check checkmate stalemate draw legal_moves")
+
+
+# État de la partie en une seule génération de coups : échec, mat, pat, nulle
+# (50 coups ou matériel insuffisant) et liste des coups légaux. Le résultat est
+# gardé par la position jusqu'au prochain make_move / unmake_move.
+def game_status(position):
+    if position._status is not None:
+        return position._status
+    moves = position.legal_moves()
+    check = position.in_check()
+    checkmate = check and not moves
+    stalemate = not check and not moves
+    draw = stalemate or (not checkmate and (position.rule50 >= 100 or position.insufficient_material()
+                                            or position.is_repetition()))
+    position._status = GameStatus(check, checkmate, stalemate, draw, moves)
+    return position._status
@@ -1,6 +1,12 @@
+import asyncio
+import os
 import pygame
 import sys
-import stockfish as s
+import stockfish_class as s
+from eval_cache import EvalCache
+from gamestore import GameWriter, game_result
+from metrics import Metrics
+from position import Position, NO_PIECE, color_of, piece_name, move_uci, game_status
 
 # Constantes
 WIDTH, HEIGHT = 640, 640
@@ -8,14 +14,6 @@ EVAL_BAR_WIDTH = 20
 ROWS, COLS = 8, 8
 SQUARE_SIZE = WIDTH // COLS
 
-#coder le roque
-WHITE_KING_HAS_MOOVED = False
-BLACK_KING_HAS_MOOVED = False
-WHITE_Ra1_HAS_MOOVED = False
-WHITE_Rh1_HAS_MOOVED = False
-BLACK_Rh8_HAS_MOOVED = False
-BLACK_Ra8_HAS_MOOVED = False
-
 # Couleurs
 
 WHITE = pygame.Color("#f0d9b5")
@@ -37,24 +35,10 @@ for name in PIECE_NAMES:
     img = pygame.transform.scale(img, (SQUARE_SIZE, SQUARE_SIZE))
     pieces[name] = img
 
-# Position de départ simplifiée
-start_position = [
-    ["black-rook", "black-knight", "black-bishop", "black-queen", "black-king", "black-bishop", "black-knight", "black-rook"],
-    ["black-pawn"] * 8,
-    [None] * 8,
-    [None] * 8,
-    [None] * 8,
-    [None] * 8,
-    ["white-pawn"] * 8,
-    ["white-rook", "white-knight", "white-bishop", "white-queen", "white-king", "white-bishop", "white-knight", "white-rook"]
-]
-
-board = [row[:] for row in start_position]
+position = Position()
 selected = None
 moves = []
 
-current_turn = "white"  # Blancs commencent
-
 def hex_to_rgb(hex_color):
     if isinstance(hex_color, pygame.Color):
         return (hex_color.r, hex_color.g, hex_color.b)
@@ -63,390 +47,67 @@ def hex_to_rgb(hex_color):
 
 
 
-def draw_board():
-    king_pos = None
-    if Is_in_check(board=board):
-                 # Trouve le roi du joueur courant
-                king_color = current_turn
-                # print("king_color: ",king_color)
-                king_pos = None
-                for r in range(8):
-                    for c in range(8):
-                        if board[r][c] == f"{king_color}-king":
-                            king_pos = (r, c)
-                            break
-                    if king_pos:
-                        break
+# case bitboard (a1 = 0) <-> (ligne, colonne) à l'écran
+def to_square(row, col):
+    return (7 - row) * 8 + col
+
+def to_row_col(sq):
+    return 7 - (sq >> 3), sq & 7
+
+# Tout ce qui ne change jamais est rendu une seule fois : le fond de l'échiquier avec
+# ses coordonnées, et les calques de surlignage. Redessiner une case revient ensuite
+# à recopier un morceau du fond et à poser le calque et la pièce par-dessus.
+def make_overlay(color):
+    overlay = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
+    overlay.fill((*hex_to_rgb(color), 100))  # Ajout d'une transparence alpha
+    return overlay
+
+def render_background():
+    background = pygame.Surface((WIDTH, HEIGHT))
     for row in range(ROWS):
         for col in range(COLS):
             square_color = WHITE if (row + col) % 2 == 0 else BROWN
-            color = pygame.Color(square_color)
-
             rect = pygame.Rect(col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
-            pygame.draw.rect(screen, color, rect)
-
-            # Surlignage semi-transparent si case sélectionnée
-            if selected == (row, col):
-                highlight_surface = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
-                highlight_rgb = hex_to_rgb(HIGHLIGHT)
-                highlight_surface.fill((*highlight_rgb, 100))  # Ajout d'une transparence alphaq
-                screen.blit(highlight_surface, rect.topleft)
-            if king_pos != None and king_pos ==  (row, col):
-                highlight_surface = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
-                highlight_rgb = hex_to_rgb(CHECK)
-                highlight_surface.fill((*highlight_rgb, 100))  # Ajout d'une transparence alphaq
-                screen.blit(highlight_surface, rect.topleft)
-            
-
-                
-
-def draw_pieces():
-    for row in range(ROWS):
-        for col in range(COLS):
-            piece = board[row][col]
-            if piece:
-                screen.blit(pieces[piece], (col * SQUARE_SIZE, row * SQUARE_SIZE))
+            pygame.draw.rect(background, square_color, rect)
+    draw_labels(background)
+    return background
+
+# Ce qui est actuellement à l'écran, case par case : (pièce, sélectionnée, en échec)
+shown = [None] * 64
+
+def draw_square(sq, state):
+    piece, is_selected, in_check = state
+    row, col = to_row_col(sq)
+    rect = pygame.Rect(col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
+    screen.blit(background, rect, rect)
+    if is_selected:
+        screen.blit(selected_overlay, rect)
+    if in_check:
+        screen.blit(check_overlay, rect)
+    if piece != NO_PIECE:
+        screen.blit(pieces[piece_name(piece)], rect)
+    return rect
+
+# Redessine seulement les cases qui ont changé depuis la dernière image (coup joué,
+# sélection, échec) et renvoie les rectangles à mettre à jour
+def draw_board():
+    check_sq = None
+    if game_status(position).check:
+        # roi du joueur courant, position gardée à jour par Position
+        check_sq = position.king_square(position.side_to_move)
+    rects = []
+    for sq in range(64):
+        state = (position.board[sq], selected == to_row_col(sq), sq == check_sq)
+        if state != shown[sq]:
+            shown[sq] = state
+            rects.append(draw_square(sq, state))
+    return rects
 
 def pos_to_square(pos):
     col, row = pos
     return chr(col + ord('a')) + str(8 - row)
 
-def piece_color(piece_name):
-    if piece_name.startswith("white"):
-        return "white"
-    elif piece_name.startswith("black"):
-        return "black"
-    return None
-
-def is_valid_move(board, from_row, from_col, to_row, to_col, is_test = False):
-    piece = board[from_row][from_col]
-    if not piece:
-        return False
-    if not is_test:
-        if piece_color(piece) != current_turn:
-            return False
-        target_piece = board[to_row][to_col]
-        if target_piece and piece_color(target_piece) == current_turn:
-            return False
-    else:
-        target_piece = board[to_row][to_col]
-        # On autorise de capturer une pièce alliée en mode test (utile pour détecter les chemins),
-        # mais on interdit juste de capturer une pièce qui bloquerait l’attaque :
-        if target_piece and piece_color(target_piece) == piece_color(piece):
-            return False
-
-    dr = to_row - from_row
-    dc = to_col - from_col
-
-    # Pion
-    if piece.endswith("pawn"):
-        direction = -1 if piece_color(piece) == "white" else 1
-        start_row = 6 if piece_color(piece) == "white" else 1
-
-        # Avancer d'une case
-        if dc == 0 and dr == direction and target_piece is None:
-            return True
-        # Premier déplacement: avancer de deux cases
-        if dc == 0 and dr == 2*direction and from_row == start_row and board[from_row + direction][from_col] is None and target_piece is None:
-            return True
-        # Prise en diagonale
-        if abs(dc) == 1 and dr == direction and target_piece is not None and piece_color(target_piece) != piece_color(piece):
-            return True
-        return False
-
-    # Tour (déplacement en ligne droite, vérifier obstacles)
-    elif piece.endswith("rook"):
-        if dr != 0 and dc != 0:
-            return False
-        # Vérifier chemin libre
-        step_r = 0 if dr == 0 else (1 if dr > 0 else -1)
-        step_c = 0 if dc == 0 else (1 if dc > 0 else -1)
-        r, c = from_row + step_r, from_col + step_c
-        while (r != to_row or c != to_col):
-            if board[r][c] is not None:
-                return False
-            r += step_r
-            c += step_c
-        return True
-
-    # Cavalier (mouvement en L)
-    elif piece.endswith("knight"):
-        if (abs(dr), abs(dc)) in [(2,1),(1,2)]:
-            return True
-        return False
-
-    # Fou (diagonales, vérifier obstacles)
-    elif piece.endswith("bishop"):
-        if abs(dr) != abs(dc):
-            return False
-        step_r = 1 if dr > 0 else -1
-        step_c = 1 if dc > 0 else -1
-        r, c = from_row + step_r, from_col + step_c
-        while r != to_row or c != to_col:
-            if board[r][c] is not None:
-                return False
-            r += step_r
-            c += step_c
-        return True
-
-    # Reine (combinaison tour + fou)
-    elif piece.endswith("queen"):
-        # Si déplacement droit (tour)
-        if dr == 0 or dc == 0:
-            # réutiliser logique tour
-            step_r = 0 if dr == 0 else (1 if dr > 0 else -1)
-            step_c = 0 if dc == 0 else (1 if dc > 0 else -1)
-            r, c = from_row + step_r, from_col + step_c
-            while (r != to_row or c != to_col):
-                if board[r][c] is not None:
-                    return False
-                r += step_r
-                c += step_c
-            return True
-        # Si déplacement diagonal (fou)
-        if abs(dr) == abs(dc):
-            step_r = 1 if dr > 0 else -1
-            step_c = 1 if dc > 0 else -1
-            r, c = from_row + step_r, from_col + step_c
-            while r != to_row or c != to_col:
-                if board[r][c] is not None:
-                    return False
-                r += step_r
-                c += step_c
-            return True
-        return False
-
-    # Roi (mouvements d'une case dans toutes les directions)
-    elif piece.endswith("king"):
-        import copy 
-        if max(abs(dr), abs(dc)) == 1:
-            return True
-        elif current_turn == "white" and not WHITE_KING_HAS_MOOVED and not WHITE_Rh1_HAS_MOOVED and dc == 2:
-            step_r = 0 if dr == 0 else (1 if dr > 0 else -1)
-            step_c = 0 if dc == 0 else (1 if dc > 0 else -1)
-            r, c = from_row + step_r, from_col + step_c
-            while (r != to_row or c != to_col):
-                if board[r][c] is not None:
-                    return False
-                r += step_r
-                c += step_c
-            temp_board = copy.deepcopy(board)
-            temp_board[7][6] = temp_board[7][5]
-            temp_board[7][5] = None
-            if Is_in_check(temp_board):
-                return(False)
-            temp_board[7][7] = temp_board[7][6]
-            temp_board[7][6] = None
-            if Is_in_check(temp_board):
-                return(False)
-            return True
-        elif current_turn == "white" and not WHITE_KING_HAS_MOOVED and not WHITE_Ra1_HAS_MOOVED and dc == -2:
-            step_r = 0 if dr == 0 else (1 if dr > 0 else -1)
-            step_c = 0 if dc == 0 else (1 if dc > 0 else -1)
-            r, c = from_row + step_r, from_col + step_c
-            while (r != to_row or c != to_col):
-                if board[r][c] is not None:
-                    return False
-                r += step_r
-                c += step_c
-            temp_board = copy.deepcopy(board)
-            temp_board[7][3] = temp_board[7][4]
-            temp_board[7][4] = None
-            print(temp_board)
-            if Is_in_check(temp_board):
-                return(False)
-            temp_board[7][2] = temp_board[7][3]
-            temp_board[7][2] = None
-            if Is_in_check(temp_board):
-                return(False)
-            return True
-        elif current_turn == "black" and not BLACK_KING_HAS_MOOVED and not BLACK_Ra8_HAS_MOOVED and dc == -2:
-            step_r = 0 if dr == 0 else (1 if dr > 0 else -1)
-            step_c = 0 if dc == 0 else (1 if dc > 0 else -1)
-            r, c = from_row + step_r, from_col + step_c
-            while (r != to_row or c != to_col):
-                if board[r][c] is not None:
-                    return False
-                r += step_r
-                c += step_c
-            temp_board = copy.deepcopy(board)
-            temp_board[0][3] = temp_board[7][4]
-            temp_board[0][4] = None
-            print(temp_board)
-            if Is_in_check(temp_board):
-                return(False)
-            temp_board[0][2] = temp_board[0][3]
-            temp_board[0][2] = None
-            if Is_in_check(temp_board):
-                return(False)
-            return True
-        elif current_turn == "black" and not BLACK_KING_HAS_MOOVED and not BLACK_Rh8_HAS_MOOVED and dc == 2:
-            step_r = 0 if dr == 0 else (1 if dr > 0 else -1)
-            step_c = 0 if dc == 0 else (1 if dc > 0 else -1)
-            r, c = from_row + step_r, from_col + step_c
-            while (r != to_row or c != to_col):
-                if board[r][c] is not None:
-                    return False
-                r += step_r
-                c += step_c
-            temp_board = copy.deepcopy(board)
-            temp_board[0][5] = temp_board[0][4]
-            temp_board[0][4] = None
-            if Is_in_check(temp_board):
-                return(False)
-            temp_board[0][6] = temp_board[0][5]
-            temp_board[0][5] = None
-            if Is_in_check(temp_board):
-                return(False)
-        return False
-
-    return False
-
-# vérifie si une fois la pièce bougée, le roi se situe en échec : si c'est le cas return false (mouvement illégal)
-def verify_check(board, from_row, from_col, to_row, to_col):
-    import copy
-    temp_board = copy.deepcopy(board)
-
-    # Simule le déplacement
-    piece = temp_board[from_row][from_col]
-    temp_board[to_row][to_col] = piece
-    temp_board[from_row][from_col] = None
-
-    return not Is_in_check(temp_board)  # Le roi est en sécurité si il n'est pas en échec
-
-# Vérifie si le joueur courant est en échec
-def Is_in_check(board):
-    
-    # Trouve le roi du joueur courant
-    king_color = current_turn
-    # print("king_color: ",king_color)
-    king_pos = None
-    for r in range(8):
-        for c in range(8):
-            if board[r][c] == f"{king_color}-king":
-                king_pos = (r, c)
-                break
-        if king_pos:
-            break
-
-    # Vérifie si une pièce adverse peut l'attaquer
-    # print("Test de mouvement de", piece, "en", pos_to_square((to_col, to_row)))
-    # print("Position du roi : ", king_pos)
-    # print("Attaques potentielles après déplacement :")
-    for r in range(8):
-        for c in range(8):
-            attacker = board[r][c]
-            if attacker and piece_color(attacker) != king_color:
-                if is_valid_move(board, r, c, king_pos[0], king_pos[1], True):
-                # print(f"  {attacker} en {pos_to_square((c,r))} peut attaquer le roi en {pos_to_square((king_pos[1], king_pos[0]))}")
-                    return True  # Le roi serait en échec
-    return False
-
-# Vérifie si le joueur courant est en échec et mat
-def is_in_checkmate(board, color):
-    if Is_in_check(board) != True: # pour être en echec et mat, il faut d'abord être en échec !
-        return False
-    for r in range(8):
-        for c in range(8):
-            piece = board[r][c]
-            if piece and piece_color(piece) == color:
-                valid_moves = get_valid_moves_for_piece(board, r, c)
-                for r2, c2 in valid_moves:
-                    # Vérifie si le roi est toujours en sécurité
-                    if  verify_check(board, r,c,r2,c2):
-                        return False  # Au moins un coup légal sauve le roi
-    return True  # Aucun coup ne sauve → échec et mat
-
-def is_stalemate(board, color):
-    # Vérifie si le roi est déjà en échec : si oui, ce n'est pas un pat
-    if Is_in_check(board) == True:
-        return False
-    for r in range(8):
-        for c in range(8):
-            piece = board[r][c]
-            if piece and piece_color(piece) == color:
-                valid_moves = get_valid_moves_for_piece(board, r, c)
-                for r2, c2 in valid_moves:
-                    if verify_check(board, r, c, r2, c2):
-                        return False  # Au moins un coup légal → pas de pat
-
-    return True  # Aucun coup légal et roi pas en échec → pat
-
-
-def get_valid_moves_for_piece(board, from_row, from_col):
-    piece = board[from_row][from_col]
-    if not piece:
-        return []
-
-    color = piece_color(piece)
-    directions = []
-    moves = []
-
-    def add_move(r, c):
-        if 0 <= r < 8 and 0 <= c < 8:
-            target = board[r][c]
-            if target is None:
-                moves.append((r, c))
-                return True  # continue moving
-            elif piece_color(target) != color:
-                moves.append((r, c))
-                return False  # stop after capture
-            else:
-                return False  # blocked by own piece
-        return False
-
-    if piece.endswith("pawn"):
-        direction = -1 if color == "white" else 1
-        start_row = 6 if color == "white" else 1
-
-        # Forward
-        if board[from_row + direction][from_col] is None:
-            moves.append((from_row + direction, from_col))
-            # Double move
-            if from_row == start_row and board[from_row + 2 * direction][from_col] is None:
-                moves.append((from_row + 2 * direction, from_col))
-
-        # Captures
-        for dc in [-1, 1]:
-            r, c = from_row + direction, from_col + dc
-            if 0 <= r < 8 and 0 <= c < 8:
-                target = board[r][c]
-                if target and piece_color(target) != color:
-                    moves.append((r, c))
-
-    elif piece.endswith("rook"):
-        directions = [(-1, 0), (1, 0), (0, -1), (0, 1)]
-    elif piece.endswith("bishop"):
-        directions = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
-    elif piece.endswith("queen"):
-        directions = [(-1, 0), (1, 0), (0, -1), (0, 1),
-                      (-1, -1), (-1, 1), (1, -1), (1, 1)]
-    elif piece.endswith("king"):
-        directions = [(-1, 0), (1, 0), (0, -1), (0, 1),
-                      (-1, -1), (-1, 1), (1, -1), (1, 1)]
-        for dr, dc in directions:
-            r, c = from_row + dr, from_col + dc
-            add_move(r, c)
-        return moves
-    elif piece.endswith("knight"):
-        steps = [(2, 1), (1, 2), (-1, 2), (-2, 1),
-                 (-2, -1), (-1, -2), (1, -2), (2, -1)]
-        for dr, dc in steps:
-            r, c = from_row + dr, from_col + dc
-            add_move(r, c)
-        return moves
-
-    # For rook, bishop, queen
-    for dr, dc in directions:
-        r, c = from_row + dr, from_col + dc
-        while add_move(r, c):
-            r += dr
-            c += dc
-
-    return moves
-
-
-def draw_labels():
+def draw_labels(surface):
     padding = 5  # un petit décalage du bord
     # Lettres (a-h) en bas à gauche des cases de la dernière rangée (row 7)
     for col in range(COLS):
@@ -455,7 +116,7 @@ def draw_labels():
         x = col * SQUARE_SIZE + padding
         y = (ROWS - 1) * SQUARE_SIZE + SQUARE_SIZE - padding
         text_rect = text.get_rect(bottomleft=(x, y))
-        screen.blit(text, text_rect)
+        surface.blit(text, text_rect)
 
     # Chiffres (8-1) en haut à gauche des cases de la première colonne (col 0)
     for row in range(ROWS):
@@ -464,40 +125,30 @@ def draw_labels():
         x = padding
         y = row * SQUARE_SIZE + padding
         text_rect = text.get_rect(topleft=(x, y))
-        screen.blit(text, text_rect)
-
-def board_to_fen(board):
-    piece_to_fen = {
-        "white-pawn": "P", "white-rook": "R", "white-knight": "N", "white-bishop": "B", "white-queen": "Q", "white-king": "K",
-        "black-pawn": "p", "black-rook": "r", "black-knight": "n", "black-bishop": "b", "black-queen": "q", "black-king": "k"
-    }
-    fen_rows = []
-    for row in board:
-        empty = 0
-        fen_row = ""
-        for cell in row:
-            if cell is None:
-                empty += 1
-            else:
-                if empty > 0:
-                    fen_row += str(empty)
-                    empty = 0
-                fen_row += piece_to_fen[cell]
-        if empty > 0:
-            fen_row += str(empty)
-        fen_rows.append(fen_row)
-    fen = "/".join(fen_rows)
-    fen += " " + ("w" if current_turn == "white" else "b") + " - - 0 1"  # Simplification, pas de roque ni échec
-    return fen
-
-def stockfish_move():
-    stockfish.go(movetime=50)
-    eval = stockfish.get_eval()
-    # mettre à jour un état partagé, ex :
-    global evaluation
-    evaluation = eval
-
-def draw_eval_bar(eval_score):
+        surface.blit(text, text_rect)
+
+background = render_background()
+selected_overlay = make_overlay(HIGHLIGHT)
+check_overlay = make_overlay(CHECK)
+
+# Le moteur et le cache donnent l'éval du point de vue du camp au trait ; la barre
+# l'affiche du point de vue des blancs
+def white_eval(score, fen):
+    if score is None:
+        return None
+    return -score if fen.split()[1] == "b" else score
+
+EVAL_BAR_RECT = pygame.Rect(WIDTH, 0, EVAL_BAR_WIDTH, HEIGHT)
+shown_eval = None
+
+# La barre n'est redessinée que si l'éval ou la profondeur affichées changent ;
+# renvoie le rectangle à mettre à jour, ou None
+def draw_eval_bar(eval_score, depth=None):
+    global shown_eval
+    eval_text = s.format_eval(eval_score)  # "M3" pour un mat, sinon en pions
+    if (eval_text, depth) == shown_eval:
+        return None
+    shown_eval = (eval_text, depth)
     max_eval = 5  # +5 pions max affiché, au-delà on bloque la barre
 
     bar_height = HEIGHT
@@ -520,7 +171,6 @@ def draw_eval_bar(eval_score):
     pygame.draw.line(screen, (100, 100, 100), (bar_x, middle), (bar_x + EVAL_BAR_WIDTH, middle), 2)
 
     # Texte d'évaluation centré verticalement dans la barre
-    eval_text = f"{eval_score:.2f}"
     # Texte noir sur fond clair, blanc sur fond foncé : ici je propose noir partout, puisque fond global est gris clair
     text_color = (0, 0, 0)
     text_surface = font.render(eval_text, True, text_color)
@@ -530,87 +180,195 @@ def draw_eval_bar(eval_score):
 
     screen.blit(text_surface, text_rect)
 
-stockfish = s.Stockfish(path = "stockfish\\stockfish-windows-x86-64-avx2.exe")
-stockfish.set_depth(15)
+    # profondeur atteinte, en bas de la barre
+    if depth:
+        depth_surface = font.render(str(depth), True, (128, 128, 128))
+        screen.blit(depth_surface, depth_surface.get_rect(midbottom=(bar_x + EVAL_BAR_WIDTH // 2, bar_height - 2)))
+    return EVAL_BAR_RECT
+
+# Meilleure ligne dans le titre de la fenêtre
+def show_pv(eval_score, depth, pv):
+    caption = "Échiquier Pygame"
+    if pv:
+        caption += f"  {s.format_eval(eval_score)}  prof. {depth}  {' '.join(pv[:8])}"
+    if pygame.display.get_caption()[0] != caption:
+        pygame.display.set_caption(caption)
+
+STOCKFISH_PATH = "stockfish\\stockfish-windows-x86-64-avx2.exe"
+ANALYSIS_DEPTH = 15
+# Analyse continue : "go infinite" tant que la position ne change pas, la barre
+# s'affine au fil des profondeurs. Sinon, une analyse à ANALYSIS_DEPTH par position.
+CONTINUOUS_ANALYSIS = True
+FPS = 30  # au plus 30 images par seconde ; entre deux, la boucle dort
+# Fichier où écrire les mesures (latences UCI, profondeur, nps, cache) en quittant :
+# "metrics.prom" pour Prometheus, "metrics.json" sinon ; None pour ne rien mesurer
+METRICS_PATH = None
+GAMES_PATH = "games"  # base où chaque partie jouée est ajoutée en quittant (gamestore.py)
+evaluation = 0
+analysis_depth = 0
+analysis_pv = []
+
+
+# Suit l'analyse infinie de la position courante : chaque profondeur terminée met à
+# jour la barre (si elle va plus loin que ce qui est affiché) et le cache, qui n'est
+# écrit qu'une fois par nouvelle profondeur. Dès qu'un coup est joué, la tâche
+# suivante envoie "stop" avant la nouvelle position, ce qui termine celle-ci.
+async def watch_position(stockfish, cache, game, key, fen):
+    global evaluation, analysis_depth, analysis_pv
+    stored_depth = 0
+    try:
+        async for info in stockfish.analyse_game_stream(game, fen=fen):
+            if info.multipv not in (None, 1) or info.bound is not None or not info.pv:
+                continue
+            if info.depth > stored_depth:
+                cache.put(fen, {"depth": info.depth, "eval": info.eval, "bestmove": info.pv[0]})
+                stored_depth = info.depth
+            if position.key() == key and info.depth > analysis_depth:
+                evaluation, analysis_depth, analysis_pv = white_eval(info.eval, fen), info.depth, info.pv
+    except (TimeoutError, EOFError) as e:
+        print("Stockfish :", e)
 
 
 # Boucle principale
-while True:
+async def main():
+    global selected, evaluation, analysis_depth, analysis_pv
+
+    # ponder : pendant que le joueur réfléchit, le moteur analyse déjà le coup attendu
+    # (inutile en analyse continue, le moteur ne s'arrête jamais de lui-même)
+    # réglages mesurés par autotune.py pour cette machine, s'il a été lancé
+    profile = "interactive" if os.path.exists(s.PROFILES_PATH) else None
+    metrics = Metrics() if METRICS_PATH else None
+    # spare : un moteur de réserve déjà initialisé remplace tout de suite un moteur
+    # planté ou bloqué
+    stockfish = s.AsyncStockfish(path=STOCKFISH_PATH, ponder=not CONTINUOUS_ANALYSIS, profile=profile,
+                                 metrics=metrics, spare=True)
+    # le moteur charge son réseau pendant que la fenêtre s'affiche ; l'analyse
+    # commence dès qu'il est prêt
+    starting = asyncio.create_task(stockfish.start())
+    engine_ready = False
+    cache = EvalCache("eval_cache.sqlite", metrics=metrics)
+    search = None        # tâche d'analyse en arrière-plan
+    watcher = None       # tâche qui suit l'analyse continue
+    stopping = None      # tâche qui arrête une analyse devenue inutile
+    analysed_key = None  # clé de Zobrist de la position envoyée au moteur
+    analysed_fen = None
+
+    # première image complète, ensuite seulement les zones modifiées
     draw_board()
-    draw_labels()
-    draw_pieces()
+    draw_eval_bar(evaluation)
     pygame.display.flip()
 
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            print("Coups joués :", moves)
-            pygame.quit()
-            sys.exit()
-
-        if event.type == pygame.MOUSEBUTTONDOWN:
-            x, y = event.pos
-            row = y // SQUARE_SIZE
-            col = x // SQUARE_SIZE
-
-            if selected:
-                from_row, from_col = selected
-                piece = board[from_row][from_col]
-                if piece:
-                    if is_valid_move(board, from_row, from_col, row, col) and verify_check(board, from_row, from_col, row, col):
+    while True:
+        rects = draw_board()
+        bar = draw_eval_bar(evaluation, analysis_depth)
+        show_pv(evaluation, analysis_depth, analysis_pv)
+        if bar is not None:
+            rects.append(bar)
+        if rects:
+            pygame.display.update(rects)
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                print("Coups joués :", moves)
+                if moves:
+                    with GameWriter(GAMES_PATH) as writer:
+                        print("Partie enregistrée :", writer.add(moves, game_result(position)))
+                await asyncio.gather(starting, return_exceptions=True)
+                await stockfish.quit()
+                cache.close()
+                if metrics is not None:
+                    metrics.dump(METRICS_PATH)
+                pygame.quit()
+                sys.exit()
+
+            if event.type == pygame.MOUSEBUTTONDOWN:
+                x, y = event.pos
+                row = y // SQUARE_SIZE
+                col = x // SQUARE_SIZE
+
+                if selected:
+                    move = position.find_move(to_square(*selected), to_square(row, col))
+                    if move:
                         # Enregistrement du coup
-                        move = pos_to_square((from_col, from_row)) + pos_to_square((col, row))
-                        moves.append(move)
-
-                        # Déplacement
-                        if board[from_row][from_col][6:] == "king" and col - from_col == 2:
-                            board[row][col] = piece
-                            board[from_row][from_col] = None
-                            board[row][col-1] = board[row][col+1]
-                            board[row][col+1] = None
-                            if current_turn == "white":
-                                WHITE_KING_HAS_MOOVED = True
-                            else:
-                                BLACK_KING_HAS_MOOVED = True
-                        elif board[from_row][from_col][6:] == "king" and col - from_col == -2:
-                            board[row][col] = piece
-                            board[from_row][from_col] = None
-                            board[row][col+1] = board[row][col-2]
-                            board[row][col-2] = None
-                            if current_turn == "white":
-                                WHITE_KING_HAS_MOOVED = True
-                            else:
-                                BLACK_KING_HAS_MOOVED = True
-                        elif board[from_row][from_col][6:] == "king" and abs(col - from_col) == 1 and current_turn == "white":
-                            WHITE_KING_HAS_MOOVED = True
-                        elif board[from_row][from_col][6:] == "king" and abs(col - from_col) == 1 and current_turn == "black":
-                            BLACK_KING_HAS_MOOVED = True
-                        elif board[from_row][from_col][6:] == "rook" and (from_row,from_col) == (7,0) and current_turn == "white":
-                            WHITE_Ra1_HAS_MOOVED = True
-                        elif board[from_row][from_col][6:] == "rook" and (from_row,from_col) == (7,7) and current_turn == "white":
-                            WHITE_Rh1_HAS_MOOVED = True
-                        elif board[from_row][from_col][6:] == "rook" and (from_row,from_col) == (0,0) and current_turn == "black":
-                            BLACK_Ra8_HAS_MOOVED = True
-                        elif board[from_row][from_col][6:] == "rook" and (from_row,from_col) == (0,7) and current_turn == "black":
-                            BLACK_Rh8_HAS_MOOVED = True
-
-                        board[row][col] = piece 
-                        board[from_row][from_col] = None
-
-                        # Changer de joueur
-                        current_turn = "black" if current_turn == "white" else "white"
+                        moves.append(move_uci(move))
+                        position.make_move(move)
+
+                        # un seul calcul de l'état de la partie par coup joué
+                        status = game_status(position)
+                        if status.checkmate:
+                            print("maaaaaat!!!")
+                        elif status.stalemate:
+                            print("GROS PAT")
+                            print("T'es mauvais Jack")
+                        elif status.draw:
+                            print("Nulle")
                     else:
                         print("Mouvement illégal !")
-                selected = None
+                    selected = None
+                else:
+                    piece = position.piece_on(to_square(row, col))
+                    if piece != NO_PIECE and color_of(piece) == position.side_to_move:
+                        selected = (row, col)
+
+        if not engine_ready:
+            if starting.done():
+                starting.result()  # un moteur introuvable arrête tout, comme avant
+                engine_ready = True
+        elif not stockfish.is_alive():
+            # planté ou bloqué : relancé (depuis la réserve) avec ses options, puis la
+            # position courante est de nouveau analysée
+            print("Stockfish s'est arrêté, redémarrage")
+            await stockfish.restart()
+            analysed_key = None
+
+        # On ne relance le moteur que si la position a changé et n'est pas déjà dans
+        # le cache ; l'ancienne recherche est arrêtée et son résultat ignoré. La clé
+        # de Zobrist suffit pour voir le changement, la FEN n'est construite qu'alors.
+        if engine_ready and position.key() != analysed_key:
+            analysed_key = position.key()
+            fen = analysed_fen = position.fen()
+            if CONTINUOUS_ANALYSIS:
+                # le cache donne tout de suite une première éval, l'analyse infinie
+                # ne l'écrase qu'une fois allée plus profond
+                evaluation, analysis_depth, analysis_pv = 0, 0, []
+                cached = cache.get(fen, depth=1)
+                if cached is not None:
+                    evaluation, analysis_depth = white_eval(cached["eval"], fen), cached["depth"]
+                watcher = asyncio.create_task(
+                    watch_position(stockfish, cache, list(moves), analysed_key, fen))
+            else:
+                cached = cache.get(fen, depth=ANALYSIS_DEPTH)
+                if cached is not None:
+                    evaluation = white_eval(cached["eval"], fen)
+                    if stockfish.is_searching() and stopping is None:
+                        stopping = asyncio.create_task(stockfish.stop())
+                else:
+                    # le moteur reçoit la partie entière ("position startpos moves ...")
+                    search = asyncio.create_task(
+                        stockfish.analyse_game(list(moves), fen=fen, depth=ANALYSIS_DEPTH))
+        if search is not None and search.done():
+            try:
+                result = search.result()
+            except (TimeoutError, EOFError) as e:
+                print("Stockfish :", e)
             else:
-                if board[row][col] and piece_color(board[row][col]) == current_turn:
-                    selected = (row, col)
-    fen = board_to_fen(board)
-    stockfish.set_fen_position(fen)
-    eval_cp = stockfish.get_evaluation()
-    draw_eval_bar(eval_cp["value"]/100)
-    if is_in_checkmate(board,current_turn):
-        print("maaaaaat!!!")
-    if is_stalemate(board, current_turn):
-        print("GROS PAT")
-        print("T'es mauvais Jack")
-# testing commit 
\ No newline at end of file
+                if result["eval"] is not None:
+                    # même interrompue, l'analyse reste valable pour sa position
+                    cache.put(result["fen"], result)
+                if result["fen"] == analysed_fen and result["eval"] is not None:
+                    evaluation = white_eval(result["eval"], result["fen"])
+            search = None
+        if stopping is not None and stopping.done():
+            try:
+                stopping.result()
+            except (TimeoutError, EOFError) as e:
+                print("Stockfish :", e)
+            stopping = None
+
+        # Attente jusqu'à l'image suivante : pas de boucle à 100 % d'un coeur, et
+        # asyncio en profite pour lire la sortie du moteur. (pygame.event.wait()
+        # bloquerait aussi la lecture du moteur.)
+        await asyncio.sleep(1 / FPS)
+
+
+asyncio.run(main())
@@ -0,0 +1,223 @@
+import sqlite3
+
+from position import Position, START_FEN
+
+
+# SQLite ne stocke que des entiers signés sur 64 bits
+def _signed(key):
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+
+def _unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+# Répertoire d'ouvertures : un graphe orienté sans cycle dont les noeuds sont les
+# positions (clé de Zobrist, donc les transpositions tombent sur le même noeud) et
+# les arcs les coups. Tout vit dans SQLite : chaque modification est une simple
+# écriture, rien n'est reconstruit, même avec des centaines de milliers de noeuds.
+class Repertoire:
+    def __init__(self, path="repertoire.sqlite", commit_every=1000):
+        self.commit_every = commit_every
+        self._pending = 0
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS nodes ("
+            "key INTEGER PRIMARY KEY, fen TEXT, ply INTEGER, depth INTEGER, eval REAL, "
+            "bestmove TEXT, comment TEXT)"
+        )
+        # eval : score de la ligne multipv du parent (None pour un coup ajouté à la main)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS moves ("
+            "parent INTEGER, move TEXT, child INTEGER, eval REAL, annotation TEXT, "
+            "PRIMARY KEY (parent, move))"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS moves_child ON moves (child)")
+        # comptes issus de bases de parties (pgn.py), cumulés d'un import à l'autre
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS stats ("
+            "key INTEGER, move TEXT, games INTEGER, white INTEGER, draws INTEGER, black INTEGER, "
+            "PRIMARY KEY (key, move))"
+        )
+
+    def _written(self):
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.flush()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
+
+    def __contains__(self, key):
+        return self.db.execute(
+            "SELECT 1 FROM nodes WHERE key = ?", (_signed(key),)
+        ).fetchone() is not None
+
+    # Ajoute la position si elle est nouvelle ; une transposition atteinte plus tôt
+    # garde le plus petit ply. Renvoie la clé.
+    def add_position(self, position, ply=0):
+        key = position.key()
+        self.db.execute(
+            "INSERT INTO nodes (key, fen, ply) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET ply = MIN(ply, excluded.ply)",
+            (_signed(key), position.fen(), ply),
+        )
+        self._written()
+        return key
+
+    def add_fen(self, fen=START_FEN, ply=0):
+        return self.add_position(Position(fen), ply)
+
+    # Joue `uci` depuis le noeud `parent` et enregistre l'arc ; renvoie la clé du fils
+    def add_move(self, parent, uci, eval=None):
+        node = self.node(parent)
+        if node is None:
+            raise KeyError(f"position inconnue : {parent:016x}")
+        position = Position(node["fen"])
+        position.make_move(position.parse_uci(uci))
+        child = self.add_position(position, node["ply"] + 1)
+        self._add_edge(parent, uci, child, eval)
+        return child
+
+    def _add_edge(self, parent, uci, child, eval=None):
+        self.db.execute(
+            "INSERT INTO moves (parent, move, child, eval) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (parent, move) DO UPDATE SET eval = COALESCE(excluded.eval, eval)",
+            (_signed(parent), uci, _signed(child), eval),
+        )
+        self._written()
+
+    # Ajoute une suite de coups depuis `fen` ; renvoie les clés des positions traversées
+    def add_line(self, moves, fen=START_FEN):
+        position = Position(fen)
+        keys = [self.add_position(position)]
+        for ply, uci in enumerate(moves, 1):
+            position.make_move(position.parse_uci(uci))
+            keys.append(self.add_position(position, ply))
+            self._add_edge(keys[-2], uci, keys[-1])
+        return keys
+
+    def node(self, key):
+        row = self.db.execute(
+            "SELECT fen, ply, depth, eval, bestmove, comment FROM nodes WHERE key = ?",
+            (_signed(key),),
+        ).fetchone()
+        if row is None:
+            return None
+        return {"key": key, "fen": row[0], "ply": row[1], "depth": row[2], "eval": row[3],
+                "bestmove": row[4], "comment": row[5]}
+
+    # Coups déjà connus depuis une position, les meilleurs (pour le camp au trait) d'abord
+    def children(self, key):
+        rows = self.db.execute(
+            "SELECT move, child, eval, annotation FROM moves WHERE parent = ? "
+            "ORDER BY eval IS NULL, eval DESC",
+            (_signed(key),),
+        )
+        return [{"move": r[0], "child": _unsigned(r[1]), "eval": r[2], "annotation": r[3]}
+                for r in rows]
+
+    # Toutes les façons d'arriver à une position (plusieurs en cas de transposition)
+    def parents(self, key):
+        rows = self.db.execute(
+            "SELECT parent, move FROM moves WHERE child = ?", (_signed(key),)
+        )
+        return [(_unsigned(r[0]), r[1]) for r in rows]
+
+    # Ajoute des comptes {(clé, coup): [parties, gains blancs, nulles, gains noirs]}
+    def add_stats(self, stats):
+        self.db.executemany(
+            "INSERT INTO stats VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (key, move) DO UPDATE SET "
+            "games = games + excluded.games, white = white + excluded.white, "
+            "draws = draws + excluded.draws, black = black + excluded.black",
+            ((_signed(key), move, *counts) for (key, move), counts in stats.items()),
+        )
+        self.flush()
+
+    # Coups joués depuis une position dans les bases importées, les plus joués d'abord
+    def stats(self, key):
+        rows = self.db.execute(
+            "SELECT move, games, white, draws, black FROM stats WHERE key = ? ORDER BY games DESC",
+            (_signed(key),),
+        )
+        return [{"move": r[0], "games": r[1], "white": r[2], "draws": r[3], "black": r[4]}
+                for r in rows]
+
+    # Tous les coups du répertoire, (fen du parent, coup, comptes importés ou None),
+    # groupés par position
+    def edges(self):
+        rows = self.db.execute(
+            "SELECT n.fen, m.move, s.games, s.white, s.draws, s.black FROM moves m "
+            "JOIN nodes n ON n.key = m.parent "
+            "LEFT JOIN stats s ON s.key = m.parent AND s.move = m.move ORDER BY m.parent"
+        )
+        for r in rows:
+            yield r[0], r[1], (r[2:] if r[2] is not None else None)
+
+    def annotate(self, key, comment):
+        self.db.execute("UPDATE nodes SET comment = ? WHERE key = ?", (comment, _signed(key)))
+        self._written()
+
+    # Annotation d'un coup ("!", "?!", "mon coup", ...)
+    def annotate_move(self, key, uci, annotation):
+        self.db.execute(
+            "UPDATE moves SET annotation = ? WHERE parent = ? AND move = ?",
+            (annotation, _signed(key), uci),
+        )
+        self._written()
+
+    # Enregistre l'analyse d'une position et ses coups candidats (une ligne multipv
+    # par coup) ; une analyse plus profonde déjà connue n'est pas écrasée
+    def set_analysis(self, key, result):
+        node = self.node(key)
+        if node["depth"] is not None and node["depth"] >= result["depth"]:
+            return
+        self.db.execute(
+            "UPDATE nodes SET depth = ?, eval = ?, bestmove = ? WHERE key = ?",
+            (result["depth"], result["eval"], result["bestmove"], _signed(key)),
+        )
+        self._written()
+        for line in result["lines"]:
+            if line.pv:
+                self.add_move(key, line.pv[0], line.eval)
+
+    # Expansion en largeur jusqu'à `max_ply` demi-coups depuis `fen`. Chaque rangée
+    # est analysée par paquets de `batch` positions avec `engine` (StockfishPool.map,
+    # en parallèle, ou Stockfish.analyse_many) ; les positions déjà analysées assez
+    # profondément ne repassent pas au moteur. Tous les coups connus d'une position
+    # sont suivis : les candidats du moteur (MultiPV) et ceux ajoutés à la main.
+    # Le travail est enregistré après chaque paquet, on peut donc reprendre une
+    # expansion interrompue.
+    def expand(self, engine, max_ply, fen=START_FEN, depth=None, movetime=None, batch=64):
+        analyse = engine.map if hasattr(engine, "map") else engine.analyse_many
+        root = self.add_fen(fen)
+        seen = {root}
+        frontier = [root]
+        for _ in range(max_ply):
+            next_frontier = []
+            for start in range(0, len(frontier), batch):
+                nodes = [self.node(key) for key in frontier[start:start + batch]]
+                todo = [node for node in nodes
+                        if node["depth"] is None or (depth is not None and node["depth"] < depth)]
+                if todo:
+                    results = analyse([node["fen"] for node in todo], movetime=movetime, depth=depth)
+                    for node, result in zip(todo, results):
+                        self.set_analysis(node["key"], result)
+                for node in nodes:
+                    for child in self.children(node["key"]):
+                        if child["child"] not in seen:
+                            seen.add(child["child"])
+                            next_frontier.append(child["child"])
+                self.flush()
+            frontier = next_frontier
+        return len(seen)
+
+    def flush(self):
+        self.db.commit()
+        self._pending = 0
+
+    def close(self):
+        self.flush()
+        self.db.close()
@@ -1,55 +1,986 @@
+import asyncio
+import atexit
+import collections
+import concurrent.futures
+import json
+import os
+import queue
 import subprocess
+import threading
+import time
+
+from metrics import NPS_BUCKETS
+
+
+# Un mat en n coups vaut ±(MATE_VALUE - n) pions : toujours plus qu'une éval normale,
+# et un mat plus court vaut plus qu'un mat plus long
+MATE_VALUE = 1000
+
+INFO_FIELDS = ("depth", "seldepth", "multipv", "cp", "mate", "bound", "wdl",
+               "nodes", "nps", "hashfull", "tbhits", "time", "pv")
+INT_FIELDS = ("depth", "seldepth", "multipv", "nodes", "nps", "hashfull", "tbhits", "time")
+
+
+# Une ligne "info" du moteur, champs typés (None si absent)
+class Info(collections.namedtuple("Info", INFO_FIELDS, defaults=(None,) * len(INFO_FIELDS))):
+    __slots__ = ()
+
+    # score en pions du point de vue du camp au trait
+    @property
+    def eval(self):
+        if self.mate is not None:
+            # "mate 0" : le camp au trait est mat
+            return MATE_VALUE - self.mate if self.mate > 0 else -MATE_VALUE - self.mate
+        if self.cp is not None:
+            return self.cp / 100
+        return None
+
+
+def parse_info(text):
+    parts = text.split()
+    if not parts or parts[0] != "info" or "string" in parts[1:2]:
+        return None
+    fields = {}
+    i = 1
+    while i < len(parts):
+        token = parts[i]
+        if token in INT_FIELDS and i + 1 < len(parts):
+            fields[token] = int(parts[i + 1])
+            i += 2
+        elif token == "score" and i + 2 < len(parts):
+            fields["cp" if parts[i + 1] == "cp" else "mate"] = int(parts[i + 2])
+            i += 3
+        elif token in ("lowerbound", "upperbound"):
+            fields["bound"] = token
+            i += 1
+        elif token == "wdl" and i + 3 < len(parts):
+            fields["wdl"] = tuple(int(x) for x in parts[i + 1:i + 4])
+            i += 4
+        elif token == "pv":
+            fields["pv"] = parts[i + 1:]
+            break
+        elif token == "string":
+            break
+        else:
+            i += 1
+    return Info(**fields)
+
+
+def mate_in(score):
+    # nombre de coups avant mat si le score (en pions) est un score de mat, sinon None
+    if score is None or abs(score) < MATE_VALUE - 500:
+        return None
+    return MATE_VALUE - score if score > 0 else -MATE_VALUE - score
+
+
+def format_eval(score):
+    mate = mate_in(score)
+    if mate is not None:
+        return f"M{mate}" if mate > 0 else f"-M{-mate}"
+    return f"{score:.2f}"
+
+
+def new_search(fen=None):
+    return {"fen": fen, "eval": None, "mate": None, "depth": 0, "pv": [],
+            "bestmove": None, "ponder": None, "lines": {}}
+
+
+# Met à jour une recherche avec une ligne de sortie du moteur. Chaque ligne multipv a
+# son emplacement, et un résultat plus profond remplace un résultat moins profond.
+# Renvoie l'Info lue, ou None si la ligne n'apporte pas de score.
+def update_search(search, text):
+    if text.startswith("bestmove"):
+        parts = text.split()
+        search["bestmove"] = parts[1]
+        if len(parts) > 3 and parts[2] == "ponder":
+            search["ponder"] = parts[3]
+        return None
+    info = parse_info(text)
+    if info is None or info.eval is None:
+        return None
+    slot = info.multipv or 1
+    old = search["lines"].get(slot)
+    if old is None or (info.depth or 0) >= (old.depth or 0):
+        search["lines"][slot] = info
+    if slot == 1:
+        search["eval"] = info.eval
+        search["mate"] = info.mate
+        search["depth"] = info.depth or 0
+        search["pv"] = info.pv or []
+    return info
+
+
+# Résultat public d'une recherche : les lignes multipv dans l'ordre
+def search_result(search):
+    result = {key: value for key, value in search.items()
+              if key not in ("future", "updates", "game", "started", "first_info")}
+    result["lines"] = [search["lines"][k] for k in sorted(search["lines"])]
+    return result
+
+
+# Commande "position" d'une partie : position de départ (ou `fen`) puis les coups
+# joués, pour que le moteur connaisse l'historique (répétitions, règle des 50 coups)
+def position_command(moves, fen=None):
+    command = f"position fen {fen}" if fen else "position startpos"
+    if moves:
+        command += " moves " + " ".join(moves)
+    return command
+
+
+def go_command(movetime=None, depth=None):
+    return f"go depth {depth}" if depth is not None else f"go movetime {movetime or 100}"
+
+
+# Mesures d'une recherche terminée (voir metrics.Metrics) : temps jusqu'à la
+# première ligne "info" et jusqu'au "bestmove", noeuds et nps de la ligne principale
+def observe_search(metrics, search, started, first_info=None):
+    now = time.perf_counter()
+    metrics.count("positions_analysed")
+    metrics.observe("search_bestmove_seconds", now - started)
+    if first_info is not None:
+        metrics.observe("search_first_info_seconds", first_info - started)
+    line = search["lines"].get(1)
+    if line is not None:
+        if line.nodes:
+            metrics.count("nodes_searched", line.nodes)
+        if line.nps:
+            metrics.observe("search_nps", line.nps, NPS_BUCKETS)
+            metrics.set("last_nps", line.nps)
+
+
+# Profils de réglage écrits par autotune.py : {"interactive": {...}, "batch": {...}},
+# chacun avec les options UCI à envoyer ("Threads", "Hash", ...) et, pour un pool,
+# le nombre de moteurs ("size")
+PROFILES_PATH = "engine_profiles.json"
+
+
+def load_profile(profile, path=PROFILES_PATH):
+    if isinstance(profile, dict):
+        return profile
+    with open(path) as f:
+        return json.load(f)[profile]
+
+
+# Nombre de cases dont le contenu diffère entre deux FEN : deux positions proches
+# (coups consécutifs d'une même partie) partagent leurs entrées de table de hachage
+def board_distance(fen_a, fen_b):
+    def expand(fen):
+        board = fen.split()[0]
+        for n in "12345678":
+            board = board.replace(n, "." * int(n))
+        return board.replace("/", "")
+    return sum(a != b for a, b in zip(expand(fen_a), expand(fen_b)))
+
+
+# Lit la sortie du moteur dans un thread et la découpe en lignes pour `lines` ;
+# None à la fin du flux. select() ne marche pas sur un pipe sous Windows, un
+# thread et une Queue (get avec timeout) marchent partout.
+def _pump(stdout, lines):
+    buffer = b""
+    while True:
+        try:
+            data = stdout.read(65536)
+        except (OSError, ValueError):
+            data = b""
+        if not data:
+            lines.put(None)
+            return
+        buffer += data
+        *complete, buffer = buffer.split(b"\n")
+        for line in complete:
+            lines.put(line)
+
+
+# Moteurs de réserve, un par chemin : lancés et initialisés ("uci", "isready", donc
+# réseau chargé) dans un thread, en attendant qu'un Stockfish(spare=True) en ait
+# besoin au démarrage ou après un plantage
+_spares = {}
+_spares_lock = threading.Lock()
+
+
+def prespawn(path, timeout=30):
+    with _spares_lock:
+        if path in _spares:
+            return
+        holder = {}
+
+        def launch():
+            try:
+                holder["engine"] = Stockfish(path, timeout=timeout)
+            except (EOFError, OSError):
+                pass
+
+        thread = threading.Thread(target=launch, daemon=True)
+        thread.start()
+        _spares[path] = (thread, holder)
+
+
+# Moteur de réserve pour `path` (attend la fin de son initialisation), None s'il n'y
+# en a pas ou s'il est mort entre-temps
+def _take_spare(path):
+    with _spares_lock:
+        spare = _spares.pop(path, None)
+    if spare is None:
+        return None
+    thread, holder = spare
+    thread.join()
+    engine = holder.get("engine")
+    return engine if engine is not None and engine.is_alive() else None
+
+
+# Les réserves inutilisées ne survivent pas au programme
+@atexit.register
+def discard_spares():
+    with _spares_lock:
+        spares = list(_spares.values())
+        _spares.clear()
+    for thread, holder in spares:
+        thread.join()
+        if "engine" in holder:
+            holder["engine"]._close_process()
+
 
 class Stockfish:
-    def __init__(self, path):
-        self.process = subprocess.Popen(
-            path,
-            universal_newlines=True,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            bufsize=1,
-        )
-        self._send_command("uci")
-        self._wait_for("uciok")
+    # `profile` : nom d'un profil de PROFILES_PATH ("interactive", "batch") ou dict ;
+    # `metrics` : metrics.Metrics qui reçoit les temps de réponse du moteur ;
+    # `timeout` : secondes de silence avant de considérer le moteur bloqué ;
+    # `auto_restart` : un moteur mort ou bloqué est relancé (voir restart()) ;
+    # `spare` : un moteur de réserve déjà initialisé est gardé pour le prochain
+    # démarrage (celui-ci s'il a été préparé par prespawn()) ou redémarrage
+    def __init__(self, path, profile=None, metrics=None, timeout=30, auto_restart=True, spare=False):
+        self.path = path
+        self.metrics = metrics
+        self.timeout = timeout
+        self.auto_restart = auto_restart
+        self.spare = spare
+        self.restarts = 0
+        self.options = {}      # options envoyées, dans l'ordre, ré-appliquées au redémarrage
+        self._position = None  # dernière commande "position"
+        self._last_go = None   # dernière commande "go"
+        self.process = self._lines = None
+        self._sent_at = spawned = time.perf_counter()
+        self._launch()
+        if profile is not None:
+            for name, value in load_profile(profile)["options"].items():
+                self.set_option(name, value)
         self._send_command("isready")
         self._wait_for("readyok")
+        if metrics is not None:
+            metrics.count("engines_started")
+            metrics.observe("engine_spawn_seconds", time.perf_counter() - spawned)
+        if spare:
+            prespawn(path, timeout)
+
+    # Nouveau processus après le handshake "uci" ; pris dans la réserve si possible
+    def _launch(self):
+        spare = _take_spare(self.path) if self.spare else None
+        if spare is not None:
+            # le thread de lecture de la réserve continue de remplir sa file
+            self.process, self._lines = spare.process, spare._lines
+        else:
+            self.process = subprocess.Popen(self.path, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                            bufsize=0)
+            self._lines = queue.Queue()
+            threading.Thread(target=_pump, args=(self.process.stdout, self._lines), daemon=True).start()
+        if spare is None:
+            self._send_command("uci")
+            self._wait_for("uciok")
+
+    def _close_process(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        for pipe in (self.process.stdin, self.process.stdout):
+            try:
+                pipe.close()
+            except OSError:
+                pass
+
+    # Relance le moteur (mort, bloqué, ou à la demande) et lui redonne son état : les
+    # options envoyées et la dernière position. Une recherche en cours est perdue,
+    # c'est à l'appelant de la relancer.
+    def restart(self):
+        self._close_process()
+        self._launch()
+        for name, value in self.options.items():
+            self._send_command(f"setoption name {name} value {value}")
+        if self._position is not None:
+            self._send_command(self._position)
+        self._send_command("isready")
+        self._wait_for("readyok")
+        self.restarts += 1
+        if self.metrics is not None:
+            self.metrics.count("engine_restarts")
+        if self.spare:
+            prespawn(self.path, self.timeout)
 
     def _send_command(self, command):
-        self.process.stdin.write(command + "\n")
-        self.process.stdin.flush()
+        if self.process.poll() is not None:
+            raise EOFError("le processus Stockfish s'est arrêté")
+        self.process.stdin.write((command + "\n").encode())
+        self._sent_at = time.perf_counter()
+        if command.startswith("position"):
+            self._position = command
+        elif command.startswith("go"):
+            self._last_go = command
+        if self.metrics is not None:
+            self.metrics.count(f"uci_{command.split()[0]}_commands")
+
+    # Une ligne de sortie, en attendant au plus `timeout` secondes. Un moteur muet
+    # trop longtemps est tué : on ne sait plus dans quel état il est.
+    def _readline(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            line = self._lines.get(timeout=timeout)
+        except queue.Empty:
+            self.process.kill()
+            raise TimeoutError(f"Stockfish ne répond plus depuis {timeout}s") from None
+        if line is None:
+            # fin du flux : les lectures suivantes la voient aussi
+            self._lines.put(None)
+            raise EOFError("le processus Stockfish s'est arrêté")
+        return line.decode().strip()
 
     def _wait_for(self, keyword):
         while True:
-            text = self.process.stdout.readline().strip()
+            text = self._readline()
             if keyword in text:
                 break
+        if self.metrics is not None:
+            self.metrics.observe(f"uci_{keyword}_seconds", time.perf_counter() - self._sent_at)
+
+    # Exécute `operation`, et si le moteur meurt ou se bloque en route, le relance
+    # et recommence une fois (TimeoutError est un OSError)
+    def _recover(self, operation, *args):
+        try:
+            return operation(*args)
+        except (EOFError, OSError):
+            if not self.auto_restart:
+                raise
+        self.restart()
+        return operation(*args)
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def isready(self):
+        def ready():
+            self._send_command("isready")
+            self._wait_for("readyok")
+        self._recover(ready)
+
+    def set_option(self, name, value):
+        self.options[name] = value
+        self._recover(self._send_command, f"setoption name {name} value {value}")
+
+    # Nombre de meilleures lignes calculées par une même recherche
+    def set_multipv(self, lines):
+        self.set_option("MultiPV", lines)
 
     def set_position(self, fen):
-        self._send_command(f"position fen {fen}")
+        self._recover(self._send_command, f"position fen {fen}")
+
+    # Nouvelle partie : le moteur vide sa table de hachage
+    def new_game(self):
+        self._recover(self._send_command, "ucinewgame")
+        self.isready()
+
+    # Position d'une partie en cours, coups compris (voir position_command)
+    def set_moves(self, moves, fen=None):
+        self._recover(self._send_command, position_command(moves, fen))
 
     def go(self, movetime=100):
-        self._send_command(f"go movetime {movetime}")
+        self._recover(self._send_command, f"go movetime {movetime}")
 
+    # Éval finale (en pions) de la recherche lancée par go() / go_depth()
     def get_eval(self):
+        search = new_search()
+        for _ in self.info_stream(search):
+            pass
+        return search["eval"]
+
+    # Générateur des lignes "info" de la recherche en cours, jusqu'au "bestmove" ;
+    # `search` contient à la fin le résultat complet. Si le moteur meurt en route,
+    # la recherche repart de zéro sur le moteur relancé (une fois).
+    def info_stream(self, search=None):
+        if search is None:
+            search = new_search()
+        started, first_info = self._sent_at, None
+        retried = False
+        while search["bestmove"] is None:
+            try:
+                text = self._readline()
+            except (EOFError, OSError):
+                if retried or not self.auto_restart or self._last_go is None:
+                    raise
+                retried = True
+                go = self._last_go
+                self.restart()
+                search.update(new_search(search["fen"]))
+                self._send_command(go)
+                continue
+            info = update_search(search, text)
+            if info is not None:
+                if first_info is None:
+                    first_info = time.perf_counter()
+                yield info
+        if self.metrics is not None:
+            observe_search(self.metrics, search, started, first_info)
+
+    def _go(self, movetime=None, depth=None):
+        self._recover(self._send_command, go_command(movetime, depth))
+
+    # Analyse complète d'une position : lit la sortie jusqu'au "bestmove"
+    def analyse(self, fen, movetime=None, depth=None):
+        self.set_position(fen)
+        self._go(movetime, depth)
+        search = new_search(fen)
+        for _ in self.info_stream(search):
+            pass
+        return search_result(search)
+
+    # Même chose, mais en donnant chaque Info au fur et à mesure de la recherche
+    def analyse_stream(self, fen, movetime=None, depth=None):
+        self.set_position(fen)
+        self._go(movetime, depth)
+        yield from self.info_stream(new_search(fen))
+
+    # Analyse d'une suite de positions sur ce seul processus. Les paires position/go
+    # sont envoyées d'avance (au plus `window` recherches en attente) : Stockfish
+    # attend la fin d'une recherche avant de traiter la commande suivante, et chaque
+    # "bestmove" termine la recherche la plus ancienne, dans l'ordre d'envoi.
+    # Seulement pour une limite en profondeur : Stockfish note l'heure de départ
+    # d'une recherche en lisant son "go" (uci.cpp), un "go movetime" en attente
+    # aurait déjà consommé son temps en commençant. En movetime, chaque "go" part
+    # donc après le "bestmove" précédent.
+    # `newgame` : True = "ucinewgame" avant chaque position, False = jamais,
+    # "auto" = seulement quand la position n'a rien à voir avec la précédente, pour
+    # garder la table de hachage entre les coups d'une même partie.
+    def analyse_many(self, fens, movetime=None, depth=None, window=8, newgame="auto"):
+        fens = list(fens)
+        if depth is None:
+            window = 1
+        results = []
+        pending = collections.deque()
+        previous = None
+        sent = 0
+        failed_at = None
+        while len(results) < len(fens):
+            try:
+                while sent < len(fens) and len(pending) < window:
+                    fen = fens[sent]
+                    if newgame is True or (newgame == "auto" and previous is not None
+                                           and board_distance(previous, fen) > 4):
+                        self._send_command("ucinewgame")
+                    self._send_command(f"position fen {fen}")
+                    self._send_command(go_command(movetime, depth))
+                    pending.append(new_search(fen))
+                    previous = fen
+                    sent += 1
+                # la recherche commence quand la précédente se termine
+                search = pending[0]
+                started = self._sent_at if window == 1 or not results else finished
+                first_info = None
+                while search["bestmove"] is None:
+                    if update_search(search, self._readline()) is not None and first_info is None:
+                        first_info = time.perf_counter()
+            except (EOFError, OSError):
+                # moteur relancé, les recherches en attente sont renvoyées ; deux
+                # échecs de suite sur la même position, on abandonne
+                if not self.auto_restart or failed_at == len(results):
+                    raise
+                failed_at = len(results)
+                self.restart()
+                pending.clear()
+                sent = len(results)
+                previous = None
+                finished = time.perf_counter()
+                continue
+            finished = time.perf_counter()
+            if self.metrics is not None:
+                observe_search(self.metrics, search, started, first_info)
+            results.append(search_result(pending.popleft()))
+        return results
+
+    # "go perft" du moteur (stockfish/src/perft.h) : nombre de feuilles par coup
+    # et total
+    def perft(self, fen, depth):
+        return self._recover(self._perft, fen, depth)
+
+    def _perft(self, fen, depth):
+        self.set_position(fen)
+        self._send_command(f"go perft {depth}")
+        divide = {}
         while True:
-            text = self.process.stdout.readline().strip()
-            if text.startswith("info") and "score cp" in text:
-                parts = text.split()
-                if "score" in parts:
-                    i = parts.index("score")
-                    if parts[i+1] == "cp":
-                        return int(parts[i+2]) / 100  # score centipawns → pawns
-                    elif parts[i+1] == "mate":
-                        mate_in = int(parts[i+2])
-                        # Eval mate = grande valeur avec signe
-                        return 10000 if mate_in > 0 else -10000
-            elif text.startswith("bestmove"):
-                break
-        return None
+            text = self._readline()
+            if text.startswith("Nodes searched"):
+                return divide, int(text.split(":")[1])
+            if ":" in text and not text.startswith("info"):
+                move, count = text.split(":")
+                divide[move.strip()] = int(count)
 
-    def quit(self):
-        self._send_command("quit")
-        self.process.terminate()
+    # "quit", puis on laisse au moteur `timeout` secondes pour s'arrêter avant de le tuer
+    def quit(self, timeout=5):
+        try:
+            self._send_command("quit")
+            self.process.wait(timeout)
+        except (EOFError, OSError, subprocess.TimeoutExpired):
+            pass
+        self._close_process()
 
     def go_depth(self, depth=15):
-        self._send_command(f"go depth {depth}")
\ No newline at end of file
+        self._recover(self._send_command, f"go depth {depth}")
+
+    def go_nodes(self, nodes):
+        self._recover(self._send_command, f"go nodes {nodes}")
+
+
+# Pool de N moteurs : chaque thread pilote son propre processus Stockfish, donc les
+# analyses tournent en parallèle sur tous les coeurs (le GIL n'est pas un problème,
+# les threads ne font qu'attendre les pipes).
+class StockfishPool:
+    # Un profil (voir load_profile) fixe les options et la taille par défaut du pool ;
+    # `threads` et `hash` passés explicitement l'emportent sur le profil
+    def __init__(self, path, size=None, threads=None, hash=None, max_retries=2, multipv=1, profile=None,
+                 metrics=None, spare=False):
+        self.path = path
+        self.metrics = metrics
+        self.spare = spare
+        self.options = {"Threads": 1, "Hash": 16}
+        if profile is not None:
+            profile = load_profile(profile)
+            self.options.update(profile["options"])
+            size = size or profile.get("size")
+        if threads is not None:
+            self.options["Threads"] = threads
+        if hash is not None:
+            self.options["Hash"] = hash
+        self.size = size or os.cpu_count() or 1
+        self.multipv = multipv
+        self.max_retries = max_retries
+        self.restarts = 0
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        # Les moteurs sont lancés ici pour qu'un mauvais chemin échoue tout de suite
+        engines = [self._spawn() for _ in range(self.size)]
+        self._workers = [
+            threading.Thread(target=self._work, args=(engine,), daemon=True)
+            for engine in engines
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    # Sans auto_restart : un moteur qui meurt pendant une analyse remonte l'erreur à
+    # _work, qui le relance une seule fois et remet la position dans la file
+    def _spawn(self):
+        engine = Stockfish(self.path, metrics=self.metrics, auto_restart=False, spare=self.spare)
+        for name, value in self.options.items():
+            engine.set_option(name, value)
+        if self.multipv > 1:
+            engine.set_multipv(self.multipv)
+        engine.isready()
+        return engine
+
+    # Le moteur se relance lui-même avec ses options (Stockfish.restart)
+    def _respawn(self, engine):
+        with self._lock:
+            self.restarts += 1
+        engine.restart()
+        return engine
+
+    def _work(self, engine):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            future, fen, limits, attempts, queued = job
+            if attempts == 0 and not future.set_running_or_notify_cancel():
+                continue
+            if self.metrics is not None:
+                # attente dans la file : si elle grandit, il manque des moteurs
+                self.metrics.observe("pool_queue_seconds", time.perf_counter() - queued)
+            try:
+                # Vérification de santé avant chaque position
+                if not engine.is_alive():
+                    engine = self._respawn(engine)
+                result = engine.analyse(fen, **limits)
+            except (EOFError, OSError) as e:
+                # Le moteur est mort pendant l'analyse : on le relance et on remet
+                # la position dans la file
+                try:
+                    engine = self._respawn(engine)
+                except (EOFError, OSError):
+                    pass
+                if attempts < self.max_retries:
+                    self._jobs.put((future, fen, limits, attempts + 1, time.perf_counter()))
+                else:
+                    future.set_exception(e)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+        if engine.is_alive():
+            engine.quit()
+
+    def submit(self, fen, movetime=None, depth=None):
+        future = concurrent.futures.Future()
+        self._jobs.put((future, fen, {"movetime": movetime, "depth": depth}, 0, time.perf_counter()))
+        if self.metrics is not None:
+            self.metrics.set("pool_queue_depth", self._jobs.qsize())
+        return future
+
+    # Résultats dans l'ordre des positions
+    def map(self, fens, movetime=None, depth=None):
+        futures = [self.submit(fen, movetime, depth) for fen in fens]
+        return [future.result() for future in futures]
+
+    # Résultats au fur et à mesure qu'ils arrivent
+    def as_completed(self, fens, movetime=None, depth=None):
+        futures = [self.submit(fen, movetime, depth) for fen in fens]
+        for future in concurrent.futures.as_completed(futures):
+            yield future.result()
+
+    def close(self):
+        for _ in self._workers:
+            self._jobs.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Client asyncio : toutes les lectures passent par une seule tâche (_read_loop) qui
+# distribue les lignes, donc la boucle pygame n'est jamais bloquée par le moteur.
+class AsyncStockfish:
+    # `spare` : un moteur de réserve est préparé en tâche de fond après le démarrage,
+    # restart() le prend au lieu d'attendre un nouveau processus
+    def __init__(self, path, timeout=10, ponder=False, profile=None, metrics=None, spare=False):
+        self.path = path
+        self.profile = profile
+        self.metrics = metrics
+        self.spare = spare
+        self._sent_at = 0
+        self.timeout = timeout  # secondes de silence avant de considérer le moteur bloqué
+        self.ponder = ponder     # réfléchir sur le coup attendu entre deux analyses
+        self._pondering = None   # recherche "go ponder" en cours
+        self._generation = 0     # change à chaque stop() : une analyse dépassée ne lance pas de ponder
+        self.process = None
+        self._reader = None
+        self._waiters = []     # (mot-clé, future) en attente d'une réponse
+        self._searches = []    # recherches en cours, dans l'ordre des "go" envoyés
+        self._last_output = 0
+        self.options = {}      # options envoyées, ré-appliquées par restart()
+        self._position = None  # dernière commande "position" (hors ponder)
+        self._spare = None     # tâche qui prépare le moteur de réserve
+        self._killed = None
+        self.restarts = 0
+
+    async def start(self):
+        spawned = time.perf_counter()
+        spare = await self._take_spare()
+        if spare is not None:
+            # la réserve a déjà fait "uci" et "isready" : on reprend son processus
+            spare._reader.cancel()
+            await asyncio.gather(spare._reader, return_exceptions=True)
+            self.process = spare.process
+        else:
+            self.process = await asyncio.create_subprocess_exec(
+                self.path,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+            )
+        self._last_output = time.monotonic()
+        self._reader = asyncio.create_task(self._read_loop())
+        if spare is None:
+            await self._send_command("uci")
+            await self._wait_for("uciok")
+        if self.profile is not None:
+            for name, value in load_profile(self.profile)["options"].items():
+                await self.set_option(name, value)
+        if self.ponder:
+            await self.set_option("Ponder", "true")
+        await self.isready()
+        if self.metrics is not None:
+            self.metrics.count("engines_started")
+            self.metrics.observe("engine_spawn_seconds", time.perf_counter() - spawned)
+        if self.spare and self._spare is None:
+            self._spare = asyncio.create_task(self._prespawn())
+
+    async def _prespawn(self):
+        engine = AsyncStockfish(self.path, self.timeout)
+        try:
+            await engine.start()
+        except (OSError, EOFError):
+            return None
+        return engine
+
+    async def _take_spare(self):
+        task, self._spare = self._spare, None
+        if task is None:
+            return None
+        engine = await task
+        return engine if engine is not None and engine.is_alive() else None
+
+    def is_alive(self):
+        return (self.process is not None and self.process.returncode is None
+                and self._killed is not self.process and not self._reader.done())
+
+    # Un seul signal par processus, et aucun s'il a déjà fermé sa sortie : un kill()
+    # sur un processus fini mais pas encore signalé à asyncio le ferait récolter à
+    # sa place
+    def _kill(self):
+        if (self.process is None or self.process.returncode is not None
+                or self._killed is self.process or self._reader.done()):
+            return
+        self._killed = self.process
+        self.process.kill()
+
+    # Relance le moteur (mort, bloqué ou à la demande) et lui redonne ses options et
+    # sa dernière position ; les recherches en cours échouent avec EOFError
+    async def restart(self):
+        self._kill()
+        if self.process is not None:
+            await self.process.wait()
+        if self._reader is not None:
+            await self._reader
+        self._pondering = None
+        options, position = self.options, self._position
+        self.options = {}
+        await self.start()
+        for name, value in options.items():
+            if self.options.get(name) != value:
+                await self.set_option(name, value)
+        if position is not None:
+            await self._send_command(position)
+            self._position = position
+        await self.isready()
+        self.restarts += 1
+        if self.metrics is not None:
+            self.metrics.count("engine_restarts")
+
+    async def _send_command(self, command):
+        self.process.stdin.write((command + "\n").encode())
+        await self.process.stdin.drain()
+        self._sent_at = time.perf_counter()
+        if self.metrics is not None:
+            self.metrics.count(f"uci_{command.split()[0]}_commands")
+
+    async def _read_loop(self):
+        while True:
+            line = await self.process.stdout.readline()
+            if not line:
+                break
+            self._last_output = time.monotonic()
+            text = line.decode().strip()
+
+            if text.startswith("info") and self._searches:
+                search = self._searches[0]
+                info = update_search(search, text)
+                if info is not None:
+                    if search["first_info"] is None:
+                        search["first_info"] = time.perf_counter()
+                    search["updates"].put_nowait(info)
+            elif text.startswith("bestmove") and self._searches:
+                search = self._searches.pop(0)
+                update_search(search, text)
+                if self.metrics is not None:
+                    observe_search(self.metrics, search, search["started"], search["first_info"])
+                search["updates"].put_nowait(None)
+                if not search["future"].done():
+                    search["future"].set_result(search)
+
+            for waiter in self._waiters[:]:
+                keyword, future = waiter
+                if keyword in text:
+                    self._waiters.remove(waiter)
+                    if not future.done():
+                        future.set_result(text)
+
+        # Fin de flux : le moteur est mort, on réveille tout le monde
+        error = EOFError("le processus Stockfish s'est arrêté")
+        for _, future in self._waiters:
+            if not future.done():
+                future.set_exception(error)
+        for search in self._searches:
+            search["updates"].put_nowait(None)
+            if not search["future"].done():
+                search["future"].set_exception(error)
+        self._waiters = []
+        self._searches = []
+
+    async def _wait(self, future, timeout=None):
+        # Attend une réponse tant que le moteur continue à écrire ; lève TimeoutError
+        # s'il reste muet plus de `timeout` secondes.
+        timeout = self.timeout if timeout is None else timeout
+        while True:
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), timeout)
+            except asyncio.TimeoutError:
+                if time.monotonic() - self._last_output >= timeout:
+                    # moteur bloqué : tué, restart() en relancera un ; l'EOFError que
+                    # recevra `future` n'intéresse plus personne
+                    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+                    self._kill()
+                    raise TimeoutError(f"Stockfish ne répond plus depuis {timeout}s") from None
+
+    async def _wait_for(self, keyword, timeout=None):
+        if self._reader.done():
+            raise EOFError("le processus Stockfish s'est arrêté")
+        future = asyncio.get_running_loop().create_future()
+        waiter = (keyword, future)
+        self._waiters.append(waiter)
+        try:
+            result = await self._wait(future, timeout)
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        if self.metrics is not None:
+            self.metrics.observe(f"uci_{keyword}_seconds", time.perf_counter() - self._sent_at)
+        return result
+
+    def is_searching(self):
+        return bool(self._searches)
+
+    async def isready(self, timeout=None):
+        await self._send_command("isready")
+        await self._wait_for("readyok", timeout)
+
+    async def set_option(self, name, value):
+        self.options[name] = value
+        await self._send_command(f"setoption name {name} value {value}")
+
+    async def set_multipv(self, lines):
+        await self.set_option("MultiPV", lines)
+
+    async def set_position(self, fen):
+        # Changer de position annule la recherche en cours
+        if self._searches:
+            await self.stop()
+        self._position = f"position fen {fen}"
+        await self._send_command(self._position)
+
+    async def set_moves(self, moves, fen=None):
+        if self._searches:
+            await self.stop()
+        self._position = position_command(moves, fen)
+        await self._send_command(self._position)
+
+    async def _start_search(self, movetime=None, depth=None, fen=None, ponder=False):
+        if self._reader.done():
+            raise EOFError("le processus Stockfish s'est arrêté")
+        search = new_search(fen)
+        search["future"] = asyncio.get_running_loop().create_future()
+        search["updates"] = asyncio.Queue()  # Info au fur et à mesure, None à la fin
+        search["started"] = time.perf_counter()
+        search["first_info"] = None
+        self._searches.append(search)
+        command = "go ponder" if ponder else "go"
+        if movetime is not None:
+            command += f" movetime {movetime}"
+        if depth is not None:
+            command += f" depth {depth}"
+        if movetime is None and depth is None:
+            command += " infinite"
+        await self._send_command(command)
+        return search
+
+    async def go(self, movetime=None, depth=None, timeout=None, fen=None):
+        search = await self._start_search(movetime, depth, fen)
+        await self._wait(search["future"], timeout)
+        return search_result(search)
+
+    async def stop(self, timeout=None):
+        self._pondering = None
+        self._generation += 1
+        if not self._searches:
+            return
+        future = self._searches[-1]["future"]
+        await self._send_command("stop")
+        await self._wait(future, timeout)
+
+    async def analyse(self, fen, movetime=None, depth=None, timeout=None):
+        await self.set_position(fen)
+        return await self.go(movetime=movetime, depth=depth, timeout=timeout, fen=fen)
+
+    # Analyse de la position après `moves` (depuis la position de départ ou
+    # `start_fen`) ; `fen` sert seulement d'étiquette au résultat. Le moteur reçoit
+    # l'historique de la partie et garde son état d'un coup à l'autre. En mode
+    # ponder, il réfléchit ensuite sur le coup qu'il attend : si c'est bien le coup
+    # joué, "ponderhit" prolonge cette recherche déjà avancée au lieu d'en repartir
+    # de zéro.
+    async def analyse_game(self, moves, start_fen=None, fen=None, movetime=None, depth=None,
+                           timeout=None):
+        moves = list(moves)
+        search = self._pondering
+        self._pondering = None
+        if search is not None and search["game"] == (start_fen, moves):
+            search["fen"] = fen
+            await self._send_command("ponderhit")
+        else:
+            await self.set_moves(moves, start_fen)
+            search = await self._start_search(movetime, depth, fen)
+        generation = self._generation
+        await self._wait(search["future"], timeout)
+        result = search_result(search)
+        if (self.ponder and generation == self._generation
+                and result["bestmove"] not in (None, "(none)")):
+            guess = moves + [result["bestmove"]]
+            await self._send_command(position_command(guess, start_fen))
+            self._pondering = await self._start_search(movetime, depth, ponder=True)
+            self._pondering["game"] = (start_fen, guess)
+        return result
+
+    # Générateur asynchrone des Info d'une recherche, de profondeur en profondeur
+    # (pour une barre d'éval qui s'affine) ; s'arrête au "bestmove"
+    async def analyse_stream(self, fen, movetime=None, depth=None, timeout=None):
+        await self.set_position(fen)
+        search = await self._start_search(movetime, depth, fen)
+        async for info in self._stream(search, timeout):
+            yield info
+
+    # Même chose pour une partie (voir analyse_game). Sans limite, c'est un
+    # "go infinite" : la recherche s'approfondit jusqu'au prochain stop() ou au
+    # prochain changement de position, qui termine le générateur.
+    async def analyse_game_stream(self, moves, start_fen=None, fen=None, movetime=None,
+                                  depth=None, timeout=None):
+        await self.set_moves(list(moves), start_fen)
+        search = await self._start_search(movetime, depth, fen)
+        async for info in self._stream(search, timeout):
+            yield info
+
+    async def _stream(self, search, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        while True:
+            try:
+                info = await asyncio.wait_for(search["updates"].get(), timeout)
+            except asyncio.TimeoutError:
+                if time.monotonic() - self._last_output >= timeout:
+                    self._kill()
+                    raise TimeoutError(f"Stockfish ne répond plus depuis {timeout}s") from None
+                continue
+            if info is None:
+                if search["future"].done() and search["future"].exception():
+                    raise search["future"].exception()
+                return
+            yield info
+
+    async def quit(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        spare = await self._take_spare()
+        if spare is not None:
+            await spare.quit(timeout)
+        if self.process is None:
+            return
+        if self.process.returncode is None:
+            try:
+                await self._send_command("quit")
+                await asyncio.wait_for(self.process.wait(), timeout)
+            except (asyncio.TimeoutError, ConnectionError):
+                self.process.kill()
+                await self.process.wait()
+        if self._reader is not None:
+            await self._reader
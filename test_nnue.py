@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+import nnue
+from position import Position
+
+KIWIPETE = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+# roques des deux côtés, prises (dont une par le roi), coups de roi et promotion
+MOVES = ["e1g1", "e8c8", "f3f6", "e7f6", "g1h1", "c8b8", "d5e6", "h3g2", "h1g2", "f6f2",
+         "g2f2", "b4c3", "e6d7", "c3b2", "e5f7", "b2a1q", "f1a1"]
+
+
+# Petit réseau aléatoire (L1 = 16), assez pour comparer des accumulateurs
+def small_network(seed, l1=16):
+    rng = np.random.default_rng(seed)
+    net = nnue.Network.__new__(nnue.Network)
+    net.l1 = l1
+    net.biases = rng.integers(-64, 64, l1).astype(np.int16)
+    net.weights = rng.integers(-64, 64, (nnue.DIMENSIONS, l1)).astype(np.int16)
+    net.psqt_weights = rng.integers(-2000, 2000, (nnue.DIMENSIONS, nnue.PSQT_BUCKETS)).astype(np.int32)
+    net.layers = [[(rng.integers(-1000, 1000, outputs).astype(np.int64),
+                    rng.integers(-127, 128, (outputs, inputs)).astype(np.int64))
+                   for outputs, inputs in ((nnue.L2 + 1, l1), (nnue.L3, 32), (1, 32))]
+                  for _ in range(nnue.LAYER_STACKS)]
+    return net
+
+
+def synthetic_nnue():
+    evaluator = nnue.NNUE.__new__(nnue.NNUE)
+    evaluator.big, evaluator.small = small_network(1), small_network(2)
+    return evaluator
+
+
+def assert_fresh(stack):
+    for net, accumulators in zip(stack.networks, stack._stack):
+        acc, psqt = net.refresh(np.array(stack.position.board))
+        assert np.array_equal(accumulators[-1][0], acc)
+        assert np.array_equal(accumulators[-1][1], psqt)
+
+
+# Accumulateurs mis à jour coup par coup = accumulateurs recalculés, en jouant
+# comme en revenant en arrière
+def test_incremental_accumulator_matches_refresh():
+    evaluator = synthetic_nnue()
+    position = Position(KIWIPETE)
+    stack = nnue.AccumulatorStack(evaluator, position)
+    for uci in MOVES:
+        move = position.parse_uci(uci)
+        assert move, uci
+        stack.make_move(move)
+        assert_fresh(stack)
+        if not position.checkers:
+            board = np.array([position.board])
+            expected, _ = evaluator.evaluate_boards(board, np.array([position.side_to_move]),
+                                                    [position.rule50])
+            assert stack.evaluate() == expected[0]
+    for _ in MOVES:
+        stack.unmake_move()
+        assert_fresh(stack)
+    assert position.fen() == KIWIPETE
+
+
+# Encodage LEB128 signé, comme write_leb_128 de nnue_common.h
+def leb128_block(values):
+    out = bytearray()
+    for value in values:
+        while True:
+            byte = value & 0x7F
+            value >>= 7
+            if (value == 0 and not byte & 0x40) or (value == -1 and byte & 0x40):
+                out.append(byte)
+                break
+            out.append(byte | 0x80)
+    return nnue.LEB128_MAGIC + len(out).to_bytes(4, "little") + bytes(out)
+
+
+@pytest.mark.parametrize("dtype, values", [
+    (np.int16, [0, 1, -1, 63, 64, -64, -65, 127, 128, -129, 8191, -8192, 32767, -32768]),
+    (np.int32, [0, -1, 1 << 20, -(1 << 20), 2 ** 31 - 1, -2 ** 31]),
+])
+def test_read_leb128(dtype, values):
+    data = b"xx" + leb128_block(values) + b"yy"
+    # petits morceaux (au moins une valeur complète) : des valeurs sont coupées
+    # entre deux morceaux
+    for chunk in (1 << 22, 7, 5):
+        decoded, end = nnue._read_leb128(data, 2, len(values), dtype, chunk=chunk)
+        assert decoded.dtype == dtype and decoded.tolist() == values
+        assert data[end:] == b"yy"
+    with pytest.raises(ValueError):
+        nnue._read_leb128(data, 2, len(values) + 1, dtype)
+    with pytest.raises(ValueError):
+        nnue._read_leb128(data, 2, len(values) - 1, dtype)
+
+
+# Dernière valeur sans son octet final : erreur de lecture, pas IndexError
+def test_read_leb128_truncated():
+    block = leb128_block([1, 300])
+    truncated = nnue.LEB128_MAGIC + (2).to_bytes(4, "little") + block[-3:-1]
+    with pytest.raises(ValueError):
+        nnue._read_leb128(truncated, 0, 2, np.int16)
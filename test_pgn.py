@@ -0,0 +1,37 @@
+import pgn
+
+GAME = """[Event "Partie {n}"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 Nc6 1-0
+
+"""
+
+
+# Morceaux qui commencent pile sur le [Event d'une partie : aucune ne doit manquer
+def test_chunks_on_game_starts(tmp_path):
+    games = [GAME.format(n=n) for n in range(3)]
+    assert len({len(game) for game in games}) == 1
+    path = tmp_path / "games.pgn"
+    path.write_text("".join(games))
+    for chunk_size in (len(games[0]), len(games[0]) - 1, len(games[0]) + 1, 7):
+        count, stats = pgn.ingest(str(path), processes=1, chunk_size=chunk_size)
+        assert count == 3, chunk_size
+        assert sum(counts[0] for counts in stats.values()) == 3 * 4
+
+
+# Un jeton illisible arrête la partie au dernier coup légal, sans exception
+def test_malformed_san_stops_game(tmp_path):
+    from gamestore import GameStore, GameWriter, add_pgn
+    path = tmp_path / "bad.pgn"
+    text = "".join(GAME.format(n=n) for n in range(2))
+    for token in ("--", "Z0", "Qxx", "e8=", "O-O-O-O"):
+        text += f'[Event "Mauvais {token}"]\n[Result "0-1"]\n\n1. e4 e5 2. {token} Nc6 0-1\n\n'
+    path.write_text(text)
+    count, stats = pgn.ingest(str(path), processes=1)
+    assert count == 7
+    assert sum(counts[0] for counts in stats.values()) == 2 * 4 + 5 * 2
+    with GameWriter(str(tmp_path / "games")) as writer:
+        assert add_pgn(writer, str(path)) == 7
+    with GameStore(str(tmp_path / "games")) as store:
+        assert [len(moves) for _, _, moves in store] == [4, 4, 2, 2, 2, 2, 2]
@@ -0,0 +1,24 @@
+import pytest
+
+import perft
+from position import Position, START_FEN
+
+# au plus ~100 000 feuilles par position : quelques secondes pour toute la liste
+SHALLOW = [(name, fen, depth, count)
+           for name, fen, counts in perft.POSITIONS
+           for depth, count in enumerate(counts, 1) if count <= 100000]
+
+
+@pytest.mark.parametrize("name, fen, depth, count", SHALLOW,
+                         ids=[f"{name}-{depth}" for name, _, depth, _ in SHALLOW])
+def test_perft(name, fen, depth, count):
+    position = Position(fen)
+    assert perft.perft(position, depth) == count
+    # make_move / unmake_move ont tout remis en place
+    assert position.fen() == fen
+    assert position.key() == Position(fen).key()
+
+
+# Clé de la position initiale avec les nombres aléatoires de Stockfish (PRNG 1070372)
+def test_zobrist_start_key():
+    assert Position(START_FEN).key() == 0x8F8F01D4562F59FB
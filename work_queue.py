@@ -0,0 +1,454 @@
+import argparse
+import concurrent.futures
+import json
+import os
+import socket
+import socketserver
+import sqlite3
+import sys
+import threading
+import time
+
+import stockfish_class as s
+from eval_cache import EvalCache, position_key
+from pgn import read_games, san_moves
+from position import Position, START_FEN, MOVE_NONE
+from repertoire import Repertoire
+
+# Analyse répartie sur plusieurs machines : un coordinateur garde la file des
+# positions à analyser, des workers (un par machine, chacun avec son StockfishPool)
+# s'y connectent en TCP, empruntent des positions et renvoient les résultats, que le
+# coordinateur range dans le cache d'évaluations.
+#
+# Protocole : une requête JSON par ligne, une réponse JSON par ligne.
+#   {"op": "lease", "worker": nom, "count": n}     -> {"jobs": [...], "lease": s, "remaining": n}
+#   {"op": "renew", "worker": nom, "ids": [...]}   -> {"ids": [...] encore tenus}
+#   {"op": "result", "worker": nom, "id": i, "result": {...}} -> {"accepted": bool}
+#   {"op": "fail", "worker": nom, "id": i, "error": texte}    -> {}
+#   {"op": "status"}                               -> {"pending": n, "leased": n, ...}
+# Pas d'authentification : le coordinateur n'écoute que sur un réseau de confiance.
+DEFAULT_PORT = 5151
+PENDING, LEASED, DONE, FAILED = "pending", "leased", "done", "failed"
+
+
+class QueueError(Exception):
+    pass
+
+
+# File persistante (SQLite) de tâches (position, limite). Une tâche empruntée l'est
+# pour `lease_seconds` : un worker qui disparaît la rend d'elle-même à l'expiration
+# du bail, et elle repart ailleurs, au plus `max_attempts` fois en tout. Un seul
+# coordinateur distribue les baux, une tâche n'est donc jamais analysée deux fois
+# en même temps.
+class JobQueue:
+    def __init__(self, path="work_queue.sqlite", lease_seconds=120, max_attempts=3):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        # depth / movetime à 0 quand la limite n'est pas donnée (NULL casserait UNIQUE)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY, key TEXT, fen TEXT, depth INTEGER, movetime INTEGER, "
+            "state TEXT, attempts INTEGER DEFAULT 0, worker TEXT, lease_until REAL, error TEXT, "
+            "UNIQUE (key, depth, movetime))"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id)")
+
+    # Ajoute des positions ; une position déjà en file avec la même limite est ignorée.
+    # Renvoie le nombre de tâches nouvelles.
+    def add(self, fens, depth=None, movetime=None):
+        with self._lock:
+            before = self.db.total_changes
+            self.db.executemany(
+                "INSERT OR IGNORE INTO jobs (key, fen, depth, movetime, state) VALUES (?, ?, ?, ?, ?)",
+                ((position_key(fen), fen, depth or 0, movetime or 0, PENDING) for fen in fens),
+            )
+            self.db.commit()
+            return self.db.total_changes - before
+
+    # Les baux expirés reviennent dans la file, ou échouent pour de bon après
+    # `max_attempts` essais
+    def _expire(self, now):
+        self.db.execute(
+            "UPDATE jobs SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+            "worker = NULL, error = 'bail expiré' WHERE state = ? AND lease_until < ?",
+            (self.max_attempts, FAILED, PENDING, LEASED, now),
+        )
+
+    def lease(self, worker, count):
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            rows = self.db.execute(
+                "SELECT id, fen, depth, movetime FROM jobs WHERE state = ? ORDER BY id LIMIT ?",
+                (PENDING, count),
+            ).fetchall()
+            self.db.executemany(
+                "UPDATE jobs SET state = ?, worker = ?, lease_until = ?, attempts = attempts + 1 "
+                "WHERE id = ?",
+                ((LEASED, worker, now + self.lease_seconds, row[0]) for row in rows),
+            )
+            self.db.commit()
+        return [{"id": r[0], "fen": r[1], "depth": r[2] or None, "movetime": r[3] or None}
+                for r in rows]
+
+    # Prolonge les baux d'un worker toujours en vie ; renvoie ceux qu'il tient encore
+    def renew(self, worker, ids):
+        with self._lock:
+            held = []
+            for job_id in ids:
+                cursor = self.db.execute(
+                    "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND state = ?",
+                    (time.time() + self.lease_seconds, job_id, worker, LEASED),
+                )
+                if cursor.rowcount:
+                    held.append(job_id)
+            self.db.commit()
+        return held
+
+    # Termine une tâche. Un résultat arrivé après l'expiration du bail reste bon à
+    # prendre tant que personne d'autre n'a fini ; seul le premier est gardé.
+    # Renvoie (fen, movetime) si le résultat est accepté, None sinon.
+    def complete(self, worker, job_id):
+        with self._lock:
+            row = self.db.execute(
+                "SELECT fen, movetime FROM jobs WHERE id = ? AND state IN (?, ?)",
+                (job_id, PENDING, LEASED),
+            ).fetchone()
+            if row is None:
+                return None
+            self.db.execute(
+                "UPDATE jobs SET state = ?, worker = ?, error = NULL WHERE id = ?",
+                (DONE, worker, job_id),
+            )
+            self.db.commit()
+        return row[0], row[1] or None
+
+    def fail(self, worker, job_id, error):
+        with self._lock:
+            self.db.execute(
+                "UPDATE jobs SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "worker = NULL, error = ? WHERE id = ? AND worker = ? AND state = ?",
+                (self.max_attempts, FAILED, PENDING, error, job_id, worker, LEASED),
+            )
+            self.db.commit()
+
+    # Les tâches abandonnées repartent pour `max_attempts` nouveaux essais
+    def retry_failed(self):
+        with self._lock:
+            cursor = self.db.execute(
+                "UPDATE jobs SET state = ?, attempts = 0 WHERE state = ?", (PENDING, FAILED))
+            self.db.commit()
+            return cursor.rowcount
+
+    def counts(self):
+        with self._lock:
+            self._expire(time.time())
+            rows = self.db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        counts = {state: 0 for state in (PENDING, LEASED, DONE, FAILED)}
+        counts.update(rows)
+        return counts
+
+    # Tâches qui restent à faire (en file ou en cours)
+    def remaining(self):
+        counts = self.counts()
+        return counts[PENDING] + counts[LEASED]
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.dispatch(json.loads(line))
+            except Exception as e:
+                response = {"error": f"{type(e).__name__}: {e}"}
+            self.wfile.write((json.dumps(response) + "\n").encode())
+            self.wfile.flush()
+
+
+# Serveur TCP du coordinateur, un thread par worker connecté
+class Coordinator(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, jobs, cache=None, host="127.0.0.1", port=DEFAULT_PORT, metrics=None):
+        self.jobs = jobs
+        self.cache = cache
+        self.metrics = metrics
+        self.completed = 0
+        super().__init__((host, port), _Handler)
+
+    def dispatch(self, request):
+        op = request["op"]
+        if op == "lease":
+            jobs = self.jobs.lease(request["worker"], request["count"])
+            if self.metrics is not None:
+                self.metrics.count("jobs_leased", len(jobs))
+            return {"jobs": jobs, "lease": self.jobs.lease_seconds, "remaining": self.jobs.remaining()}
+        if op == "renew":
+            return {"ids": self.jobs.renew(request["worker"], request["ids"])}
+        if op == "result":
+            done = self.jobs.complete(request["worker"], request["id"])
+            if done is not None:
+                fen, movetime = done
+                if self.cache is not None:
+                    self.cache.put(fen, request["result"], movetime)
+                self.completed += 1
+                if self.metrics is not None:
+                    self.metrics.count("jobs_completed")
+            return {"accepted": done is not None}
+        if op == "fail":
+            self.jobs.fail(request["worker"], request["id"], request.get("error"))
+            if self.metrics is not None:
+                self.metrics.count("jobs_failed")
+            return {}
+        if op == "status":
+            return self.jobs.counts()
+        raise QueueError(f"opération inconnue : {op}")
+
+
+# Worker : emprunte assez de positions pour occuper tous les moteurs du pool (plus
+# une réserve de `batch` - taille du pool), renvoie chaque résultat dès qu'il arrive
+# et prolonge ses baux tant que les analyses tournent. Si le coordinateur ne répond
+# plus, il réessaie pendant `retry_seconds` avant d'abandonner.
+class Worker:
+    def __init__(self, pool, host="127.0.0.1", port=DEFAULT_PORT, name=None, batch=None,
+                 poll=1.0, retry_seconds=60):
+        self.pool = pool
+        self.address = (host, port)
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.batch = batch or 2 * pool.size
+        self.poll = poll
+        self.retry_seconds = retry_seconds
+        self.analysed = 0
+        self._lock = threading.Lock()
+        self._socket = self._file = None
+        self._held = {}  # id -> (tâche, future)
+        self._lease = 60
+        self._stopping = threading.Event()
+
+    def _connect(self):
+        self._socket = socket.create_connection(self.address)
+        self._file = self._socket.makefile("rw", encoding="utf-8", newline="\n")
+
+    def _disconnect(self):
+        for item in (self._file, self._socket):
+            if item is not None:
+                try:
+                    item.close()
+                except OSError:
+                    pass
+        self._socket = self._file = None
+
+    def _call(self, request):
+        request = dict(request, worker=self.name)
+        deadline = time.monotonic() + self.retry_seconds
+        with self._lock:
+            while True:
+                try:
+                    if self._file is None:
+                        self._connect()
+                    self._file.write(json.dumps(request) + "\n")
+                    self._file.flush()
+                    line = self._file.readline()
+                    if not line:
+                        raise ConnectionError("connexion fermée par le coordinateur")
+                    break
+                except OSError as e:
+                    self._disconnect()
+                    if time.monotonic() >= deadline:
+                        raise ConnectionError(f"coordinateur injoignable : {e}") from None
+                    time.sleep(min(self.poll, 1.0))
+        response = json.loads(line)
+        if "error" in response:
+            raise QueueError(response["error"])
+        return response
+
+    def _heartbeat(self):
+        while not self._stopping.wait(self._lease / 3):
+            ids = list(self._held)
+            if ids:
+                try:
+                    self._call({"op": "renew", "ids": ids})
+                except (ConnectionError, QueueError):
+                    pass
+
+    def _finish(self, job_id, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            self._call({"op": "fail", "id": job_id, "error": f"{type(e).__name__}: {e}"})
+            return
+        # les lignes multipv (Info) partent en listes, dans l'ordre de INFO_FIELDS
+        self._call({"op": "result", "id": job_id, "result": result})
+        self.analysed += 1
+
+    # Traite la file jusqu'à ce qu'elle soit vide (`until_empty`) ou indéfiniment
+    def run(self, until_empty=False):
+        heartbeat = threading.Thread(target=self._heartbeat, daemon=True)
+        heartbeat.start()
+        try:
+            while True:
+                remaining = None
+                if len(self._held) < self.batch:
+                    response = self._call({"op": "lease", "count": self.batch - len(self._held)})
+                    self._lease = response["lease"]
+                    remaining = response["remaining"]
+                    for job in response["jobs"]:
+                        future = self.pool.submit(job["fen"], movetime=job["movetime"], depth=job["depth"])
+                        self._held[job["id"]] = (job, future)
+                if not self._held:
+                    if until_empty and remaining == 0:
+                        return self.analysed
+                    time.sleep(self.poll)
+                    continue
+                futures = {future: job_id for job_id, (_, future) in self._held.items()}
+                done, _ = concurrent.futures.wait(
+                    futures, timeout=self.poll, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    job_id = futures[future]
+                    self._finish(job_id, future)
+                    del self._held[job_id]
+        finally:
+            self._stopping.set()
+            self._disconnect()
+
+
+# Positions des `plies` premiers demi-coups des parties d'un fichier PGN
+def pgn_fens(path, plies):
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for headers, movetext in read_games(f):
+            position = Position(headers.get("FEN", START_FEN))
+            yield position.fen()
+            for ply, san in enumerate(san_moves(movetext)):
+                if ply >= plies:
+                    break
+                move = position.parse_san(san)
+                if move == MOVE_NONE:
+                    break
+                position.make_move(move)
+                yield position.fen()
+
+
+# Positions d'un répertoire pas encore analysées à la profondeur demandée
+def repertoire_fens(path, depth=None):
+    repertoire = Repertoire(path)
+    try:
+        rows = repertoire.db.execute("SELECT fen, depth FROM nodes").fetchall()
+    finally:
+        repertoire.close()
+    return [fen for fen, known in rows if known is None or (depth is not None and known < depth)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse répartie : coordinateur et workers TCP")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="ajoute des positions à la file")
+    add.add_argument("queue", help="file de tâches (SQLite)")
+    add.add_argument("--pgn", nargs="+", default=[], help="fichiers PGN")
+    add.add_argument("--plies", type=int, default=30, help="demi-coups pris par partie")
+    add.add_argument("--fens", help="fichier de FEN, une par ligne")
+    add.add_argument("--repertoire", help="répertoire (SQLite) dont analyser les positions")
+    add.add_argument("--depth", type=int, default=20)
+    add.add_argument("--movetime", type=int, help="temps par position (ms) au lieu de la profondeur")
+
+    serve = commands.add_parser("coordinator", help="distribue la file aux workers")
+    serve.add_argument("queue", help="file de tâches (SQLite)")
+    serve.add_argument("--cache", default="eval_cache.sqlite", help="cache où ranger les résultats")
+    serve.add_argument("--host", default="127.0.0.1", help="0.0.0.0 pour accepter d'autres machines")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve.add_argument("--lease", type=int, default=120, help="durée d'un bail (s)")
+    serve.add_argument("--max-attempts", type=int, default=3)
+    serve.add_argument("--retry-failed", action="store_true", help="relance les tâches abandonnées")
+    serve.add_argument("--until-empty", action="store_true", help="s'arrête quand la file est vide")
+
+    work = commands.add_parser("worker", help="analyse les positions du coordinateur")
+    work.add_argument("stockfish", help="chemin du moteur")
+    work.add_argument("--host", default="127.0.0.1")
+    work.add_argument("--port", type=int, default=DEFAULT_PORT)
+    work.add_argument("--engines", type=int, help="nombre de moteurs (par défaut un par coeur)")
+    work.add_argument("--hash", type=int,
+                      help="Hash de chaque moteur (Mo), 16 par défaut ou celui du profil batch")
+    work.add_argument("--name", help="nom du worker (machine:pid par défaut)")
+    work.add_argument("--until-empty", action="store_true", help="s'arrête quand la file est vide")
+
+    status = commands.add_parser("status", help="état de la file")
+    status.add_argument("queue", help="file de tâches (SQLite)")
+    args = parser.parse_args(argv)
+
+    if args.command == "add":
+        jobs = JobQueue(args.queue)
+        depth = None if args.movetime else args.depth
+        added = 0
+        for path in args.pgn:
+            added += jobs.add(pgn_fens(path, args.plies), depth, args.movetime)
+        if args.fens:
+            with open(args.fens) as f:
+                added += jobs.add((line.strip() for line in f if line.strip()), depth, args.movetime)
+        if args.repertoire:
+            added += jobs.add(repertoire_fens(args.repertoire, depth), depth, args.movetime)
+        print(f"{added} tâches ajoutées, {jobs.remaining()} à faire")
+        jobs.close()
+
+    elif args.command == "status":
+        jobs = JobQueue(args.queue)
+        print(" ".join(f"{state} {n}" for state, n in jobs.counts().items()))
+        jobs.close()
+
+    elif args.command == "coordinator":
+        jobs = JobQueue(args.queue, args.lease, args.max_attempts)
+        if args.retry_failed:
+            jobs.retry_failed()
+        cache = EvalCache(args.cache)
+        server = Coordinator(jobs, cache, args.host, args.port)
+        print(f"coordinateur sur {args.host}:{args.port}, {jobs.remaining()} tâches à faire",
+              file=sys.stderr)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        start = time.perf_counter()
+        try:
+            while True:
+                time.sleep(5)
+                counts = jobs.counts()
+                elapsed = time.perf_counter() - start
+                print(" ".join(f"{state} {n}" for state, n in counts.items())
+                      + f", {server.completed / elapsed:.1f} positions/s", file=sys.stderr)
+                cache.flush()
+                if args.until_empty and counts[PENDING] + counts[LEASED] == 0:
+                    break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.shutdown()
+            server.server_close()
+            cache.close()
+            jobs.close()
+
+    elif args.command == "worker":
+        profile = "batch" if os.path.exists(s.PROFILES_PATH) else None
+        pool = s.StockfishPool(args.stockfish, size=args.engines, hash=args.hash, profile=profile)
+        worker = Worker(pool, args.host, args.port, args.name)
+        start = time.perf_counter()
+        try:
+            worker.run(args.until_empty)
+        except KeyboardInterrupt:
+            pass
+        except ConnectionError as e:
+            print(f"{worker.name} : {e}", file=sys.stderr)
+            return 1
+        finally:
+            pool.close()
+            print(f"{worker.name} : {worker.analysed} positions en {time.perf_counter() - start:.1f}s",
+                  file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())